@@ -87,8 +87,7 @@ def page_documentos_empresa(
             doc_tipo = tipo if tipo != "OTRO" else (tipo_otro.strip() or "OTRO")
             payload = prepare_upload_payload(up.name, up.getvalue(), getattr(up, 'type', None) or 'application/octet-stream')
             folder = ["empresa", safe_name(doc_tipo)]
-            file_path, bucket, object_path = save_file_online(folder, payload["file_name"], payload["file_bytes"], content_type=payload["content_type"])
-            sha = sha256_bytes(payload["file_bytes"])
+            file_path, bucket, object_path, sha = save_file_online(folder, payload["file_name"], payload["file_bytes"], content_type=payload["content_type"])
             execute(
                 "INSERT INTO empresa_documentos(mandante_id, doc_tipo, nombre_archivo, file_path, bucket, object_path, sha256, created_at) VALUES(?,?,?,?,?,?,?,?)",
                 (int(mandante_doc_id or 0) or None, doc_tipo, payload["file_name"], file_path, bucket, object_path, sha, datetime.utcnow().isoformat(timespec="seconds")),
@@ -332,8 +331,7 @@ def page_documentos_empresa_faena(
                 "empresa_mensual",
                 safe_name(doc_tipo),
             ]
-            file_path, bucket, object_path = save_file_online(folder, payload["file_name"], payload["file_bytes"], content_type=payload["content_type"])
-            sha = sha256_bytes(payload["file_bytes"])
+            file_path, bucket, object_path, sha = save_file_online(folder, payload["file_name"], payload["file_bytes"], content_type=payload["content_type"])
 
             execute(
                 "INSERT INTO faena_empresa_documentos(faena_id, mandante_id, periodo_anio, periodo_mes, doc_tipo, nombre_archivo, file_path, bucket, object_path, sha256, created_at) VALUES(?,?,?,?,?,?,?,?,?,?,?)",
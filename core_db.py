@@ -2,6 +2,7 @@ import os
 import re
 import sqlite3
 import hashlib
+import threading
 import pandas as pd
 from segav_core.rut_utils import clean_rut as _segav_clean_rut
 
@@ -120,6 +121,78 @@ def get_pg_pool(dsn: str):
     except Exception:
         return None
 
+def _sqlite_file_id(db_path: str):
+    """(st_dev, st_ino) del archivo SQLite, o None si todavía no existe."""
+    try:
+        info = os.stat(db_path)
+    except OSError:
+        return None
+    return (info.st_dev, info.st_ino)
+
+
+# Archivo sobre el que se abrió cada conexión compartida (por ruta).
+_SQLITE_FILE_IDS = {}
+
+@st.cache_resource(show_spinner=False)
+def get_sqlite_connection(db_path: str):
+    # Misma configuración que la conexión de streamlit_app: compartida entre
+    # reruns, con cache de sentencias amplio y lecturas vía mmap (256 MB).
+    c = sqlite3.connect(db_path, check_same_thread=False, cached_statements=512)
+    try:
+        c.execute("PRAGMA foreign_keys = ON;")
+        c.execute("PRAGMA journal_mode = WAL;")
+        c.execute("PRAGMA synchronous = NORMAL;")
+        c.execute("PRAGMA temp_store = MEMORY;")
+        c.execute("PRAGMA cache_size = -64000;")
+        c.execute("PRAGMA mmap_size = 268435456;")
+        c.execute("PRAGMA busy_timeout = 5000;")
+    except Exception:
+        pass
+    _SQLITE_FILE_IDS[db_path] = _sqlite_file_id(db_path)
+    return c
+
+
+# La conexión SQLite es una sola para todas las sesiones (y los hilos de
+# api_rest): lecturas, escrituras y bloques ``with conn()`` se serializan para
+# que el commit de uno no confirme ni descarte sentencias a medias de otro.
+_SQLITE_LOCK = threading.RLock()
+
+
+def _shared_sqlite_connection():
+    """Conexión compartida; se reabre si app.db fue reemplazado (restore por renombre)."""
+    c = get_sqlite_connection(DB_PATH)
+    current = _sqlite_file_id(DB_PATH)
+    if current is not None and current != _SQLITE_FILE_IDS.get(DB_PATH):
+        try:
+            c.close()
+        except Exception:
+            pass
+        get_sqlite_connection.clear()
+        c = get_sqlite_connection(DB_PATH)
+    return c
+
+
+class _SqliteConnectionScope:
+    """``with conn() as c`` sobre la conexión SQLite compartida, con el lock tomado."""
+
+    def __init__(self):
+        self._conn = None
+
+    def __enter__(self):
+        _SQLITE_LOCK.acquire()
+        try:
+            self._conn = _shared_sqlite_connection()
+            return self._conn.__enter__()
+        except BaseException:
+            _SQLITE_LOCK.release()
+            raise
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            return self._conn.__exit__(exc_type, exc, tb)
+        finally:
+            _SQLITE_LOCK.release()
+
 def conn():
     if DB_BACKEND == "postgres":
         if psycopg is None:
@@ -137,12 +210,7 @@ def conn():
                 "No se pudo conectar a Postgres/Supabase. "
                 f"Detalle: {msg}. Revisa SUPABASE_DB_URL o secretos separados."
             ) from e
-    c = sqlite3.connect(DB_PATH, check_same_thread=False)
-    try:
-        c.execute("PRAGMA foreign_keys = ON;")
-    except Exception:
-        pass
-    return c
+    return _SqliteConnectionScope()
 
 def _qmark_to_pct(sql: str) -> str:
     if "?" not in sql:
@@ -278,8 +346,20 @@ def clear_app_caches():
     except Exception:
         pass
 
+def _sqlite_db_signature(db_path: str = None):
+    """Firma (mtime, tamaño) de la base SQLite y su WAL para la llave del cache."""
+    path = db_path or DB_PATH
+    sig = []
+    for candidate in (path, f"{path}-wal"):
+        try:
+            info = os.stat(candidate)
+            sig.append((info.st_mtime_ns, info.st_size))
+        except OSError:
+            sig.append(None)
+    return tuple(sig)
+
 @st.cache_data(ttl=20, show_spinner=False)
-def _cached_fetch_df(db_backend: str, dsn_fingerprint: str, q: str, params_cache):
+def _cached_fetch_df(db_backend: str, dsn_fingerprint: str, q: str, params_cache, db_sig=None):
     params = tuple(params_cache) if isinstance(params_cache, tuple) else params_cache
     if db_backend == "postgres":
         q2 = _qmark_to_pct(q).replace("datetime('now')", "now()")
@@ -291,7 +371,8 @@ def _cached_fetch_df(db_backend: str, dsn_fingerprint: str, q: str, params_cache
 def fetch_df(q: str, params=()):
     params_cache = _cacheable_params(params)
     if _is_select_query(q):
-        return _cached_fetch_df(DB_BACKEND, PG_DSN_FINGERPRINT, q, params_cache)
+        db_sig = _sqlite_db_signature() if DB_BACKEND == "sqlite" else None
+        return _cached_fetch_df(DB_BACKEND, PG_DSN_FINGERPRINT, q, params_cache, db_sig)
     if DB_BACKEND == "postgres":
         q2 = _qmark_to_pct(q).replace("datetime('now')", "now()")
         with conn() as c:
@@ -975,8 +975,7 @@ def page_documentos_trabajador(
             doc_tipo = tipo if tipo != "OTRO" else (tipo_otro.strip() or "OTRO")
             payload = prepare_upload_payload(up.name, up.getvalue(), getattr(up, 'type', None) or 'application/octet-stream')
             folder = ["trabajadores", tid, safe_name(doc_tipo)]
-            file_path, bucket, object_path = save_file_online(folder, payload["file_name"], payload["file_bytes"], content_type=payload["content_type"])
-            sha = sha256_bytes(payload["file_bytes"])
+            file_path, bucket, object_path, sha = save_file_online(folder, payload["file_name"], payload["file_bytes"], content_type=payload["content_type"])
             if payload["compressed"] and payload.get("compression_note"):
                 st.info(payload["compression_note"])
 
@@ -234,13 +234,12 @@ def page_contratos_faena(
                         archivo.getvalue(),
                         getattr(archivo, "type", None) or "application/octet-stream",
                     )
-                    file_path, bucket, object_path = save_file_online(
+                    file_path, bucket, object_path, sha = save_file_online(
                         ["contratos_faena", mandante_id],
                         payload["file_name"],
                         payload["file_bytes"],
                         content_type=payload["content_type"],
                     )
-                    sha = sha256_bytes(payload["file_bytes"])
                     if payload["compressed"] and payload.get("compression_note"):
                         st.info(payload["compression_note"])
 
@@ -332,13 +331,12 @@ def page_contratos_faena(
                     st.error("Debes subir un archivo primero.")
                     st.stop()
                 payload = prepare_upload_payload(up.name, up.getvalue(), getattr(up, "type", None) or "application/octet-stream")
-                file_path, bucket, object_path = save_file_online(
+                file_path, bucket, object_path, sha = save_file_online(
                     ["contratos_faena", "id", contrato_id],
                     payload["file_name"],
                     payload["file_bytes"],
                     content_type=payload["content_type"],
                 )
-                sha = sha256_bytes(payload["file_bytes"])
                 if payload["compressed"] and payload.get("compression_note"):
                     st.info(payload["compression_note"])
                 execute(
@@ -570,13 +568,12 @@ def page_faenas(
                 st.error("Debes subir un archivo primero.")
                 st.stop()
             payload = prepare_upload_payload(up.name, up.getvalue(), getattr(up, "type", None) or "application/octet-stream")
-            file_path, bucket, object_path = save_file_online(
+            file_path, bucket, object_path, sha = save_file_online(
                 ["faenas", faena_id, "anexos"],
                 payload["file_name"],
                 payload["file_bytes"],
                 content_type=payload["content_type"],
             )
-            sha = sha256_bytes(payload["file_bytes"])
             execute(
                 "INSERT INTO faena_anexos(faena_id, nombre, file_path, bucket, object_path, sha256, created_at) VALUES(?,?,?,?,?,?,?)",
                 (int(faena_id), payload["file_name"], file_path, bucket, object_path, sha, datetime.utcnow().isoformat(timespec="seconds")),
@@ -5,9 +5,11 @@ import json
 import os
 import shutil
 import subprocess
+import zipfile
+from contextlib import nullcontext
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Iterable
+from typing import BinaryIO, Callable, Iterable
 
 from core_db import DB_BACKEND, PG_DSN, execute, fetch_df
 
@@ -31,16 +33,18 @@ DEFAULT_TABLES = [
 ]
 
 
+SQLITE_HEADER = b"SQLite format 3\x00"
+_DB_MEMBER_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+_COPY_BUFSIZE = 1 << 20
+
+
 def _now() -> str:
     return datetime.now(UTC).isoformat(timespec="seconds")
 
 
 def _sha256_file(path: Path) -> str:
-    h = hashlib.sha256()
     with open(path, "rb") as fh:
-        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
+        return hashlib.file_digest(fh, "sha256").hexdigest()
 
 
 def _safe_table_dump(table: str):
@@ -128,3 +132,78 @@ def restore_native_postgres_backup(path_str: str | Path):
         subprocess.run(["pg_restore", "--clean", "--if-exists", "--no-owner", "--dbname", str(PG_DSN), str(path)], check=True, env=os.environ.copy())
         return {"status": "restore_completed", "mode": "pg_restore", "artifact": path.name}
     raise RuntimeError("No fue posible restaurar con pg_restore; usa respaldo JSON o instala pg_restore.")
+
+
+def iter_sqlite_backup_members(zf: zipfile.ZipFile, db_name: str = "app.db"):
+    """Miembros del ZIP que pueden ser la base, en orden de preferencia.
+
+    Es un generador: los nombres conocidos se resuelven contra el índice
+    interno del ZIP (``getinfo``) y el recorrido del resto solo ocurre si
+    ninguno existe, cortando en el primer archivo con extensión SQLite.
+    """
+    for preferred in dict.fromkeys((f"backup/{db_name}", db_name, "backup/app.db", "app.db")):
+        try:
+            zf.getinfo(preferred)
+        except KeyError:
+            continue
+        yield preferred
+    for info in zf.infolist():
+        if not info.is_dir() and info.filename.lower().endswith(_DB_MEMBER_SUFFIXES):
+            yield info.filename
+
+
+def pick_sqlite_backup_member(zf: zipfile.ZipFile, db_name: str = "app.db") -> str | None:
+    """Elige el .db a restaurar desde el índice del ZIP (sin tocar disco)."""
+    return next(iter_sqlite_backup_members(zf, db_name), None)
+
+
+def restore_sqlite_from_zip(zf: zipfile.ZipFile, db_path: str, *, lock=None, before_swap: Callable[[], None] | None = None) -> str:
+    """Reemplaza ``db_path`` por el .db del ZIP y devuelve el miembro usado."""
+    member = pick_sqlite_backup_member(zf, os.path.basename(db_path))
+    if member is None:
+        raise ValueError("El ZIP no contiene ningún archivo .db")
+    with zf.open(member) as zsrc:
+        restore_sqlite_from_file(zsrc, db_path, lock=lock, before_swap=before_swap, label=member)
+    return member
+
+
+def restore_sqlite_from_file(src: BinaryIO, db_path: str, *, lock=None, before_swap: Callable[[], None] | None = None, label: str = "El archivo") -> None:
+    """Reemplaza ``db_path`` por la base SQLite que se lee desde ``src``.
+
+    El contenido se copia por bloques a ``db_path + ".restore_tmp"`` y se valida
+    su cabecera antes de tocar la base actual. El intercambio ocurre dentro de
+    ``lock`` (tras ``before_swap``, que debe soltar las conexiones abiertas):
+    la base anterior queda como ``.pre_restore_backup`` y, si el renombre final
+    falla, se devuelve a su lugar.
+    """
+    tmp_path = db_path + ".restore_tmp"
+    prev_path = db_path + ".pre_restore_backup"
+    try:
+        # Se copia primero a un temporal: si el origen está corrupto la base actual queda intacta.
+        with open(tmp_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, _COPY_BUFSIZE)
+        with open(tmp_path, "rb") as fh:
+            if fh.read(len(SQLITE_HEADER)) != SQLITE_HEADER:
+                raise ValueError(f"{label} no es una base SQLite válida.")
+        with lock if lock is not None else nullcontext():
+            if before_swap is not None:
+                before_swap()
+            had_db = os.path.exists(db_path)
+            if had_db:
+                os.replace(db_path, prev_path)
+            try:
+                for suffix in ("-wal", "-shm"):
+                    try:
+                        os.remove(db_path + suffix)
+                    except FileNotFoundError:
+                        pass
+                os.replace(tmp_path, db_path)
+            except BaseException:
+                if had_db:
+                    os.replace(prev_path, db_path)
+                raise
+    finally:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
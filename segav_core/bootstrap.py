@@ -221,6 +221,8 @@ def ensure_core_tables_postgres():
         "CREATE INDEX IF NOT EXISTS idx_faena_empresa_documentos_faena_id ON faena_empresa_documentos(faena_id);",
         "CREATE INDEX IF NOT EXISTS idx_export_historial_faena_id ON export_historial(faena_id);",
         "CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);",
+        "CREATE INDEX IF NOT EXISTS idx_trabajadores_rut ON trabajadores(rut);",
+        "CREATE INDEX IF NOT EXISTS idx_trabajador_documentos_trab_tipo ON trabajador_documentos(trabajador_id, doc_tipo);",
     ]
     with conn() as c:
         for s in stmts + indexes:
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+import pandas as pd
 
-def pendientes_obligatorios_logic(fetch_df, worker_required_docs, faena_id: int) -> dict:
+
+def pendientes_obligatorios_detalle_logic(fetch_df, worker_required_docs, faena_id: int) -> list:
+    """Filas ``{rut, nombre, cargo, faltantes}`` por trabajador asignado (activo) a la faena."""
     try:
         trab = fetch_df(
             """
@@ -14,37 +17,118 @@ def pendientes_obligatorios_logic(fetch_df, worker_required_docs, faena_id: int)
             (int(faena_id),),
         )
         if trab is None or trab.empty:
-            return {}
-        result = {}
-        for _, row in trab.iterrows():
-            tid = int(row["id"])
-            cargo = str(row.get("cargo") or "")
-            required = list(worker_required_docs(cargo) or [])
-            if not required:
-                result[str(row["nombre"])] = []
-                continue
+            return []
+        # Reglas por cargo: se evalúan una vez por cargo distinto, no por trabajador.
+        rules = {}
+        required_by_worker = []
+        for tid, rut, nombre, cargo in trab[["id", "rut", "nombre", "cargo"]].itertuples(index=False, name=None):
+            cargo = str(cargo or "")
+            if cargo not in rules:
+                rules[cargo] = list(worker_required_docs(cargo) or [])
+            required_by_worker.append((int(tid), str(rut or ""), str(nombre), cargo, rules[cargo]))
+        present: dict[int, set] = {}
+        if any(req for *_, req in required_by_worker):
+            # Un solo SELECT con los documentos de todos los asignados; cada
+            # trabajador queda con el set de doc_tipo que tiene y los faltantes
+            # salen por pertenencia al set en lugar de una consulta por trabajador.
             docs = fetch_df(
-                "SELECT DISTINCT doc_tipo FROM trabajador_documentos WHERE trabajador_id=?",
-                (tid,),
+                """
+                SELECT DISTINCT d.trabajador_id, d.doc_tipo
+                FROM trabajador_documentos d
+                JOIN asignaciones a ON a.trabajador_id = d.trabajador_id
+                WHERE a.faena_id=? AND COALESCE(NULLIF(TRIM(a.estado),''),'ACTIVA')='ACTIVA'
+                """,
+                (int(faena_id),),
             )
-            present = set(docs["doc_tipo"].astype(str).tolist()) if docs is not None and not docs.empty else set()
-            missing = [d for d in required if d not in present]
-            result[str(row["nombre"])] = missing
-        return result
+            if docs is not None and not docs.empty:
+                for tid, doc_tipo in zip(docs["trabajador_id"].astype(int).tolist(), docs["doc_tipo"].astype(str).tolist()):
+                    present.setdefault(tid, set()).add(doc_tipo)
+        rows = []
+        for tid, rut, nombre, cargo, required in required_by_worker:
+            have = present.get(tid, ())
+            rows.append({"rut": rut, "nombre": nombre, "cargo": cargo, "faltantes": [d for d in required if d not in have]})
+        return rows
+    except Exception:
+        return []
+
+
+def pendientes_obligatorios_logic(fetch_df, worker_required_docs, faena_id: int) -> dict:
+    rows = pendientes_obligatorios_detalle_logic(fetch_df, worker_required_docs, faena_id)
+    return {r["nombre"]: r["faltantes"] for r in rows}
+
+
+def faltantes_por_faena_logic(fetch_df, worker_required_docs) -> dict:
+    """Total de documentos obligatorios faltantes por faena, para todas las faenas.
+
+    Equivale a sumar ``pendientes_obligatorios_logic`` faena por faena, pero con
+    dos consultas en total y el cruce cargo -> doc requerido hecho con merges.
+    """
+    try:
+        asig = fetch_df(
+            """
+            SELECT DISTINCT a.faena_id, t.id AS trabajador_id, t.cargo
+            FROM asignaciones a
+            JOIN trabajadores t ON t.id = a.trabajador_id
+            WHERE COALESCE(NULLIF(TRIM(a.estado),''),'ACTIVA')='ACTIVA'
+            """
+        )
+        if asig is None or asig.empty:
+            return {}
+        asig = asig.assign(
+            faena_id=asig["faena_id"].astype(int),
+            trabajador_id=asig["trabajador_id"].astype(int),
+            cargo=asig["cargo"].fillna("").astype(str),
+        )
+        required = pd.DataFrame(
+            [
+                (cargo, doc_tipo)
+                for cargo in asig["cargo"].unique()
+                for doc_tipo in dict.fromkeys(worker_required_docs(cargo) or [])
+            ],
+            columns=["cargo", "doc_tipo"],
+        )
+        if required.empty:
+            return {}
+        need = asig.merge(required, on="cargo")
+        docs = fetch_df(
+            """
+            SELECT DISTINCT d.trabajador_id, d.doc_tipo
+            FROM trabajador_documentos d
+            JOIN asignaciones a ON a.trabajador_id = d.trabajador_id
+            WHERE COALESCE(NULLIF(TRIM(a.estado),''),'ACTIVA')='ACTIVA'
+            """
+        )
+        if docs is not None and not docs.empty:
+            docs = docs.assign(
+                trabajador_id=docs["trabajador_id"].astype(int),
+                doc_tipo=docs["doc_tipo"].astype(str),
+                _ok=True,
+            ).drop_duplicates(["trabajador_id", "doc_tipo"])
+            need = need.merge(docs[["trabajador_id", "doc_tipo", "_ok"]], on=["trabajador_id", "doc_tipo"], how="left")
+            need = need[need["_ok"].isna()]
+        return {int(fid): int(n) for fid, n in need.groupby("faena_id").size().items()}
     except Exception:
         return {}
 
 
-def pendientes_empresa_faena_logic(fetch_df, get_empresa_monthly_doc_types, faena_id: int) -> list:
+def pendientes_empresa_faena_logic(fetch_df, get_empresa_monthly_doc_types, faena_id: int, present_doc_types=None) -> list:
+    """Docs empresa/faena requeridos que faltan.
+
+    ``present_doc_types(faena_id)`` (opcional) entrega el set de doc_tipo ya
+    cargados, p. ej. desde un cache; si no se pasa se consulta con ``fetch_df``.
+    """
     try:
         required = list(get_empresa_monthly_doc_types() or [])
         if not required:
             return []
-        docs = fetch_df(
-            "SELECT DISTINCT doc_tipo FROM faena_empresa_documentos WHERE faena_id=?",
-            (int(faena_id),),
-        )
-        present = set(docs["doc_tipo"].astype(str).tolist()) if docs is not None and not docs.empty else set()
+        if present_doc_types is not None:
+            present = present_doc_types(int(faena_id))
+        else:
+            docs = fetch_df(
+                "SELECT DISTINCT doc_tipo FROM faena_empresa_documentos WHERE faena_id=?",
+                (int(faena_id),),
+            )
+            present = set(docs["doc_tipo"].astype(str)) if docs is not None and not docs.empty else set()
         return [d for d in required if d not in present]
     except Exception:
         return []
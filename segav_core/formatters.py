@@ -1,12 +1,19 @@
 import re
 import unicodedata
+from datetime import datetime
+from functools import lru_cache
+import pandas as pd
 from .catalogs import MESES_ES
 
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+_ACCENT_TT = str.maketrans("áéíóúñ", "aeioun")
+_RUT_STRIP_RE = re.compile(r"[^0-9K]")
+_WS_RE = re.compile(r"\s+")
 
+
+@lru_cache(maxsize=1024)
 def safe_name(s: str) -> str:
-    s = (s or "").strip().lower()
-    s = re.sub(r"[^a-z0-9]+", "_", s)
-    return s.strip("_") or "item"
+    return _NON_ALNUM_RE.sub("_", (s or "").strip().lower()).strip("_") or "item"
 
 
 def human_file_size(num_bytes: int) -> str:
@@ -28,20 +35,35 @@ def normalize_text(value) -> str:
 
 def make_erp_key(value: str, prefix: str = "") -> str:
     base = normalize_text(value)
-    base = re.sub(r"[^a-z0-9]+", "_", base).strip("_") or "item"
+    base = _NON_ALNUM_RE.sub("_", base).strip("_") or "item"
     return f"{prefix}{base}" if prefix else base
 
 
+@lru_cache(maxsize=1024)
 def norm_col(s: str) -> str:
-    s = (s or "").strip().lower()
-    s = s.replace("á","a").replace("é","e").replace("í","i").replace("ó","o").replace("ú","u").replace("ñ","n")
-    s = re.sub(r"[^a-z0-9]+", "_", s)
-    return s.strip("_")
+    # Los encabezados se repiten entre cargas (y usecols + rename los normalizan dos veces).
+    return _NON_ALNUM_RE.sub("_", (s or "").strip().lower().translate(_ACCENT_TT)).strip("_")
+
+
+def to_text_date(v):
+    """Celda de fecha de una carga Excel como texto YYYY-MM-DD (o el texto original); None si está vacía."""
+    # NaN/NaT/pd.NA se resuelven antes del cache: nunca serían un acierto
+    # (y ``pd.NA != pd.NA`` no es un booleano).
+    if v is None or (pd.api.types.is_scalar(v) and pd.isna(v)):
+        return None
+    return _to_text_date_cached(v)
+
+
+@lru_cache(maxsize=4096, typed=True)
+def _to_text_date_cached(v) -> str:
+    # Las mismas fechas se repiten en miles de filas de un Excel; typed=True
+    # para que 1 y 1.0 no compartan entrada ("1" vs "1.0").
+    return str(v.date()) if isinstance(v, datetime) else str(v)
 
 
 def _rut_parts(rut: str):
     raw = str(rut or "").strip().upper()
-    raw = re.sub(r"[^0-9K]", "", raw)
+    raw = _RUT_STRIP_RE.sub("", raw)
     if not raw:
         return "", ""
     if len(raw) == 1:
@@ -70,7 +92,7 @@ def split_nombre_completo(nombre: str):
     nombre = (nombre or "").strip()
     if not nombre:
         return "", ""
-    toks = [t for t in re.split(r"\s+", nombre) if t]
+    toks = [t for t in _WS_RE.split(nombre) if t]
     if len(toks) >= 4:
         apellidos = " ".join(toks[-2:])
         nombres = " ".join(toks[:-2])
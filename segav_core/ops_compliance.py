@@ -3,6 +3,7 @@ from __future__ import annotations
 from datetime import date, datetime, timedelta
 from typing import Callable
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
@@ -185,10 +186,15 @@ def _company_monthly_missing_by_faena(*, fetch_df: Callable, client_key: str, re
     if faenas is None or faenas.empty:
         return {}
     faena_ids = [int(v) for v in faenas["id"].tolist()]
-    placeholders = ",".join(["?"] * len(faena_ids))
+    # Subconsulta en vez de IN (?,?,...): un solo texto SQL sin importar
+    # cuántas faenas haya (plan reutilizable, sin límite de parámetros).
     docs = fetch_df(
-        f"SELECT faena_id, doc_tipo FROM faena_empresa_documentos WHERE faena_id IN ({placeholders}) AND COALESCE(cliente_key,'')=? AND COALESCE(periodo_anio,0)=? AND COALESCE(periodo_mes,0)=?",
-        tuple(faena_ids) + (client_key, int(year), int(month)),
+        """
+        SELECT faena_id, doc_tipo FROM faena_empresa_documentos
+         WHERE faena_id IN (SELECT f.id FROM faenas f WHERE COALESCE(f.cliente_key,'')=? AND COALESCE(f.estado,'ACTIVA')='ACTIVA')
+           AND COALESCE(cliente_key,'')=? AND periodo_anio=? AND periodo_mes=?
+        """,
+        (client_key, client_key, int(year), int(month)),
     )
     present: dict[int, set[str]] = {fid: set() for fid in faena_ids}
     if docs is not None and not docs.empty:
@@ -204,6 +210,20 @@ def _company_monthly_missing_by_faena(*, fetch_df: Callable, client_key: str, re
 
 
 
+def _risk_semaforo(faenas: pd.DataFrame) -> pd.Series:
+    """Semáforo CRITICO/PENDIENTE/OK por faena, vectorizado sobre las columnas de riesgo."""
+    def _num(col: str) -> pd.Series:
+        return pd.to_numeric(faenas[col], errors="coerce").fillna(0)
+
+    femp = _num("faltantes_empresa_mes")
+    ftr = _num("faltantes_trabajador")
+    pct = _num("cobertura_docs_pct")
+    con_trab = _num("trabajadores_activos") > 0
+    critico = (femp > 0) | (ftr >= 3) | ((pct < 70.0) & con_trab)
+    pendiente = (ftr > 0) | ((pct < 100.0) & con_trab)
+    return pd.Series(np.select([critico, pendiente], ["CRITICO", "PENDIENTE"], default="OK"), index=faenas.index)
+
+
 def build_faena_risk_table(*, fetch_df: Callable, client_key: str, required_doc_types: list[str], worker_required_docs: Callable[[str | None], list[str]]):
     faenas = fetch_df(
         """
@@ -223,34 +243,31 @@ def build_faena_risk_table(*, fetch_df: Callable, client_key: str, required_doc_
             "cobertura_docs_pct", "semaforo"
         ])
 
-    faena_ids = [int(v) for v in faenas["faena_id"].tolist()]
-    placeholders = ",".join(["?"] * len(faena_ids))
-    asign = fetch_df(
-        f"""
+    # Los IN se expresan como subconsultas sobre el mismo filtro de empresa:
+    # un texto SQL fijo por consulta en lugar de uno por cantidad de ids.
+    active_asign_sql = """
         SELECT a.faena_id, a.trabajador_id, COALESCE(t.cargo,'') AS cargo
           FROM asignaciones a
           JOIN trabajadores t ON t.id=a.trabajador_id
-         WHERE a.faena_id IN ({placeholders})
+         WHERE a.faena_id IN (SELECT f.id FROM faenas f WHERE COALESCE(f.cliente_key,'')=?)
            AND COALESCE(a.cliente_key,'')=?
            AND COALESCE(NULLIF(TRIM(UPPER(a.estado)),''),'ACTIVA')='ACTIVA'
-        """,
-        tuple(faena_ids) + (client_key,),
-    )
-
-    worker_ids: list[int] = []
-    if asign is not None and not asign.empty:
-        worker_ids = sorted({int(v) for v in asign["trabajador_id"].tolist()})
+    """
+    asign = fetch_df(active_asign_sql, (client_key, client_key))
 
     docs_map: dict[int, set[str]] = {}
-    if worker_ids:
-        worker_ph = ",".join(["?"] * len(worker_ids))
+    if asign is not None and not asign.empty:
         docs = fetch_df(
-            f"SELECT trabajador_id, doc_tipo FROM trabajador_documentos WHERE trabajador_id IN ({worker_ph}) AND COALESCE(cliente_key,'')=?",
-            tuple(worker_ids) + (client_key,),
+            f"""
+            SELECT trabajador_id, doc_tipo FROM trabajador_documentos
+             WHERE trabajador_id IN (SELECT trabajador_id FROM ({active_asign_sql}) aa)
+               AND COALESCE(cliente_key,'')=?
+            """,
+            (client_key, client_key, client_key),
         )
         if docs is not None and not docs.empty:
             for tid, grp in docs.groupby("trabajador_id"):
-                docs_map[int(tid)] = set(grp["doc_tipo"].astype(str).tolist())
+                docs_map[int(tid)] = set(map(str, grp["doc_tipo"].unique()))
 
     now = date.today()
     monthly_missing = _company_monthly_missing_by_faena(
@@ -306,20 +323,7 @@ def build_faena_risk_table(*, fetch_df: Callable, client_key: str, required_doc_
         faenas["cobertura_docs_pct"] = faenas["cobertura_docs_pct"].fillna(0.0).astype(float)
         faenas["faltantes_empresa_mes"] = faenas["faena_id"].map(lambda x: len(monthly_missing.get(int(x), []))).fillna(0).astype(int)
 
-    def _semaforo(r):
-        if int(r.get("faltantes_empresa_mes", 0) or 0) > 0:
-            return "CRITICO"
-        if int(r.get("faltantes_trabajador", 0) or 0) >= 3:
-            return "CRITICO"
-        if float(r.get("cobertura_docs_pct", 0.0) or 0.0) < 70.0 and int(r.get("trabajadores_activos", 0) or 0) > 0:
-            return "CRITICO"
-        if int(r.get("faltantes_trabajador", 0) or 0) > 0:
-            return "PENDIENTE"
-        if float(r.get("cobertura_docs_pct", 0.0) or 0.0) < 100.0 and int(r.get("trabajadores_activos", 0) or 0) > 0:
-            return "PENDIENTE"
-        return "OK"
-
-    faenas["semaforo"] = faenas.apply(_semaforo, axis=1)
+    faenas["semaforo"] = _risk_semaforo(faenas)
     return faenas
 
 
@@ -710,10 +714,11 @@ def page_compliance_alerts(
             st.dataframe(open_actions, use_container_width=True, hide_index=True)
             open_only = open_actions[open_actions["estado"].fillna("ABIERTA") == "ABIERTA"]
             if not open_only.empty:
+                action_titles = dict(zip(open_only["id"].tolist(), open_only["titulo"].tolist()))
                 action_id = st.selectbox(
                     "Acción a gestionar",
                     open_only["id"].tolist(),
-                    format_func=lambda x: f"#{x} · {open_only[open_only['id']==x].iloc[0]['titulo']}",
+                    format_func=lambda x: f"#{x} · {action_titles.get(x, '')}",
                     key="comp_action_pick",
                 )
                 a1, a2 = st.columns(2)
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import streamlit as st
 
-from segav_core.ui import ui_header
+from segav_core.ui import faena_select_options, fetch_faenas_with_mandante, ui_header
 
 
 def page_documentos_empresa(
@@ -37,12 +37,12 @@ def page_documentos_empresa(
         df = fetch_df(f"SELECT id, mandante_id, doc_tipo, nombre_archivo, file_path, bucket, object_path, created_at FROM empresa_documentos WHERE COALESCE(mandante_id,0)=0 OR mandante_id IN ({_ph}) ORDER BY id DESC", tuple(_allowed_mands))
     else:
         df = fetch_df("SELECT id, mandante_id, doc_tipo, nombre_archivo, file_path, bucket, object_path, created_at FROM empresa_documentos ORDER BY id DESC")
-    tipos_presentes = set(df["doc_tipo"].astype(str).tolist()) if not df.empty else set()
+    tipos_presentes = set(map(str, df["doc_tipo"].unique())) if not df.empty else set()
     faltan = [d for d in get_empresa_required_doc_types() if d not in tipos_presentes]
 
     c1, c2, c3 = st.columns([1, 1, 2])
     c1.metric("Tipos requeridos", len(get_empresa_required_doc_types()))
-    c2.metric("Tipos presentes", len(set(tipos_presentes)))
+    c2.metric("Tipos presentes", len(tipos_presentes))
     c3.metric("Faltan requeridos", len(faltan))
 
     if faltan:
@@ -65,7 +65,7 @@ def page_documentos_empresa(
         mandantes_doc_df = fetch_df("SELECT id, nombre FROM mandantes ORDER BY nombre")
         if mandantes_doc_df is not None and not mandantes_doc_df.empty:
             mand_map = {0: 'Global para toda la empresa'}
-            mand_map.update({int(r['id']): str(r['nombre']) for _, r in mandantes_doc_df.iterrows()})
+            mand_map.update(zip(mandantes_doc_df['id'].astype(int).tolist(), mandantes_doc_df['nombre'].astype(str).tolist()))
             mand_opts = list(mand_map.keys())
             if _scope_restricted:
                 mand_opts = [0] + [mid for mid in mand_opts if mid in _allowed_mands]
@@ -87,11 +87,16 @@ def page_documentos_empresa(
             doc_tipo = tipo if tipo != "OTRO" else (tipo_otro.strip() or "OTRO")
             payload = prepare_upload_payload(up.name, up.getvalue(), getattr(up, 'type', None) or 'application/octet-stream')
             folder = ["empresa", safe_name(doc_tipo)]
-            file_path, bucket, object_path = save_file_online(folder, payload["file_name"], payload["file_bytes"], content_type=payload["content_type"])
-            sha = sha256_bytes(payload["file_bytes"])
-            execute(
-                "INSERT INTO empresa_documentos(mandante_id, doc_tipo, nombre_archivo, file_path, bucket, object_path, sha256, created_at) VALUES(?,?,?,?,?,?,?,?)",
-                (int(mandante_doc_id or 0) or None, doc_tipo, payload["file_name"], file_path, bucket, object_path, sha, datetime.utcnow().isoformat(timespec="seconds")),
+            save_file_online(
+                folder,
+                payload["file_name"],
+                payload["file_bytes"],
+                content_type=payload["content_type"],
+                dedupe=True,
+                record=lambda file_path, bucket, object_path, sha: execute(
+                    "INSERT INTO empresa_documentos(mandante_id, doc_tipo, nombre_archivo, file_path, bucket, object_path, sha256, created_at) VALUES(?,?,?,?,?,?,?,?)",
+                    (int(mandante_doc_id or 0) or None, doc_tipo, payload["file_name"], file_path, bucket, object_path, sha, datetime.utcnow().isoformat(timespec="seconds")),
+                ),
             )
             if payload["compressed"] and payload.get("compression_note"):
                 st.info(payload["compression_note"])
@@ -113,10 +118,11 @@ def page_documentos_empresa(
 
             st.divider()
             st.markdown("#### 🔎 Gestionar documento")
+            doc_labels = {i: f"{t} — {n}" for i, t, n in zip(docs["id"].tolist(), docs["doc_tipo"].tolist(), docs["nombre_archivo"].tolist())}
             pick_id = st.selectbox(
                 "Documento",
                 docs["id"].tolist(),
-                format_func=lambda x: f"{docs[docs['id']==x].iloc[0]['doc_tipo']} — {docs[docs['id']==x].iloc[0]['nombre_archivo']}",
+                format_func=lambda x: doc_labels.get(x, str(x)),
                 key="emp_pick_doc",
             )
             row = docs[docs["id"] == pick_id].iloc[0]
@@ -212,38 +218,18 @@ def page_documentos_empresa_faena(
     if _scope_restricted and not _allowed_mands:
         st.info("Tu usuario lector no tiene mandantes asignados. No hay faenas disponibles para Documentos Empresa (Faena).")
         return
-    if _scope_restricted:
-        _ph = ','.join(['?'] * len(_allowed_mands))
-        faenas = fetch_df(
-            f"""
-            SELECT f.id, f.mandante_id, m.nombre AS mandante, f.nombre, f.estado, f.fecha_inicio
-            FROM faenas f JOIN mandantes m ON m.id=f.mandante_id
-            WHERE f.mandante_id IN ({_ph})
-            ORDER BY f.id DESC
-            """,
-            tuple(_allowed_mands),
-        )
-    else:
-        faenas = fetch_df(
-            """
-            SELECT f.id, f.mandante_id, m.nombre AS mandante, f.nombre, f.estado, f.fecha_inicio
-            FROM faenas f JOIN mandantes m ON m.id=f.mandante_id
-            ORDER BY f.id DESC
-            """
-        )
+    faenas = fetch_faenas_with_mandante(fetch_df, _allowed_mands if _scope_restricted else None)
     if faenas.empty:
         ui_tip("Crea una faena primero.")
         return
 
-    default_id = st.session_state.get("selected_faena_id", None)
-    opts = faenas["id"].tolist()
-    idx = opts.index(default_id) if default_id in opts else 0
+    opts, idx, faena_labels = faena_select_options(faenas, st.session_state.get("selected_faena_id", None))
 
     faena_id = st.selectbox(
         "Faena",
         opts,
         index=idx,
-        format_func=lambda x: f"{x} - {faenas[faenas['id']==x].iloc[0]['mandante']} / {faenas[faenas['id']==x].iloc[0]['nombre']} ({faenas[faenas['id']==x].iloc[0]['estado']})",
+        format_func=faena_labels.get,
         key="emp_faena_sel",
     )
     st.session_state["selected_faena_id"] = int(faena_id)
@@ -281,12 +267,13 @@ def page_documentos_empresa_faena(
         "SELECT id, mandante_id, periodo_anio, periodo_mes, doc_tipo, nombre_archivo, file_path, bucket, object_path, created_at FROM faena_empresa_documentos WHERE faena_id=? AND COALESCE(periodo_anio,0)=? AND COALESCE(periodo_mes,0)=? ORDER BY id DESC",
         (int(faena_id), int(anio_sel), int(mes_sel)),
     )
-    tipos_presentes = set(docs_periodo["doc_tipo"].astype(str).tolist()) if not docs_periodo.empty else set()
-    faltan = [d for d in get_empresa_monthly_doc_types() if d not in tipos_presentes]
+    tipos_presentes = set(map(str, docs_periodo["doc_tipo"].unique())) if not docs_periodo.empty else set()
+    requeridos = get_empresa_monthly_doc_types()
+    faltan = [d for d in requeridos if d not in tipos_presentes]
 
     c1, c2, c3 = st.columns([1, 1, 2])
-    c1.metric("Requeridos mensuales", len(get_empresa_monthly_doc_types()))
-    c2.metric("Tipos cargados en el período", len([d for d in get_empresa_monthly_doc_types() if d in tipos_presentes]))
+    c1.metric("Requeridos mensuales", len(requeridos))
+    c2.metric("Tipos cargados en el período", len(requeridos) - len(faltan))
     c3.metric("Faltan en el período", len(faltan))
 
     if faltan:
@@ -331,12 +318,16 @@ def page_documentos_empresa_faena(
                 "empresa_mensual",
                 safe_name(doc_tipo),
             ]
-            file_path, bucket, object_path = save_file_online(folder, payload["file_name"], payload["file_bytes"], content_type=payload["content_type"])
-            sha = sha256_bytes(payload["file_bytes"])
-
-            execute(
-                "INSERT INTO faena_empresa_documentos(faena_id, mandante_id, periodo_anio, periodo_mes, doc_tipo, nombre_archivo, file_path, bucket, object_path, sha256, created_at) VALUES(?,?,?,?,?,?,?,?,?,?,?)",
-                (int(faena_id), int(mandante_id), int(anio_sel), int(mes_sel), doc_tipo, payload["file_name"], file_path, bucket, object_path, sha, datetime.utcnow().isoformat(timespec="seconds")),
+            save_file_online(
+                folder,
+                payload["file_name"],
+                payload["file_bytes"],
+                content_type=payload["content_type"],
+                dedupe=True,
+                record=lambda file_path, bucket, object_path, sha: execute(
+                    "INSERT INTO faena_empresa_documentos(faena_id, mandante_id, periodo_anio, periodo_mes, doc_tipo, nombre_archivo, file_path, bucket, object_path, sha256, created_at) VALUES(?,?,?,?,?,?,?,?,?,?,?)",
+                    (int(faena_id), int(mandante_id), int(anio_sel), int(mes_sel), doc_tipo, payload["file_name"], file_path, bucket, object_path, sha, datetime.utcnow().isoformat(timespec="seconds")),
+                ),
             )
             if payload["compressed"] and payload.get("compression_note"):
                 st.info(payload["compression_note"])
@@ -353,10 +344,11 @@ def page_documentos_empresa_faena(
 
             st.divider()
             st.markdown("#### 🔎 Gestionar documento del período")
+            doc_labels = {i: f"{t} — {n}" for i, t, n in zip(docs_periodo["id"].tolist(), docs_periodo["doc_tipo"].tolist(), docs_periodo["nombre_archivo"].tolist())}
             pick_id = st.selectbox(
                 "Documento",
                 docs_periodo["id"].tolist(),
-                format_func=lambda x: f"{docs_periodo[docs_periodo['id']==x].iloc[0]['doc_tipo']} — {docs_periodo[docs_periodo['id']==x].iloc[0]['nombre_archivo']}",
+                format_func=lambda x: doc_labels.get(x, str(x)),
                 key="empf_pick_doc",
             )
             row = docs_periodo[docs_periodo["id"] == pick_id].iloc[0]
@@ -409,5 +401,5 @@ def page_documentos_empresa_faena(
             st.info("(sin historial de documentos empresa por faena)")
         else:
             historial = historial.copy()
-            historial["periodo"] = historial.apply(lambda r: periodo_label(r.get("periodo_anio"), r.get("periodo_mes")), axis=1)
+            historial["periodo"] = [periodo_label(a, m) for a, m in zip(historial["periodo_anio"].tolist(), historial["periodo_mes"].tolist())]
             st.dataframe(historial[["periodo", "doc_tipo", "nombre_archivo", "created_at"]], use_container_width=True, hide_index=True)
@@ -1,7 +1,15 @@
 from __future__ import annotations
 
+import os
+import time
+from datetime import timezone
+from concurrent.futures import Future
+
 import pandas as pd
 
+from segav_core.ui import deferred_download_data, faena_select_options, fetch_faenas_with_mandante, fragment
+
+
 def _legal_export_blockers(fetch_df, faena_id: int) -> tuple[pd.DataFrame, pd.DataFrame]:
     latest = fetch_df(
         """
@@ -42,6 +50,53 @@ def _legal_export_blockers(fetch_df, faena_id: int) -> tuple[pd.DataFrame, pd.Da
     return blockers[cols].reset_index(drop=True), warnings[cols].reset_index(drop=True)
 
 
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as fp:
+        return fp.read()
+
+
+def _zip_download_data(load_file_anywhere, file_path, bucket, object_path):
+    """Datos para el botón de descarga de un ZIP guardado.
+
+    Si el ZIP está en disco se lee de ahí recién al hacer clic, en vez de
+    cargarlo en memoria en cada render (y sin pasar por Storage, que
+    ``load_file_anywhere`` prueba primero); si solo vive en Storage se
+    descarga ahora para poder mostrar el error en la página.
+    """
+    if file_path and os.path.isfile(str(file_path)):
+        return deferred_download_data(lambda: _read_file(str(file_path)))
+    return load_file_anywhere(file_path, bucket, object_path)
+
+
+def _done_future(fn, *args, **kwargs) -> Future:
+    """Ejecuta ``fn`` en el hilo actual y entrega un Future ya resuelto (sin pool)."""
+    fut: Future = Future()
+    try:
+        fut.set_result(fn(*args, **kwargs))
+    except Exception as exc:
+        fut.set_exception(exc)
+    return fut
+
+
+def _wait_export_job(st, job_key: str, label: str):
+    """Espera el job de export guardado en ``session_state[job_key]`` mostrando st.status.
+
+    Devuelve ``(meta, resultado)``; si el build falló, re-lanza la excepción. Si
+    el usuario interactúa mientras espera, el rerun corta esta espera pero el
+    job sigue en el pool y se recoge en la próxima pasada por la página.
+    """
+    meta, fut = st.session_state[job_key]
+    if not fut.done():
+        with st.status(label, expanded=False) as status:
+            while not fut.done():
+                # Sin arrancar = en cola detrás del export de otra sesión.
+                status.update(label=label if fut.running() else "Otro export en curso, esperando turno…")
+                time.sleep(0.2)
+            status.update(label=label, state="complete")
+    st.session_state.pop(job_key, None)
+    return meta, fut.result()
+
+
 def page_export_zip(
     *,
     st,
@@ -67,6 +122,8 @@ def page_export_zip(
     execute=None,
     is_superadmin=None,
     audit_log=None,
+    submit_export_job=None,
+    pendientes_obligatorios_detalle=None,
 ):
     ui_header("Exportar (ZIP)", "Genera carpeta por faena con documentos de trabajadores y deja historial.")
     tenant_key = str(current_tenant_key() or current_segav_client_key() or '').strip()
@@ -86,33 +143,18 @@ def page_export_zip(
     if _scope_restricted and not _allowed_mands:
         st.info("Tu usuario lector no tiene mandantes asignados. No hay faenas disponibles para exportar.")
         return
-    if _scope_restricted:
-        _ph = ','.join(['?'] * len(_allowed_mands))
-        faenas = fetch_df(f'''
-            SELECT f.id, m.nombre AS mandante, f.nombre, f.estado
-            FROM faenas f JOIN mandantes m ON m.id=f.mandante_id
-            WHERE f.mandante_id IN ({_ph})
-            ORDER BY f.id DESC
-        ''', tuple(_allowed_mands))
-    else:
-        faenas = fetch_df('''
-            SELECT f.id, m.nombre AS mandante, f.nombre, f.estado
-            FROM faenas f JOIN mandantes m ON m.id=f.mandante_id
-            ORDER BY f.id DESC
-        ''')
+    faenas = fetch_faenas_with_mandante(fetch_df, _allowed_mands if _scope_restricted else None)
     if faenas.empty:
         ui_tip("Crea una faena primero.")
         return
 
-    default_id = st.session_state.get("selected_faena_id", None)
-    opts = faenas["id"].tolist()
-    idx = opts.index(default_id) if default_id in opts else 0
+    opts, idx, faena_labels = faena_select_options(faenas, st.session_state.get("selected_faena_id", None))
 
     faena_id = st.selectbox(
         "Faena",
         opts,
         index=idx,
-        format_func=lambda x: f"{x} - {faenas[faenas['id']==x].iloc[0]['mandante']} / {faenas[faenas['id']==x].iloc[0]['nombre']} ({faenas[faenas['id']==x].iloc[0]['estado']})",
+        format_func=faena_labels.get,
     )
     st.session_state["selected_faena_id"] = int(faena_id)
 
@@ -151,7 +193,11 @@ def page_export_zip(
             st.warning("Hay documentos críticos por vencer o pendientes de aprobación.")
             st.dataframe(legal_warnings.head(10), use_container_width=True, hide_index=True)
 
-    with tab2:
+    # Cada pestaña con controles es un fragment: marcar un checkbox o elegir en
+    # un historial re-dibuja solo esa pestaña, sin volver a consultar los
+    # pendientes ni el control legal de la pestaña 1.
+    @fragment
+    def _tab_generar():
         st.markdown("### 📦 Selecciona los documentos para el ZIP")
         st.caption("Expande cada sección, revisa los documentos disponibles y desmarca los que no quieras incluir.")
 
@@ -172,6 +218,17 @@ def page_export_zip(
                 if inc_contrato:
                     _total_selected += 1
 
+        def _file_labels(df, name_col: str, prefix: str, with_tipo: bool = True) -> dict:
+            """id → etiqueta (``doc_tipo · archivo``) en una pasada con zip, sin iterrows."""
+            ids = df["id"].astype(int).tolist()
+            names = [
+                os.path.basename(str(n or fp or op or f"{prefix}_{i}"))
+                for i, n, fp, op in zip(ids, df[name_col].tolist(), df["file_path"].tolist(), df["object_path"].tolist())
+            ]
+            if not with_tipo:
+                return dict(zip(ids, names))
+            return {i: f"{t} · {n}" for i, t, n in zip(ids, df["doc_tipo"].tolist(), names)}
+
         # 2. Anexos de faena
         anexos_df = fetch_df("SELECT id, nombre, file_path, object_path FROM faena_anexos WHERE faena_id=? ORDER BY id", (int(faena_id),))
         _has_anexos = anexos_df is not None and not anexos_df.empty
@@ -180,11 +237,7 @@ def page_export_zip(
         if _has_anexos:
             _n_anexos = len(anexos_df)
             with st.expander(f"📎 Anexos de faena ({_n_anexos} archivo{'s' if _n_anexos != 1 else ''})", expanded=False):
-                anexo_labels = {}
-                for _, r in anexos_df.iterrows():
-                    aid = int(r["id"])
-                    aname = os.path.basename(str(r.get("nombre") or r.get("file_path") or r.get("object_path") or f"anexo_{aid}"))
-                    anexo_labels[aid] = aname
+                anexo_labels = _file_labels(anexos_df, "nombre", "anexo", with_tipo=False)
                 a_ids = list(anexo_labels.keys())
                 sel_anexo_ids = st.multiselect(
                     "Anexos a incluir",
@@ -210,11 +263,7 @@ def page_export_zip(
         if _has_emp_global:
             _n_eg = len(emp_global_df)
             with st.expander(f"🏢 Documentos empresa global ({_n_eg} archivo{'s' if _n_eg != 1 else ''})", expanded=False):
-                eg_labels = {}
-                for _, r in emp_global_df.iterrows():
-                    did = int(r["id"])
-                    nombre = os.path.basename(str(r.get("nombre_archivo") or r.get("file_path") or r.get("object_path") or f"doc_{did}"))
-                    eg_labels[did] = f"{r.get('doc_tipo', '-')} · {nombre}"
+                eg_labels = _file_labels(emp_global_df, "nombre_archivo", "doc")
                 eg_ids = list(eg_labels.keys())
                 sel_emp_global_ids = st.multiselect(
                     "Documentos empresa global a incluir",
@@ -235,11 +284,7 @@ def page_export_zip(
         if _has_emp_faena:
             _n_ef = len(emp_faena_df)
             with st.expander(f"🏭 Documentos empresa por faena ({_n_ef} archivo{'s' if _n_ef != 1 else ''})", expanded=False):
-                ef_labels = {}
-                for _, r in emp_faena_df.iterrows():
-                    did = int(r["id"])
-                    nombre = os.path.basename(str(r.get("nombre_archivo") or r.get("file_path") or r.get("object_path") or f"doc_{did}"))
-                    ef_labels[did] = f"{r.get('doc_tipo', '-')} · {nombre}"
+                ef_labels = _file_labels(emp_faena_df, "nombre_archivo", "doc")
                 ef_ids = list(ef_labels.keys())
                 emp_faena_doc_sel_ids = st.multiselect(
                     "Documentos empresa (faena) a incluir",
@@ -264,28 +309,34 @@ def page_export_zip(
         selected_trab_doc_map = None
         if _has_workers:
             _n_workers = len(asign_df)
-            # Count total worker docs (use uncached to ensure fresh data)
-            _worker_doc_count = 0
-            _worker_doc_cache = {}
-            for _, wr in asign_df.iterrows():
-                _wid = int(wr["trabajador_id"])
-                _wdocs = fetch_df(
-                    "SELECT id, doc_tipo, nombre_archivo, file_path, bucket, object_path FROM trabajador_documentos WHERE trabajador_id=? ORDER BY doc_tipo, nombre_archivo, id",
-                    (_wid,),
+            # Documentos de todos los asignados en una sola consulta, repartidos
+            # por trabajador (antes era un SELECT por trabajador).
+            _all_wdocs = fetch_df(
+                """
+                SELECT trabajador_id, id, doc_tipo, nombre_archivo, file_path, bucket, object_path
+                FROM trabajador_documentos
+                WHERE trabajador_id IN (
+                    SELECT a.trabajador_id FROM asignaciones a
+                    WHERE a.faena_id=? AND COALESCE(NULLIF(TRIM(a.estado), ''), 'ACTIVA')='ACTIVA'
                 )
-                _worker_doc_cache[_wid] = _wdocs
-                if _wdocs is not None and not _wdocs.empty:
-                    _worker_doc_count += len(_wdocs)
+                ORDER BY doc_tipo, nombre_archivo, id
+                """,
+                (int(faena_id),),
+            )
+            _worker_doc_cache = {}
+            _worker_doc_count = 0
+            if _all_wdocs is not None and not _all_wdocs.empty:
+                _worker_doc_cache = {int(_wid): _g for _wid, _g in _all_wdocs.groupby("trabajador_id", sort=False)}
+                _worker_doc_count = len(_all_wdocs)
 
             with st.expander(f"👷 Documentos de trabajadores ({_n_workers} trabajadores · {_worker_doc_count} archivos)", expanded=True):
                 st.markdown("##### 👷 Trabajadores en esta faena")
                 # Worker selection
                 worker_labels = {}
-                for _, wr in asign_df.iterrows():
-                    _wid = int(wr["trabajador_id"])
-                    _wdocs = _worker_doc_cache.get(_wid)
-                    _wdoc_n = len(_wdocs) if _wdocs is not None and not _wdocs.empty else 0
-                    worker_labels[_wid] = f"{wr['apellidos']}, {wr['nombres']} · {wr['rut']} ({_wdoc_n} docs)"
+                for _wid, _ap, _no, _rut in asign_df[["trabajador_id", "apellidos", "nombres", "rut"]].itertuples(index=False, name=None):
+                    _wdocs = _worker_doc_cache.get(int(_wid))
+                    _wdoc_n = len(_wdocs) if _wdocs is not None else 0
+                    worker_labels[int(_wid)] = f"{_ap}, {_no} · {_rut} ({_wdoc_n} docs)"
                 worker_ids = list(worker_labels.keys())
                 selected_trab_ids = st.multiselect(
                     "Selecciona los trabajadores que deseas incluir en el ZIP",
@@ -308,11 +359,7 @@ def page_export_zip(
                         st.caption(f"⚠️ {wlabel}: sin documentos cargados")
                         selected_trab_doc_map[int(tid)] = []
                         continue
-                    doc_labels = {}
-                    for _, dr in docs_worker.iterrows():
-                        did = int(dr["id"])
-                        nombre = os.path.basename(str(dr.get("nombre_archivo") or dr.get("file_path") or dr.get("object_path") or f"doc_{did}"))
-                        doc_labels[did] = f"{dr.get('doc_tipo', '-')} · {nombre}"
+                    doc_labels = _file_labels(docs_worker, "nombre_archivo", "doc")
                     doc_ids = list(doc_labels.keys())
                     selected_trab_doc_map[int(tid)] = st.multiselect(
                         f"📄 {wlabel}",
@@ -357,13 +404,18 @@ def page_export_zip(
                 st.button("🚫 Generar ZIP", type="primary", use_container_width=True, disabled=True)
                 st.caption("Exportación bloqueada por documentos críticos vencidos.")
             elif st.button("📦 Generar ZIP y guardar en historial", type="primary", use_container_width=True, disabled=_disabled):
+                st.session_state.pop("exp_faena_done", None)
                 try:
                     # Build selection flags from user choices
                     _inc_emp_global = len(sel_emp_global_ids) > 0
                     _inc_emp_faena = emp_faena_doc_sel_ids is not None and len(emp_faena_doc_sel_ids) > 0
                     _inc_trab = selected_trab_ids is not None and len(selected_trab_ids) > 0
 
-                    result = export_zip_for_faena(
+                    # El build del ZIP corre en el pool de exports (si está
+                    # disponible) para no congelar la sesión mientras comprime.
+                    _run = submit_export_job or _done_future
+                    st.session_state["exp_faena_job"] = (int(faena_id), _run(
+                        export_zip_for_faena,
                         int(faena_id),
                         include_global_empresa_docs=_inc_emp_global,
                         include_contrato=inc_contrato,
@@ -378,26 +430,48 @@ def page_export_zip(
                         selected_trabajador_doc_ids=selected_trab_doc_map,
                         selected_empresa_global_doc_ids=sel_emp_global_ids if sel_emp_global_ids else None,
                         selected_anexo_ids=sel_anexo_ids if sel_anexo_ids else None,
-                    )
+                    ))
+                except Exception as e:
+                    st.error(f"No se pudo generar ZIP: {e}")
+            if st.session_state.get("exp_faena_job") is not None:
+                _persisted = False
+                try:
+                    _job_faena_id, result = _wait_export_job(st, "exp_faena_job", "Generando ZIP de la faena…")
                     zip_bytes, name, _inc, _skip, _skip_names = result
-                    path = persist_export(int(faena_id), zip_bytes, name)
-                    st.success(f"✅ ZIP generado: **{_inc} documentos** incluidos")
-                    if _skip > 0:
-                        st.warning(f"⚠️ {_skip} documento(s) no pudieron incluirse (archivo no encontrado): {', '.join(_skip_names[:10])}")
+                    path = persist_export(int(_job_faena_id), zip_bytes, name)
+                    # El ZIP ya quedó en disco: el botón lo lee desde ahí al descargar
+                    # en vez de retener los bytes en la sesión.
+                    del zip_bytes, result
                     auto_backup_db("export_zip")
-                    st.download_button(
-                        "📥 Descargar ZIP",
-                        data=zip_bytes,
-                        file_name=os.path.basename(path),
-                        mime="application/zip",
-                        use_container_width=True,
-                    )
+                    st.session_state["exp_faena_done"] = (int(_job_faena_id), path, _inc, _skip, _skip_names)
+                    _persisted = True
                 except Exception as e:
                     st.error(f"No se pudo generar ZIP: {e}")
+                if _persisted:
+                    # Rerun completo, no solo de este fragment: el historial (otro
+                    # fragment) y la barra lateral deben ver el export nuevo.
+                    st.rerun()
+            _done = st.session_state.get("exp_faena_done")
+            if _done is not None and _done[0] == int(faena_id):
+                _, path, _inc, _skip, _skip_names = _done
+                st.success(f"✅ ZIP generado: **{_inc} documentos** incluidos")
+                if _skip > 0:
+                    st.warning(f"⚠️ {_skip} documento(s) no pudieron incluirse (archivo no encontrado): {', '.join(_skip_names[:10])}")
+                st.download_button(
+                    "📥 Descargar ZIP",
+                    data=_zip_download_data(load_file_anywhere, path, None, None),
+                    file_name=os.path.basename(path),
+                    mime="application/zip",
+                    use_container_width=True,
+                )
         with col_info:
             st.caption("El ZIP se guarda en Supabase Storage para que persista entre reinicios.")
 
-    with tab3:
+    with tab2:
+        _tab_generar()
+
+    @fragment
+    def _tab_historial():
         _is_sa = is_superadmin() if callable(is_superadmin) else False
         hist = fetch_df(
             """
@@ -412,29 +486,33 @@ def page_export_zip(
             st.info("Aún no hay ZIPs exportados.")
         else:
             view = hist.copy()
-            view["archivo"] = view.apply(
-                lambda r: os.path.basename(str(r.get("file_path") or r.get("object_path") or f"export_{int(r['id'])}.zip")),
-                axis=1,
-            )
+            # Columnas derivadas recorriendo listas (zip) en vez de apply(axis=1),
+            # que arma una Series por fila.
+            view["archivo"] = [
+                os.path.basename(str(fp or op or f"export_{int(rid)}.zip"))
+                for fp, op, rid in zip(view["file_path"].tolist(), view["object_path"].tolist(), view["id"].tolist())
+            ]
             view["tamaño"] = view["size_bytes"].apply(human_file_size)
-            _storage_col = view.apply(lambda r: "✅ Storage" if r.get("bucket") else "⚠️ Solo local", axis=1)
-            view["ubicación"] = _storage_col
+            view["ubicación"] = ["✅ Storage" if b else "⚠️ Solo local" for b in view["bucket"].tolist()]
             show_cols = ["id", "faena_nombre", "archivo", "tamaño", "ubicación", "created_at"]
             st.dataframe(view[show_cols], use_container_width=True, hide_index=True)
             st.caption(f"Historial acotado a la empresa activa: {tenant_name}")
 
+            hist_ids = view["id"].tolist()
+            hist_labels = {i: f"{int(i)} — {a} ({c})" for i, a, c in zip(hist_ids, view["archivo"].tolist(), view["created_at"].tolist())}
             hid = st.selectbox(
                 "ZIP del historial",
-                view["id"].tolist(),
-                format_func=lambda x: f"{int(x)} — {view[view['id']==x].iloc[0]['archivo']} ({view[view['id']==x].iloc[0]['created_at']})",
+                hist_ids,
+                format_func=lambda x: hist_labels.get(x, str(x)),
                 key="exp_hist_pick",
             )
-            row = view[view["id"] == hid].iloc[0]
+            # Fila por posición en la lista de opciones, sin máscara booleana sobre el historial.
+            row = view.iloc[hist_ids.index(hid)]
 
             col_dl, col_del = st.columns([2, 1])
             with col_dl:
                 try:
-                    b = load_file_anywhere(row.get("file_path"), row.get("bucket"), row.get("object_path"))
+                    b = _zip_download_data(load_file_anywhere, row.get("file_path"), row.get("bucket"), row.get("object_path"))
                     st.download_button(
                         "📥 Descargar ZIP del historial",
                         data=b,
@@ -482,10 +560,11 @@ def page_export_zip(
             if _is_sa and len(view) > 1:
                 st.divider()
                 with st.expander("🗑️ Eliminar registros en lote (superadmin)", expanded=False):
+                    hist_archivos = dict(zip(view["id"].tolist(), view["archivo"].tolist()))
                     _del_ids = st.multiselect(
                         "Selecciona registros a eliminar",
                         view["id"].tolist(),
-                        format_func=lambda x: f"#{int(x)} — {view[view['id']==x].iloc[0]['archivo']}",
+                        format_func=lambda x: f"#{int(x)} — {hist_archivos.get(x, '')}",
                         key="exp_hist_bulk_del",
                     )
                     if _del_ids and st.button(f"🗑️ Eliminar {len(_del_ids)} registro(s)", type="primary", use_container_width=True, key="exp_hist_bulk_del_btn"):
@@ -502,7 +581,11 @@ def page_export_zip(
                         st.success(f"✅ {_deleted} registro(s) eliminados del historial.")
                         st.rerun()
 
-    with tab4:
+    with tab3:
+        _tab_historial()
+
+    @fragment
+    def _tab_mensual():
         st.markdown("### 📅 Export por mes")
         c1, c2 = st.columns(2)
         with c1:
@@ -518,13 +601,20 @@ def page_export_zip(
 
         if st.button("Generar ZIP mensual y guardar en historial", type="primary", use_container_width=True, key="exp_mes_btn"):
             try:
-                zip_bytes, ym = export_zip_for_mes(int(year), int(month), include_global_empresa_docs=inc_mes_emp_global)
+                _run = submit_export_job or _done_future
+                st.session_state["exp_mes_job"] = (None, _run(export_zip_for_mes, int(year), int(month), include_global_empresa_docs=inc_mes_emp_global))
+            except Exception as e:
+                st.error(f"No se pudo generar export mensual: {e}")
+        if st.session_state.get("exp_mes_job") is not None:
+            try:
+                _, (zip_bytes, ym) = _wait_export_job(st, "exp_mes_job", "Generando ZIP mensual…")
                 path_export = persist_export_mes(ym, zip_bytes)
+                del zip_bytes
                 st.success(f"ZIP mensual generado y guardado: {os.path.basename(path_export)}")
                 auto_backup_db("export_zip_mes")
                 st.download_button(
                     "Descargar ZIP mensual (recién generado)",
-                    data=zip_bytes,
+                    data=_zip_download_data(load_file_anywhere, path_export, None, None),
                     file_name=os.path.basename(path_export),
                     mime="application/zip",
                     use_container_width=True,
@@ -545,23 +635,25 @@ def page_export_zip(
             st.caption("Aún no hay exportaciones mensuales guardadas.")
         else:
             view = hist_mes.copy()
-            view["archivo"] = view.apply(
-                lambda r: os.path.basename(str(r.get("file_path") or r.get("object_path") or f"mes_{r.get('year_month','export')}.zip")),
-                axis=1,
-            )
+            view["archivo"] = [
+                os.path.basename(str(fp or op or f"mes_{ym}.zip"))
+                for fp, op, ym in zip(view["file_path"].tolist(), view["object_path"].tolist(), view["year_month"].tolist())
+            ]
             view["tamaño"] = view["size_bytes"].apply(human_file_size)
             st.dataframe(view[["id", "year_month", "archivo", "tamaño", "created_at"]], use_container_width=True, hide_index=True)
             st.caption(f"Exportaciones mensuales visibles solo para: {tenant_name}")
 
+            mes_ids = view["id"].tolist()
+            mes_labels = {i: f"{int(i)} - {a} ({ym})" for i, a, ym in zip(mes_ids, view["archivo"].tolist(), view["year_month"].tolist())}
             mid = st.selectbox(
                 "ZIP mensual del historial",
-                view["id"].tolist(),
-                format_func=lambda x: f"{int(x)} - {view[view['id']==x].iloc[0]['archivo']} ({view[view['id']==x].iloc[0]['year_month']})",
+                mes_ids,
+                format_func=lambda x: mes_labels.get(x, str(x)),
                 key="exp_mes_hist_pick",
             )
-            row = view[view["id"] == mid].iloc[0]
+            row = view.iloc[mes_ids.index(mid)]
             try:
-                b = load_file_anywhere(row.get("file_path"), row.get("bucket"), row.get("object_path"))
+                b = _zip_download_data(load_file_anywhere, row.get("file_path"), row.get("bucket"), row.get("object_path"))
                 st.download_button(
                     "📥 Descargar ZIP mensual del historial",
                     data=b,
@@ -580,6 +672,9 @@ def page_export_zip(
                         "Los ZIPs nuevos se guardarán en Supabase Storage automáticamente."
                     )
 
+    with tab4:
+        _tab_mensual()
+
     with tab5:
         st.markdown("### 📄 Reporte de Cumplimiento por Faena")
         st.caption("Genera un reporte HTML descargable e imprimible con el estado documental completo de la faena seleccionada.")
@@ -592,18 +687,18 @@ def page_export_zip(
             except Exception:
                 fi = {}
 
-            pend = pendientes_obligatorios(int(faena_id))
-            asig = fetch_df("SELECT t.rut, t.apellidos, t.nombres, t.cargo FROM asignaciones a JOIN trabajadores t ON t.id=a.trabajador_id WHERE a.faena_id=? ORDER BY t.apellidos", (int(faena_id),))
-
             if st.button("📄 Generar reporte HTML", type="primary", use_container_width=True, key="btn_compliance_report"):
+                # Mismo cálculo (cacheado) que la pestaña de pendientes: trabajadores
+                # activos con sus faltantes, sin otra consulta de asignaciones.
+                if pendientes_obligatorios_detalle is not None:
+                    detalle = pendientes_obligatorios_detalle(int(faena_id))
+                else:
+                    detalle = [{"rut": "", "nombre": k, "cargo": "", "faltantes": v} for k, v in pendientes_obligatorios(int(faena_id)).items()]
                 rows_html = ""
                 total_ok = total_falt = 0
-                if asig is not None and not asig.empty:
-                    for _, tr in asig.iterrows():
-                        rut = str(tr.get("rut",""))
-                        nombre = f"{tr.get('apellidos','')} {tr.get('nombres','')}"
-                        cargo = str(tr.get("cargo",""))
-                        faltantes = pend.get(rut, [])
+                if detalle:
+                    for r in detalle:
+                        rut, nombre, cargo, faltantes = r["rut"], r["nombre"], r["cargo"], r["faltantes"]
                         estado = "✅ Completo" if not faltantes else f"❌ Faltan {len(faltantes)}"
                         falt_txt = ", ".join(faltantes) if faltantes else "-"
                         color = "#dcfce7" if not faltantes else "#fee2e2"
@@ -672,6 +767,7 @@ def page_backup_restore(
     init_db,
     os,
     restore_from_backup_zip,
+    restore_from_db_file,
     storage_admin_enabled,
     storage_enabled,
     storage_upload,
@@ -688,6 +784,8 @@ def page_backup_restore(
         )
 
     tab1, tab2, tab3 = st.tabs(["🧪 Diagnóstico backend", "🗄️ Base local heredada (app.db)", "📦 Backup completo (ZIP)"])
+    # Sello UTC para nombres de descarga/diagnóstico, una vez por render.
+    ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
 
     with tab1:
         cdiag1, cdiag2, cdiag3 = st.columns(3)
@@ -701,26 +799,27 @@ def page_backup_restore(
         if storage_enabled() and not storage_admin_enabled():
             st.warning("Storage está solo en modo lectura o con key débil. Para subir/eliminar archivos usa una secret/service key real en SUPABASE_SERVICE_ROLE_KEY.")
         st.caption("Auto-backups generados al guardar (solo app.db). Se guardan localmente y conviene descargarlos si sigues usando SQLite local.")
-        hist = fetch_df("SELECT id, tag, file_path, size_bytes, created_at FROM auto_backup_historial ORDER BY id DESC")
+        hist = fetch_df("SELECT id, tag, file_path, size_bytes, ROUND(size_bytes / 1024.0, 1) AS size_kb, created_at FROM auto_backup_historial ORDER BY id DESC")
         if hist.empty:
             st.info("(aún no hay auto-backups)")
         else:
             view = hist.copy()
-            view["archivo"] = view["file_path"].apply(lambda p: os.path.basename(p))
-            view["size_kb"] = (view["size_bytes"] / 1024).round(1)
+            # Nombre de archivo con un reemplazo vectorizado (sin apply por fila);
+            # size_kb ya viene calculado desde la consulta.
+            view["archivo"] = view["file_path"].fillna("").astype(str).str.replace(r"^.*[\\/]", "", regex=True)
             st.dataframe(view[["id", "tag", "archivo", "size_kb", "created_at"]], use_container_width=True, hide_index=True)
 
+            bk_ids = view["id"].tolist()
+            bk_labels = {i: f"{int(i)} - {a} ({t})" for i, a, t in zip(bk_ids, view["archivo"].tolist(), view["tag"].tolist())}
             sel = st.selectbox(
                 "Elegir auto-backup para descargar",
-                view["id"].tolist(),
-                format_func=lambda x: f"{int(x)} - {view[view['id']==x].iloc[0]['archivo']} ({view[view['id']==x].iloc[0]['tag']})",
+                bk_ids,
+                format_func=lambda x: bk_labels.get(x, str(x)),
             )
-            row = view[view["id"] == sel].iloc[0]
+            row = view.iloc[bk_ids.index(sel)]
             p = row["file_path"]
             if os.path.exists(p):
-                with open(p, "rb") as f:
-                    b = f.read()
-                st.download_button("Descargar auto-backup (app.db)", data=b, file_name=os.path.basename(p), mime="application/octet-stream", use_container_width=True)
+                st.download_button("Descargar auto-backup (app.db)", data=deferred_download_data(lambda: _read_file(p)), file_name=os.path.basename(p), mime="application/octet-stream", use_container_width=True)
             else:
                 st.warning("El archivo no está en disco (posible reboot/redeploy).")
 
@@ -732,10 +831,8 @@ def page_backup_restore(
         with coldb1:
             st.markdown("### Descargar app.db")
             if os.path.exists(DB_PATH):
-                with open(DB_PATH, "rb") as f:
-                    db_bytes = f.read()
-                ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-                st.download_button("Descargar app.db", data=db_bytes, file_name=f"app_{ts}.db", mime="application/octet-stream", use_container_width=True)
+                # Se lee al hacer clic, no en cada rerun de la página.
+                st.download_button("Descargar app.db", data=deferred_download_data(lambda: _read_file(DB_PATH)), file_name=f"app_{ts}.db", mime="application/octet-stream", use_container_width=True)
             else:
                 st.info("Aún no existe app.db (no hay datos o no se ha inicializado).")
 
@@ -749,9 +846,7 @@ def page_backup_restore(
 
                     st.stop()
                 try:
-                    with open(DB_PATH, "wb") as f:
-                        f.write(up_db.getvalue())
-                    init_db()
+                    restore_from_db_file(up_db)
                     st.success("Base restaurada. La app se reiniciará.")
                     st.rerun()
                 except Exception as e:
@@ -772,7 +867,7 @@ def page_backup_restore(
                     st.write(last)
             if st.button("Probar subida Storage (archivo de prueba)", use_container_width=True):
                 try:
-                    test_path = f"_diagnostico/test_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.txt"
+                    test_path = f"_diagnostico/test_{ts}.txt"
                     storage_upload(test_path, b"ok", content_type="text/plain", upsert=True)
                     st.success(f"Subida OK: {test_path}")
                 except Exception as e:
@@ -786,7 +881,7 @@ def page_backup_restore(
 
                 st.stop()
             try:
-                restore_from_backup_zip(up.getvalue())
+                restore_from_backup_zip(up)
                 st.success("Backup restaurado. La app se reiniciará.")
                 st.rerun()
             except Exception as e:
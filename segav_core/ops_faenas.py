@@ -2,10 +2,11 @@ from __future__ import annotations
 
 from datetime import date, datetime
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
-from segav_core.ui import ui_header, ui_tip
+from segav_core.ui import deferred_download_data, fragment, rerun_fragment, ui_header, ui_tip
 from segav_core.kpi_ui import kpi_grid
 
 
@@ -38,16 +39,23 @@ def page_mandantes(*, fetch_df, execute, auto_backup_db):
             SELECT
                 m.id,
                 m.nombre,
-                (SELECT COUNT(*) FROM contratos_faena cf WHERE cf.mandante_id=m.id) AS contratos,
-                (SELECT COUNT(*) FROM faenas f WHERE f.mandante_id=m.id) AS faenas_total,
-                (SELECT COUNT(*) FROM faenas f WHERE f.mandante_id=m.id AND f.estado='ACTIVA') AS faenas_activas
+                COALESCE(cf.n, 0) AS contratos,
+                COALESCE(fa.total, 0) AS faenas_total,
+                COALESCE(fa.activas, 0) AS faenas_activas
             FROM mandantes m
+            LEFT JOIN (
+                SELECT mandante_id, COUNT(*) AS n FROM contratos_faena GROUP BY mandante_id
+            ) cf ON cf.mandante_id=m.id
+            LEFT JOIN (
+                SELECT mandante_id, COUNT(*) AS total, SUM(CASE WHEN estado='ACTIVA' THEN 1 ELSE 0 END) AS activas
+                FROM faenas GROUP BY mandante_id
+            ) fa ON fa.mandante_id=m.id
             ORDER BY m.id DESC
             """
         )
 
         q = st.text_input("Buscar mandante", placeholder="Escribe nombre…", key="mand_q")
-        out = df.copy()
+        out = df
         if q.strip():
             qq = q.strip().lower()
             out = out[out["nombre"].astype(str).str.lower().str.contains(qq, na=False)]
@@ -69,10 +77,11 @@ def page_mandantes(*, fetch_df, execute, auto_backup_db):
             if out.empty:
                 st.info("Sin resultados.")
             else:
+                out_labels = dict(zip(out["id"].tolist(), out["nombre"].tolist()))
                 mid = st.selectbox(
                     "Mandante",
-                    out["id"].tolist(),
-                    format_func=lambda x: out[out["id"] == x].iloc[0]["nombre"],
+                    list(out_labels),
+                    format_func=out_labels.get,
                     key="mand_detail_sel",
                 )
                 row = df[df["id"] == mid].iloc[0]
@@ -132,10 +141,11 @@ def page_mandantes(*, fetch_df, execute, auto_backup_db):
         if df_all.empty:
             st.info("No hay mandantes para gestionar.")
         else:
+            all_labels = dict(zip(df_all["id"].tolist(), df_all["nombre"].tolist()))
             mid = st.selectbox(
                 "Selecciona mandante",
-                df_all["id"].tolist(),
-                format_func=lambda x: df_all[df_all["id"] == x].iloc[0]["nombre"],
+                list(all_labels),
+                format_func=all_labels.get,
                 key="mand_manage_sel",
             )
             row = df_all[df_all["id"] == mid].iloc[0]
@@ -201,6 +211,7 @@ def page_contratos_faena(
     if mand.empty:
         ui_tip("Primero crea un mandante.")
         return
+    mand_labels = dict(zip(mand["id"].tolist(), mand["nombre"].tolist()))
 
     tab1, tab2 = st.tabs(["➕ Crear contrato", "✏️ Editar / Eliminar / Archivo"])
 
@@ -208,8 +219,8 @@ def page_contratos_faena(
         with st.form("form_contrato_faena", clear_on_submit=False):
             mandante_id = st.selectbox(
                 "Mandante",
-                mand["id"].tolist(),
-                format_func=lambda x: mand[mand["id"] == x].iloc[0]["nombre"],
+                list(mand_labels),
+                format_func=mand_labels.get,
             )
             nombre = st.text_input("Nombre contrato de faena", placeholder="Contrato Faena Bellavista")
             fi = st.date_input("Fecha inicio (opcional)", value=None)
@@ -234,13 +245,12 @@ def page_contratos_faena(
                         archivo.getvalue(),
                         getattr(archivo, "type", None) or "application/octet-stream",
                     )
-                    file_path, bucket, object_path = save_file_online(
+                    file_path, bucket, object_path, sha = save_file_online(
                         ["contratos_faena", mandante_id],
                         payload["file_name"],
                         payload["file_bytes"],
                         content_type=payload["content_type"],
                     )
-                    sha = sha256_bytes(payload["file_bytes"])
                     if payload["compressed"] and payload.get("compression_note"):
                         st.info(payload["compression_note"])
 
@@ -285,20 +295,24 @@ def page_contratos_faena(
         st.divider()
         st.markdown("### ✏️ Editar datos del contrato")
 
+        contrato_labels = {
+            cid: f"{cid} - {m} / {n}" for cid, m, n in zip(df["id"].tolist(), df["mandante"].tolist(), df["nombre"].tolist())
+        }
         contrato_id = st.selectbox(
             "Selecciona contrato",
-            df["id"].tolist(),
-            format_func=lambda x: f"{x} - {df[df['id'] == x].iloc[0]['mandante']} / {df[df['id'] == x].iloc[0]['nombre']}",
+            list(contrato_labels),
+            format_func=contrato_labels.get,
             key="sel_contrato_edit",
         )
         row = df[df["id"] == contrato_id].iloc[0]
 
         with st.form("form_edit_contrato"):
+            mand_ids = list(mand_labels)
             mandante_id_new = st.selectbox(
                 "Mandante (cambiar)",
-                mand["id"].tolist(),
-                index=mand["id"].tolist().index(int(row["mandante_id"])) if int(row["mandante_id"]) in mand["id"].tolist() else 0,
-                format_func=lambda x: mand[mand["id"] == x].iloc[0]["nombre"],
+                mand_ids,
+                index=mand_ids.index(int(row["mandante_id"])) if int(row["mandante_id"]) in mand_labels else 0,
+                format_func=mand_labels.get,
             )
             nombre_new = st.text_input("Nombre", value=str(row["nombre"]))
             fi_new = st.date_input("Fecha inicio (opcional)", value=parse_date_maybe(row["fecha_inicio"]))
@@ -332,13 +346,12 @@ def page_contratos_faena(
                     st.error("Debes subir un archivo primero.")
                     st.stop()
                 payload = prepare_upload_payload(up.name, up.getvalue(), getattr(up, "type", None) or "application/octet-stream")
-                file_path, bucket, object_path = save_file_online(
+                file_path, bucket, object_path, sha = save_file_online(
                     ["contratos_faena", "id", contrato_id],
                     payload["file_name"],
                     payload["file_bytes"],
                     content_type=payload["content_type"],
                 )
-                sha = sha256_bytes(payload["file_bytes"])
                 if payload["compressed"] and payload.get("compression_note"):
                     st.info(payload["compression_note"])
                 execute(
@@ -353,7 +366,13 @@ def page_contratos_faena(
             current_bucket = row.get("bucket", None)
             current_object = row.get("object_path", None)
             try:
-                bcur = load_file_anywhere(str(current_path) if current_path else None, current_bucket, current_object)
+                if not (current_path or current_object):
+                    raise FileNotFoundError("Contrato sin archivo.")
+                # El archivo se lee (o se baja de Storage) solo al hacer clic,
+                # no en cada rerun de la página.
+                bcur = deferred_download_data(
+                    lambda: load_file_anywhere(str(current_path) if current_path else None, current_bucket, current_object)
+                )
                 st.download_button(
                     "Descargar archivo actual",
                     data=bcur,
@@ -397,6 +416,7 @@ def page_faenas(
     *,
     fetch_df,
     execute,
+    execute_batch,
     auto_backup_db,
     render_upload_help,
     prepare_upload_payload,
@@ -418,6 +438,7 @@ def page_faenas(
     if mand.empty:
         ui_tip("Primero crea un mandante.")
         return
+    mand_labels = dict(zip(mand["id"].tolist(), mand["nombre"].tolist()))
 
     contratos = fetch_df(
         """
@@ -427,27 +448,33 @@ def page_faenas(
         ORDER BY m.nombre, cf.nombre
         """
     )
+    contrato_nombres = dict(zip(contratos["id"].tolist(), contratos["nombre"].tolist())) if not contratos.empty else {}
+    # Contratos por mandante armados una vez por página: los fragmentos de las
+    # pestañas los reutilizan en sus reruns sin volver a filtrar el DataFrame.
+    contrato_ids_by_mand: dict = {}
+    if not contratos.empty:
+        for cid, mid in zip(contratos["id"].tolist(), contratos["mandante_id"].tolist()):
+            contrato_ids_by_mand.setdefault(mid, []).append(cid)
 
     tab1, tab2, tab3, tab4, tab5 = st.tabs(["➕ Crear faena", "📋 Listado (semáforo)", "📎 Anexos", "✏️ Editar / Eliminar", "🔒 Faenas Cerradas"])
 
-    with tab1:
+    @fragment
+    def _tab_crear():
         mandante_id = st.selectbox(
             "Mandante",
-            mand["id"].tolist(),
-            format_func=lambda x: mand[mand["id"] == x].iloc[0]["nombre"],
+            list(mand_labels),
+            format_func=mand_labels.get,
             key="faena_mandante_sel",
         )
 
-        contratos_m = contratos[contratos["mandante_id"] == mandante_id] if not contratos.empty else pd.DataFrame()
-        contrato_opts = [None] + (contratos_m["id"].tolist() if not contratos_m.empty else [])
+        contrato_opts = [None] + contrato_ids_by_mand.get(mandante_id, [])
 
         def _fmt_contrato(x):
             if x is None:
                 return "(sin contrato asociado)"
-            row = contratos[contratos["id"] == x]
-            if row.empty:
+            if x not in contrato_nombres:
                 return str(x)
-            return f"{int(x)} - {row.iloc[0]['nombre']}"
+            return f"{int(x)} - {contrato_nombres[x]}"
 
         with st.form("form_faena"):
             contrato_id = st.selectbox("Contrato de faena (opcional)", contrato_opts, format_func=_fmt_contrato)
@@ -489,44 +516,41 @@ def page_faenas(
             except Exception as e:
                 st.error(f"No se pudo crear: {e}")
 
-    with tab2:
+    with tab1:
+        _tab_crear()
+
+    @fragment
+    def _tab_listado():
         df = faena_progress_table()
         if df.empty:
             st.info("No hay faenas aún.")
         else:
-            out = df.copy()
-
-            def _semaforo(r):
-                try:
-                    tr = int(r.get("trabajadores", 0) or 0)
-                    pct = float(r.get("cobertura_docs_pct", 0) or 0)
-                    falt = int(r.get("faltantes_total", 0) or 0)
-                except Exception:
-                    tr, pct, falt = 0, 0, 0
-
-                if tr == 0:
-                    return "🔴 CRÍTICO"
-                if falt == 0 and pct >= 100:
-                    return "🟢 OK"
-                if pct >= 70:
-                    return "🟡 PENDIENTE"
-                return "🔴 CRÍTICO"
-
-            out["estado_docs"] = out.apply(_semaforo, axis=1)
-            out["cobertura_%"] = out["cobertura_docs_pct"].round(0).astype(int)
-
-            show = out.rename(columns={"faena_id": "id", "faena": "faena_nombre"})
-            show = show[["estado_docs", "id", "mandante", "faena_nombre", "estado", "fecha_inicio", "fecha_termino", "trabajadores", "trab_ok", "cobertura_%", "faltantes_total"]].copy()
+            tr = pd.to_numeric(df["trabajadores"], errors="coerce").fillna(0)
+            pct = pd.to_numeric(df["cobertura_docs_pct"], errors="coerce").fillna(0)
+            falt = pd.to_numeric(df["faltantes_total"], errors="coerce").fillna(0)
+            # Sin copia intermedia de df: la selección final ya materializa solo lo que se muestra.
+            show = df.rename(columns={"faena_id": "id", "faena": "faena_nombre"}).assign(
+                estado_docs=np.select(
+                    [tr == 0, (falt == 0) & (pct >= 100), pct >= 70],
+                    ["🔴 CRÍTICO", "🟢 OK", "🟡 PENDIENTE"],
+                    default="🔴 CRÍTICO",
+                ),
+                **{"cobertura_%": df["cobertura_docs_pct"].round(0).astype(int)},
+            )[["estado_docs", "id", "mandante", "faena_nombre", "estado", "fecha_inicio", "fecha_termino", "trabajadores", "trab_ok", "cobertura_%", "faltantes_total"]]
             st.dataframe(show, use_container_width=True, hide_index=True)
 
             st.caption("Regla semáforo: 🔴 sin trabajadores o cobertura <70% | 🟡 ≥70% con faltantes | 🟢 100% sin faltantes.")
 
             colq1, colq2, colq3 = st.columns([2, 1, 1])
             with colq1:
+                show_labels = {
+                    i: f"{int(i)} - {m} / {n}"
+                    for i, m, n in zip(show["id"].tolist(), show["mandante"].tolist(), show["faena_nombre"].tolist())
+                }
                 fid = st.selectbox(
                     "Acción rápida: seleccionar faena",
-                    show["id"].tolist(),
-                    format_func=lambda x: f"{int(x)} - {show[show['id'] == x].iloc[0]['mandante']} / {show[show['id'] == x].iloc[0]['faena_nombre']}",
+                    list(show_labels),
+                    format_func=show_labels.get,
                 )
             with colq2:
                 if st.button("Ir a Docs", use_container_width=True):
@@ -539,7 +563,11 @@ def page_faenas(
                     st.session_state["nav_page"] = "Export (ZIP)"
                     st.rerun()
 
-    with tab3:
+    with tab2:
+        _tab_listado()
+
+    @fragment
+    def _tab_anexos():
         base = fetch_df(
             """
             SELECT f.id, m.nombre AS mandante, f.nombre, f.estado, f.fecha_inicio, f.fecha_termino, f.ubicacion,
@@ -555,10 +583,13 @@ def page_faenas(
             st.info("No hay faenas.")
             return
 
+        base_labels = {
+            i: f"{i} - {m} / {n}" for i, m, n in zip(base["id"].tolist(), base["mandante"].tolist(), base["nombre"].tolist())
+        }
         faena_id = st.selectbox(
             "Faena",
-            base["id"].tolist(),
-            format_func=lambda x: f"{x} - {base[base['id'] == x].iloc[0]['mandante']} / {base[base['id'] == x].iloc[0]['nombre']}",
+            list(base_labels),
+            format_func=base_labels.get,
         )
         st.session_state["selected_faena_id"] = int(faena_id)
 
@@ -570,13 +601,12 @@ def page_faenas(
                 st.error("Debes subir un archivo primero.")
                 st.stop()
             payload = prepare_upload_payload(up.name, up.getvalue(), getattr(up, "type", None) or "application/octet-stream")
-            file_path, bucket, object_path = save_file_online(
+            file_path, bucket, object_path, sha = save_file_online(
                 ["faenas", faena_id, "anexos"],
                 payload["file_name"],
                 payload["file_bytes"],
                 content_type=payload["content_type"],
             )
-            sha = sha256_bytes(payload["file_bytes"])
             execute(
                 "INSERT INTO faena_anexos(faena_id, nombre, file_path, bucket, object_path, sha256, created_at) VALUES(?,?,?,?,?,?,?)",
                 (int(faena_id), payload["file_name"], file_path, bucket, object_path, sha, datetime.utcnow().isoformat(timespec="seconds")),
@@ -585,13 +615,18 @@ def page_faenas(
                 st.info(payload["compression_note"])
             st.success("Anexo guardado.")
             auto_backup_db("anexo_faena")
-            st.rerun()
+            # La lista de anexos vive solo en esta pestaña.
+            rerun_fragment()
 
         anexos = fetch_df("SELECT id, nombre, created_at FROM faena_anexos WHERE faena_id=? ORDER BY id DESC", (int(faena_id),))
         st.caption("Anexos cargados")
         st.dataframe(anexos if not anexos.empty else pd.DataFrame([{"info": "(sin anexos)"}]), use_container_width=True)
 
-    with tab4:
+    with tab3:
+        _tab_anexos()
+
+    @fragment
+    def _tab_editar():
         base = fetch_df(
             """
             SELECT f.id, f.mandante_id, m.nombre AS mandante, f.nombre, f.ubicacion, f.fecha_inicio, f.fecha_termino, f.estado,
@@ -606,25 +641,27 @@ def page_faenas(
             st.info("No hay faenas para editar.")
             return
 
+        base_labels = {
+            i: f"{int(i)} - {m} / {n} ({e})"
+            for i, m, n, e in zip(base["id"].tolist(), base["mandante"].tolist(), base["nombre"].tolist(), base["estado"].tolist())
+        }
         fid = st.selectbox(
             "Selecciona faena",
-            base["id"].tolist(),
-            format_func=lambda x: f"{int(x)} - {base[base['id'] == x].iloc[0]['mandante']} / {base[base['id'] == x].iloc[0]['nombre']} ({base[base['id'] == x].iloc[0]['estado']})",
+            list(base_labels),
+            format_func=base_labels.get,
             key="faena_edit_sel",
         )
         st.session_state["selected_faena_id"] = int(fid)
         row = base[base["id"] == int(fid)].iloc[0]
 
-        contratos_m = contratos[contratos["mandante_id"] == int(row["mandante_id"])] if not contratos.empty else pd.DataFrame()
-        contrato_opts = [None] + (contratos_m["id"].tolist() if not contratos_m.empty else [])
+        contrato_opts = [None] + contrato_ids_by_mand.get(int(row["mandante_id"]), [])
 
         def _fmt_contrato_edit_faena(x):
             if x is None:
                 return "(sin contrato asociado)"
-            r2 = contratos_m[contratos_m["id"] == x]
-            if r2.empty:
+            if x not in contrato_nombres:
                 return str(x)
-            return f"{int(x)} - {r2.iloc[0]['nombre']}"
+            return f"{int(x)} - {contrato_nombres[x]}"
 
         default_c = None if pd.isna(row["contrato_faena_id"]) else int(row["contrato_faena_id"])
         contrato_index = contrato_opts.index(default_c) if default_c in contrato_opts else 0
@@ -674,10 +711,13 @@ def page_faenas(
         st.markdown("### 🗑️ Eliminar faena")
         st.caption("Se eliminará la faena y sus anexos/asignaciones asociadas. Los trabajadores NO se eliminan.")
 
-        dep1 = fetch_df("SELECT COUNT(*) AS n FROM asignaciones WHERE faena_id=?", (int(fid),))
-        dep2 = fetch_df("SELECT COUNT(*) AS n FROM faena_anexos WHERE faena_id=?", (int(fid),))
-        n_asg = int(dep1["n"].iloc[0]) if not dep1.empty else 0
-        n_anx = int(dep2["n"].iloc[0]) if not dep2.empty else 0
+        dep = fetch_df(
+            "SELECT COUNT(*) AS n_asg, (SELECT COUNT(*) FROM faena_anexos x WHERE x.faena_id=?) AS n_anx FROM asignaciones a WHERE a.faena_id=?",
+            (int(fid), int(fid)),
+        )
+        dep_row = dep.iloc[0] if not dep.empty else {}
+        n_asg = int(dep_row.get("n_asg") or 0)
+        n_anx = int(dep_row.get("n_anx") or 0)
 
         st.warning(f"Dependencias: {n_asg} asignaciones · {n_anx} anexos")
 
@@ -690,10 +730,12 @@ def page_faenas(
                 refs = []
                 refs.extend(fetch_file_refs("faena_anexos", "faena_id=?", (int(fid),)))
                 refs.extend(fetch_file_refs("faena_empresa_documentos", "faena_id=?", (int(fid),)))
-                execute("DELETE FROM faena_anexos WHERE faena_id=?", (int(fid),))
-                execute("DELETE FROM faena_empresa_documentos WHERE faena_id=?", (int(fid),))
-                execute("DELETE FROM asignaciones WHERE faena_id=?", (int(fid),))
-                execute("DELETE FROM faenas WHERE id=?", (int(fid),))
+                execute_batch([
+                    ("DELETE FROM faena_anexos WHERE faena_id=?", (int(fid),)),
+                    ("DELETE FROM faena_empresa_documentos WHERE faena_id=?", (int(fid),)),
+                    ("DELETE FROM asignaciones WHERE faena_id=?", (int(fid),)),
+                    ("DELETE FROM faenas WHERE id=?", (int(fid),)),
+                ])
                 cleanup_issues = cleanup_deleted_file_refs(refs)
                 if cleanup_issues:
                     st.error("Faena eliminada, pero hubo problemas al limpiar archivos asociados: " + " | ".join(cleanup_issues))
@@ -705,8 +747,12 @@ def page_faenas(
             except Exception as e:
                 st.error(f"No se pudo eliminar: {e}")
 
+    with tab4:
+        _tab_editar()
+
     # ── TAB 5: FAENAS CERRADAS ─────────────────────────────────────────────
-    with tab5:
+    @fragment
+    def _tab_cerradas():
         import re as _re
         st.markdown("### 🔒 Faenas Cerradas — Historial y descarga de documentos")
         st.caption("Aquí aparecen las faenas con estado TERMINADA. Puedes descargar el ZIP completo con todos sus documentos.")
@@ -749,14 +795,14 @@ def page_faenas(
 
             fid_opts = view["id"].tolist()
             if fid_opts:
+                closed_labels = {
+                    int(r["id"]): f"{int(r['id'])} — {r['mandante']} / {r['nombre']} ({r.get('fecha_termino', '') or 'sin fecha'})"
+                    for r in view.to_dict("records")
+                }
                 fid_sel = st.selectbox(
                     "Selecciona faena",
                     fid_opts,
-                    format_func=lambda x: (
-                        f"{int(x)} — {view[view['id']==x].iloc[0]['mandante']} / "
-                        f"{view[view['id']==x].iloc[0]['nombre']} "
-                        f"({view[view['id']==x].iloc[0].get('fecha_termino','') or 'sin fecha'})"
-                    ),
+                    format_func=lambda x: closed_labels.get(int(x), str(x)),
                     key="closed_fid_sel",
                 )
                 row_c = view[view["id"] == fid_sel].iloc[0]
@@ -786,66 +832,71 @@ def page_faenas(
                         except Exception as e:
                             st.error(f"No se pudo generar el ZIP: {e}")
 
+    with tab5:
+        _tab_cerradas()
+
+
+def _faena_zip_entries(faena_id: int, fetch_df) -> list:
+    """Entradas (arcpath, file_path, bucket, object_path) del ZIP de una faena cerrada."""
+    import os
+
+    entries = []
+
+    def _arc(prefix: str, fname) -> str:
+        return f"{prefix}/{os.path.basename(str(fname))}"
+
+    # Contrato
+    cont = fetch_df("SELECT file_path, nombre FROM contratos_faena WHERE id=(SELECT contrato_faena_id FROM faenas WHERE id=?)", (int(faena_id),))
+    if cont is not None and not cont.empty:
+        r = cont.iloc[0]
+        entries.append((_arc("Contrato", r.get("file_path") or "contrato"), r.get("file_path"), None, None))
+
+    # Anexos
+    anx = fetch_df("SELECT nombre, file_path FROM faena_anexos WHERE faena_id=? ORDER BY id", (int(faena_id),))
+    if anx is not None and not anx.empty:
+        entries.extend((_arc("Anexos", r.get("file_path") or "anexo"), r.get("file_path"), None, None) for r in anx.to_dict("records"))
+
+    # Docs empresa faena
+    emp = fetch_df("SELECT doc_tipo, nombre_archivo, file_path FROM faena_empresa_documentos WHERE faena_id=? ORDER BY doc_tipo,id", (int(faena_id),))
+    if emp is not None and not emp.empty:
+        entries.extend(
+            (_arc("Docs_Empresa", r.get("nombre_archivo") or r.get("file_path") or "doc"), r.get("file_path"), None, None)
+            for r in emp.to_dict("records")
+        )
+
+    # Docs trabajadores: una sola consulta para todos los asignados
+    docs = fetch_df("""
+        SELECT t.apellidos||' '||t.nombres AS nombre, d.doc_tipo, d.nombre_archivo, d.file_path
+        FROM asignaciones a
+        JOIN trabajadores t ON t.id=a.trabajador_id
+        JOIN trabajador_documentos d ON d.trabajador_id=t.id
+        WHERE a.faena_id=?
+        ORDER BY t.apellidos, t.nombres, d.doc_tipo, d.id
+    """, (int(faena_id),))
+    if docs is not None and not docs.empty:
+        for r in docs.to_dict("records"):
+            folder = str(r.get("nombre"))[:35].replace("/", "_")
+            fname = r.get("nombre_archivo") or r.get("file_path") or "doc"
+            entries.append((_arc(f"Trabajadores/{folder}", fname), r.get("file_path"), None, None))
+    return entries
+
 
 def _build_faena_zip(faena_id: int, faena_nombre: str, fetch_df) -> bytes:
-    """Genera un ZIP con todos los documentos de una faena cerrada."""
-    import io, zipfile, os
-
-    mem = io.BytesIO()
-    added = 0
-
-    def _read(file_path, bucket, object_path):
-        if file_path and os.path.exists(str(file_path)):
-            with open(str(file_path), "rb") as f:
-                return f.read()
-        return None
-
-    with zipfile.ZipFile(mem, "w", zipfile.ZIP_DEFLATED) as zf:
-        # Contrato
-        cont = fetch_df("SELECT file_path, nombre FROM contratos_faena WHERE id=(SELECT contrato_faena_id FROM faenas WHERE id=?)", (int(faena_id),))
-        if cont is not None and not cont.empty:
-            r = cont.iloc[0]
-            b = _read(r.get("file_path"), None, None)
-            if b:
-                zf.writestr(f"Contrato/{os.path.basename(str(r.get('file_path','contrato')))}",b)
-                added += 1
-
-        # Anexos
-        anx = fetch_df("SELECT nombre, file_path FROM faena_anexos WHERE faena_id=? ORDER BY id", (int(faena_id),))
-        if anx is not None and not anx.empty:
-            for _, r in anx.iterrows():
-                b = _read(r.get("file_path"), None, None)
-                if b:
-                    zf.writestr(f"Anexos/{os.path.basename(str(r.get('file_path','anexo')))}",b)
-                    added += 1
-
-        # Docs empresa faena
-        emp = fetch_df("SELECT doc_tipo, nombre_archivo, file_path FROM faena_empresa_documentos WHERE faena_id=? ORDER BY doc_tipo,id", (int(faena_id),))
-        if emp is not None and not emp.empty:
-            for _, r in emp.iterrows():
-                b = _read(r.get("file_path"), None, None)
-                if b:
-                    fname = str(r.get("nombre_archivo") or r.get("file_path") or "doc")
-                    zf.writestr(f"Docs_Empresa/{os.path.basename(fname)}",b)
-                    added += 1
-
-        # Docs trabajadores
-        trab = fetch_df("""
-            SELECT t.rut, t.apellidos||' '||t.nombres AS nombre
-            FROM asignaciones a JOIN trabajadores t ON t.id=a.trabajador_id
-            WHERE a.faena_id=? ORDER BY t.apellidos,t.nombres
-        """, (int(faena_id),))
-        if trab is not None and not trab.empty:
-            for _, tr in trab.iterrows():
-                docs = fetch_df("SELECT doc_tipo, nombre_archivo, file_path FROM trabajador_documentos WHERE trabajador_id=(SELECT id FROM trabajadores WHERE rut=?) ORDER BY doc_tipo,id", (str(tr["rut"]),))
-                if docs is None or docs.empty:
-                    continue
-                folder = str(tr["nombre"])[:35].replace("/","_")
-                for _, dr in docs.iterrows():
-                    b = _read(dr.get("file_path"), None, None)
-                    if b:
-                        fname = str(dr.get("nombre_archivo") or dr.get("file_path") or "doc")
-                        zf.writestr(f"Trabajadores/{folder}/{os.path.basename(fname)}",b)
-                        added += 1
-
-    return mem.getvalue(), added
+    """Genera un ZIP con todos los documentos de una faena cerrada.
+
+    Usa el mismo armador que el export principal (build_zip_from_entries): los
+    archivos se copian por streaming desde disco y los que faltan se omiten.
+    """
+    import os
+    from segav_core.export_utils import build_zip_from_entries
+
+    def _local(file_path, bucket, object_path):
+        return str(file_path) if file_path and os.path.isfile(str(file_path)) else None
+
+    def _missing(file_path, bucket, object_path):
+        raise FileNotFoundError(str(file_path or ""))
+
+    zip_bytes, added, _skipped, _names = build_zip_from_entries(
+        _faena_zip_entries(faena_id, fetch_df), _missing, resolve_local_path=_local
+    )
+    return zip_bytes, added
@@ -5,8 +5,131 @@ from datetime import date, datetime
 import pandas as pd
 import streamlit as st
 
-from segav_core.ui import ui_header, ui_tip
+from segav_core.ui import faena_select_options, fetch_faenas_with_mandante, fragment, rerun_fragment, ui_header, ui_tip
 from segav_core.kpi_ui import kpi_card, tone_for_percentage
+from segav_core.formatters import to_text_date
+from segav_core.search import MIN_QUERY_LEN
+
+# Motor Excel opcional: python-calamine (Rust) parsea .xlsx varias veces más
+# rápido que openpyxl. Requiere pandas >= 2.2; si no, se usa el default.
+try:
+    import python_calamine  # noqa: F401
+    _EXCEL_ENGINE = "calamine"
+except Exception:
+    _EXCEL_ENGINE = None
+
+# Columnas (normalizadas con norm_col) que usan las cargas de trabajadores.
+_IMPORT_COLS = frozenset({"rut", "nombre", "cargo", "centro_costo", "email", "fecha_de_contrato", "fecha_contrato", "vigencia_examen"})
+
+
+def _open_import_excel(up):
+    if _EXCEL_ENGINE:
+        try:
+            return pd.ExcelFile(up, engine=_EXCEL_ENGINE)
+        except ValueError:
+            up.seek(0)
+    return pd.ExcelFile(up)
+
+
+def _read_import_sheet(xls, sheet, norm_col):
+    """Lee solo las columnas conocidas de la hoja y las deja con nombre normalizado."""
+    raw = pd.read_excel(xls, sheet_name=sheet, usecols=lambda c: norm_col(str(c)) in _IMPORT_COLS)
+    return raw.rename(columns={c: norm_col(str(c)) for c in raw.columns})
+
+
+def _import_upload_sheet(up, norm_col, *, state_key: str, sheet_key: str):
+    """Selector de hoja + DataFrame del Excel subido, parseado una vez por archivo y hoja.
+
+    Cada rerun (checkbox, fecha, botón) volvía a abrir el libro y a leer la
+    hoja completa. Se guardan en ``st.session_state[state_key]`` los nombres
+    de hoja y las hojas ya leídas mientras no cambie el archivo subido.
+    """
+    file_id = getattr(up, "file_id", None) or (getattr(up, "name", ""), getattr(up, "size", None))
+    cache = st.session_state.get(state_key)
+    xls = None
+    if not cache or cache.get("id") != file_id:
+        xls = _open_import_excel(up)
+        cache = {"id": file_id, "sheet_names": list(xls.sheet_names), "frames": {}}
+        st.session_state[state_key] = cache
+    sheet = st.selectbox("Hoja", cache["sheet_names"], index=0, key=sheet_key)
+    if sheet not in cache["frames"]:
+        if xls is None:
+            up.seek(0)
+            xls = _open_import_excel(up)
+        cache["frames"][sheet] = _read_import_sheet(xls, sheet, norm_col)
+    return cache["frames"][sheet]
+
+
+def _import_text_col(df, col: str):
+    """Columna de texto limpia (NaN/None -> ""); "" si la columna no viene."""
+    if col not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    s = df[col]
+    return s.where(s.notna(), "").astype(str).str.strip()
+
+
+def _import_date_col(df, col: str | None):
+    """Fechas como texto YYYY-MM-DD (o el texto original) y None si están vacías."""
+    if not col or col not in df.columns:
+        return pd.Series([None] * len(df), index=df.index, dtype=object)
+    s = df[col]
+    if pd.api.types.is_datetime64_any_dtype(s):
+        out = s.dt.strftime("%Y-%m-%d").astype(object)
+    else:
+        out = s.map(to_text_date).astype(object)
+    return out.where(s.notna(), None)
+
+
+def _normalize_trabajadores_import(df, clean_rut) -> tuple:
+    """Normaliza el Excel de trabajadores por columnas en vez de fila a fila.
+
+    Devuelve ``(rows, skipped)``: ``rows`` son tuplas listas para
+    ``trabajadores_bulk_upsert`` y ``skipped`` las filas sin RUT o sin nombre.
+    El nombre se separa igual que ``split_nombre_completo``: con 4+ palabras
+    las dos últimas son apellidos, con 2-3 solo la última.
+    """
+    rut_raw = df["rut"].where(df["rut"].notna(), "")
+    rut = rut_raw.map(lambda v: clean_rut(str(v or "")))
+    nombre = _import_text_col(df, "nombre").str.split().str.join(" ").fillna("")
+    bad = {"", "nan", "none"}
+    ok = ~rut.str.lower().isin(bad) & ~nombre.str.lower().isin(bad)
+    skipped = int((~ok).sum())
+    if not ok.any():
+        return [], skipped
+
+    nombre = nombre[ok]
+    ntok = nombre.str.count(" ") + 1
+    tail1 = nombre.str.rsplit(" ", n=1)
+    tail2 = nombre.str.rsplit(" ", n=2)
+    nombres = nombre.where(ntok < 2, tail1.str[0]).where(ntok < 4, tail2.str[0])
+    apellidos = pd.Series("", index=nombre.index, dtype=object)
+    apellidos = apellidos.where(ntok < 2, tail1.str[-1]).where(ntok < 4, tail2.str[-2] + " " + tail2.str[-1])
+
+    fc_col = "fecha_de_contrato" if "fecha_de_contrato" in df.columns else ("fecha_contrato" if "fecha_contrato" in df.columns else None)
+    cols = [
+        rut[ok],
+        nombres,
+        apellidos,
+        _import_text_col(df, "cargo")[ok],
+        _import_text_col(df, "centro_costo")[ok],
+        _import_text_col(df, "email")[ok],
+        _import_date_col(df, fc_col)[ok],
+        _import_date_col(df, "vigencia_examen")[ok],
+    ]
+    return list(zip(*(c.tolist() for c in cols))), skipped
+
+
+def _dedupe_import_rows(rows, *, keep_last: bool = True) -> tuple:
+    """Deja una fila por RUT: la última (si se sobrescribe) o la primera.
+
+    Es lo que dejaría el upsert fila a fila, sin mandar los repetidos a la base.
+    Devuelve ``(rows, duplicados)``.
+    """
+    by_rut = {}
+    for row in rows:
+        if keep_last or row[0] not in by_rut:
+            by_rut[row[0]] = row
+    return list(by_rut.values()), len(rows) - len(by_rut)
 
 def page_trabajadores(
     *,
@@ -26,6 +149,9 @@ def page_trabajadores(
     trabajador_insert_or_update,
     apply_pending_trabajador_create_reset,
     show_pending_trabajador_create_flash,
+    trabajadores_bulk_upsert,
+    execute_batch,
+    trabajadores_listing,
 ):
     ui_header("Trabajadores", "Carga masiva por Excel o gestión manual. Puedes crear, editar o eliminar trabajadores. Luego asigna a faenas y adjunta documentos.")
     tab_list, tab_gestion, tab_import, tab_mass_docs = st.tabs(["📋 Listado", "🧩 Gestión", "📥 Importar Excel", "📦 Importar Docs Masivo"])
@@ -33,7 +159,8 @@ def page_trabajadores(
     # -------------------------
     # Tab 1: Importación Excel
     # -------------------------
-    with tab_import:
+    @fragment
+    def _tab_importar():
         st.write("Columnas: **RUT, NOMBRE** (obligatorias) y opcionales: CARGO, CENTRO_COSTO, EMAIL, FECHA DE CONTRATO, VIGENCIA_EXAMEN.")
         st.download_button(
             "⬇️ Descargar plantilla Excel de trabajadores",
@@ -46,12 +173,7 @@ def page_trabajadores(
         up = st.file_uploader("Sube Excel (.xlsx)", type=["xlsx"], key="up_excel_trabajadores")
         if up is not None:
             try:
-                xls = pd.ExcelFile(up)
-                sheet = st.selectbox("Hoja", xls.sheet_names, index=0, key="sheet_excel_trab")
-                raw = pd.read_excel(xls, sheet_name=sheet)
-
-                colmap = {c: norm_col(str(c)) for c in raw.columns}
-                df = raw.rename(columns=colmap).copy()
+                df = _import_upload_sheet(up, norm_col, state_key="_import_xls_trab", sheet_key="sheet_excel_trab")
 
                 st.caption("Vista previa (primeras 10 filas)")
                 st.dataframe(df.head(10), use_container_width=True)
@@ -62,77 +184,29 @@ def page_trabajadores(
                     overwrite = st.checkbox("Sobrescribir si el RUT ya existe", value=True, key="ow_excel_trab")
 
                     if st.button("Importar Excel ahora", type="primary", key="btn_import_excel_trab"):
-                        existing_set = set(fetch_df("SELECT rut FROM trabajadores")["rut"].astype(str).tolist())
-
-                        rows = inserted = updated = skipped = 0
-                        has_cargo = "cargo" in df.columns
-                        has_cc = "centro_costo" in df.columns
-                        has_email = "email" in df.columns
-                        fc_col = "fecha_de_contrato" if "fecha_de_contrato" in df.columns else ("fecha_contrato" if "fecha_contrato" in df.columns else None)
-                        has_ve = "vigencia_examen" in df.columns
-
-                        def _to_text_date_import_excel(v):
-                            if v is None or pd.isna(v):
-                                return None
-                            if isinstance(v, datetime):
-                                return str(v.date())
-                            if isinstance(v, date):
-                                return str(v)
-                            return str(v)
-
-                        with conn() as c:
-                            for _, r in df.iterrows():
-                                rows += 1
-                                rut = clean_rut(str(r.get("rut", "") or ""))
-                                nombre = str(r.get("nombre", "") or "").strip()
-
-                                if not rut or rut.lower() in ("nan", "none"):
-                                    skipped += 1
-                                    continue
-                                if not nombre or nombre.lower() in ("nan", "none"):
-                                    skipped += 1
-                                    continue
-
-                                nombres, apellidos = split_nombre_completo(nombre)
-                                cargo = str(r.get("cargo", "") or "").strip() if has_cargo else ""
-                                centro_costo = str(r.get("centro_costo", "") or "").strip() if has_cc else ""
-                                email = str(r.get("email", "") or "").strip() if has_email else ""
-                                fecha_contrato = _to_text_date_import_excel(r.get(fc_col)) if fc_col else None
-                                vigencia_examen = _to_text_date_import_excel(r.get("vigencia_examen")) if has_ve else None
-
-                                action, _tid = trabajador_insert_or_update(
-                                    c,
-                                    rut=rut,
-                                    nombres=nombres,
-                                    apellidos=apellidos,
-                                    cargo=cargo,
-                                    centro_costo=centro_costo,
-                                    email=email,
-                                    fecha_contrato=fecha_contrato,
-                                    vigencia_examen=vigencia_examen,
-                                    overwrite=overwrite,
-                                    existing_id=None,
-                                )
-                                if action == "inserted":
-                                    inserted += 1
-                                elif action == "updated":
-                                    updated += 1
-                                else:
-                                    skipped += 1
-                                existing_set.add(rut)
-
-                            c.commit()
-
-                        st.success(f"Importación lista. Filas leídas: {rows} | Insertados: {inserted} | Actualizados: {updated} | Omitidos: {skipped}")
+                        # Normalización por columnas (sin iterrows) y grabado en un
+                        # solo executemany/transacción.
+                        rows = len(df)
+                        rows_ins, skipped = _normalize_trabajadores_import(df, clean_rut)
+                        rows_ins, dupes = _dedupe_import_rows(rows_ins, keep_last=overwrite)
+                        res = trabajadores_bulk_upsert(rows_ins, overwrite=overwrite)
+                        inserted, updated = res["inserted"], res["updated"]
+                        skipped += res["skipped"]
+
+                        st.success(f"Importación lista. Filas leídas: {rows} | Insertados: {inserted} | Actualizados: {updated} | Omitidos: {skipped} | RUT repetidos: {dupes}")
                         auto_backup_db("import_excel")
                         st.rerun()
             except Exception as e:
                 st.error(f"No se pudo leer/importar el Excel: {e}")
 
+    with tab_import:
+        _tab_importar()
+
     # -------------------------
     # Tab 2: Gestión (crear/editar/eliminar)
     # -------------------------
-    with tab_gestion:
+    @fragment
+    def _tab_gestion():
         t_create, t_edit = st.tabs(["➕ Crear", "✏️ Editar / 🗑️ Eliminar"])
 
         with t_create:
@@ -191,12 +265,12 @@ def page_trabajadores(
                 st.info("No hay trabajadores aún.")
                 return
 
-            def _fmt_trab_edit(x):
-                r = df[df["id"] == x].iloc[0]
-                return f"{r['apellidos']} {r['nombres']} ({r['rut']})"
-
-            tid = st.selectbox("Selecciona trabajador", df["id"].tolist(), format_func=_fmt_trab_edit, key="trab_edit_sel")
-            row = df[df["id"] == tid].iloc[0]
+            trab_labels = {
+                i: f"{a} {n} ({r})"
+                for i, a, n, r in zip(df["id"].tolist(), df["apellidos"].tolist(), df["nombres"].tolist(), df["rut"].tolist())
+            }
+            tid = st.selectbox("Selecciona trabajador", df["id"].tolist(), format_func=lambda x: trab_labels.get(x, str(x)), key="trab_edit_sel")
+            row = df.set_index("id", drop=False).loc[tid]
 
             st.markdown("### ✏️ Editar trabajador")
             edit_prefix = f"trabajador_edit_{int(tid)}"
@@ -258,13 +332,22 @@ def page_trabajadores(
             st.markdown("### 🗑️ Eliminar trabajador")
             st.caption("Se eliminarán también sus asignaciones a faenas y sus documentos. La app intentará limpiar además los archivos físicos que ya no queden referenciados.")
 
-            dep_asg = fetch_df("SELECT COUNT(*) AS n FROM asignaciones WHERE trabajador_id=?", (int(tid),))
-            dep_docs = fetch_df("SELECT COUNT(*) AS n FROM trabajador_documentos WHERE trabajador_id=?", (int(tid),))
-            dep_faenas = fetch_df("SELECT COUNT(DISTINCT faena_id) AS n FROM asignaciones WHERE trabajador_id=?", (int(tid),))
-
-            n_asg = int(dep_asg["n"].iloc[0]) if not dep_asg.empty else 0
-            n_docs = int(dep_docs["n"].iloc[0]) if not dep_docs.empty else 0
-            n_faenas = int(dep_faenas["n"].iloc[0]) if not dep_faenas.empty else 0
+            # Las tres dependencias en una sola consulta (el FROM externo sigue
+            # siendo asignaciones, así el filtro de tenant se inyecta igual).
+            dep = fetch_df(
+                """
+                SELECT COUNT(*) AS n_asg,
+                       COUNT(DISTINCT a.faena_id) AS n_faenas,
+                       (SELECT COUNT(*) FROM trabajador_documentos td WHERE td.trabajador_id=?) AS n_docs
+                FROM asignaciones a
+                WHERE a.trabajador_id=?
+                """,
+                (int(tid), int(tid)),
+            )
+            dep_row = dep.iloc[0] if not dep.empty else {}
+            n_asg = int(dep_row.get("n_asg") or 0)
+            n_docs = int(dep_row.get("n_docs") or 0)
+            n_faenas = int(dep_row.get("n_faenas") or 0)
 
             st.warning(f"Dependencias: {n_asg} asignaciones (en {n_faenas} faenas) · {n_docs} documentos")
 
@@ -275,9 +358,11 @@ def page_trabajadores(
                     st.stop()
                 try:
                     refs = fetch_file_refs("trabajador_documentos", "trabajador_id=?", (int(tid),))
-                    execute("DELETE FROM asignaciones WHERE trabajador_id=?", (int(tid),))
-                    execute("DELETE FROM trabajador_documentos WHERE trabajador_id=?", (int(tid),))
-                    execute("DELETE FROM trabajadores WHERE id=?", (int(tid),))
+                    execute_batch([
+                        ("DELETE FROM asignaciones WHERE trabajador_id=?", (int(tid),)),
+                        ("DELETE FROM trabajador_documentos WHERE trabajador_id=?", (int(tid),)),
+                        ("DELETE FROM trabajadores WHERE id=?", (int(tid),)),
+                    ])
                     cleanup_issues = cleanup_deleted_file_refs(refs)
                     if cleanup_issues:
                         st.error("Trabajador eliminado, pero hubo problemas al limpiar archivos asociados: " + " | ".join(cleanup_issues))
@@ -288,37 +373,15 @@ def page_trabajadores(
                 except Exception as e:
                     st.error(f"No se pudo eliminar: {e}")
 
+    with tab_gestion:
+        _tab_gestion()
+
     # -------------------------
     # Tab 3: Listado
     # -------------------------
-    with tab_list:
-        df = fetch_df(
-            """
-            SELECT
-                t.id,
-                t.rut,
-                t.apellidos,
-                t.nombres,
-                t.cargo,
-                COALESCE(
-                    (
-                        SELECT f.nombre
-                        FROM asignaciones a
-                        JOIN faenas f ON f.id = a.faena_id
-                        WHERE a.trabajador_id = t.id
-                          AND COALESCE(NULLIF(TRIM(UPPER(a.estado)), ''), 'ACTIVA') <> 'CERRADA'
-                        ORDER BY a.id DESC
-                        LIMIT 1
-                    ),
-                    'PLANTA'
-                ) AS faena_actual,
-                t.email,
-                t.fecha_contrato,
-                t.vigencia_examen
-            FROM trabajadores t
-            ORDER BY t.id DESC
-            """
-        )
+    @fragment
+    def _tab_listado():
+        df = trabajadores_listing()
         q = st.text_input("🔍 Buscar", placeholder="RUT, nombre, cargo o faena", key="q_trab_list")
         # ── Filtros avanzados ─────────────────────────────────────────────────
         with st.expander("Filtros avanzados", expanded=False):
@@ -330,16 +393,14 @@ def page_trabajadores(
                 faenas_uniq = ["(Todas)"] + sorted(df["faena_actual"].dropna().astype(str).unique().tolist())
                 filtro_faena = st.selectbox("Faena actual", faenas_uniq, key="trab_f_faena")
 
-        out = df.copy()
-        if q.strip():
-            qq = q.strip().lower()
-            out = out[
-                out["rut"].astype(str).str.lower().str.contains(qq, na=False) |
-                out["apellidos"].astype(str).str.lower().str.contains(qq, na=False) |
-                out["nombres"].astype(str).str.lower().str.contains(qq, na=False) |
-                out["cargo"].astype(str).str.lower().str.contains(qq, na=False) |
-                out["faena_actual"].astype(str).str.lower().str.contains(qq, na=False)
-            ]
+        # Los filtros devuelven frames nuevos y nada modifica ``out`` in-place:
+        # no hace falta copiar el listado completo.
+        out = df
+        if len(q.strip()) >= MIN_QUERY_LEN:
+            # Filtrado cacheado por texto de búsqueda: teclear de nuevo una
+            # búsqueda ya hecha no vuelve a recorrer el listado. Con un solo
+            # carácter casi todo coincide, así que se muestra el listado completo.
+            out = trabajadores_listing(q)
         if filtro_cargo != "(Todos)":
             out = out[out["cargo"].astype(str) == filtro_cargo]
         if filtro_faena != "(Todas)":
@@ -378,8 +439,7 @@ def page_trabajadores(
             try:
                 import io
                 buf = io.BytesIO()
-                export_df = out.copy()
-                export_df = export_df.rename(columns={
+                export_df = out.rename(columns={
                     "rut": "RUT", "apellidos": "Apellidos", "nombres": "Nombres",
                     "cargo": "Cargo", "faena_actual": "Faena actual", "email": "Email",
                     "fecha_contrato": "Fecha de contrato", "vigencia_examen": "Vigencia examen",
@@ -397,8 +457,12 @@ def page_trabajadores(
             except Exception as _e:
                 st.caption(f"⚠️ No se pudo generar Excel: {_e}")
 
+    with tab_list:
+        _tab_listado()
+
     # ── Tab: Importar documentos masivo ───────────────────────────────────
-    with tab_mass_docs:
+    @fragment
+    def _tab_docs_masivo():
         st.markdown("### 📦 Importación masiva de documentos")
         st.caption(
             "Sube un archivo ZIP con carpetas nombradas por **RUT** del trabajador. "
@@ -420,9 +484,11 @@ documentos/
 
         up_zip = st.file_uploader("Sube archivo ZIP", type=["zip"], key="mass_docs_zip")
         if up_zip is not None and st.button("📥 Procesar ZIP", type="primary", use_container_width=True, key="mass_docs_process"):
-            import zipfile, io, os as _os
+            import zipfile, hashlib, os as _os
             try:
-                zf = zipfile.ZipFile(io.BytesIO(up_zip.getvalue()))
+                # UploadedFile ya es un buffer en memoria: se abre directo, sin copiarlo.
+                up_zip.seek(0)
+                zf = zipfile.ZipFile(up_zip)
                 names = zf.namelist()
 
                 # Group files by RUT folder
@@ -437,12 +503,21 @@ documentos/
                 if not rut_files:
                     st.error("No se encontraron carpetas con RUT válidos en el ZIP.")
                 else:
-                    # Match with existing workers
-                    existing = fetch_df("SELECT id, rut FROM trabajadores")
+                    # Match with existing workers: solo los RUT del ZIP (WHERE IN por
+                    # bloques); si falta alguno se revisa la tabla completa por si hay
+                    # RUT guardados con otro formato.
                     rut_to_id = {}
-                    if existing is not None and not existing.empty:
-                        for _, r in existing.iterrows():
-                            rut_to_id[clean_rut(str(r["rut"]))] = int(r["id"])
+                    zip_ruts = list(rut_files)
+                    for start in range(0, len(zip_ruts), 500):
+                        chunk = zip_ruts[start:start + 500]
+                        found = fetch_df(f"SELECT id, rut FROM trabajadores WHERE rut IN ({','.join(['?'] * len(chunk))}) ORDER BY id", tuple(chunk))
+                        if found is not None and not found.empty:
+                            rut_to_id.update(zip(found["rut"].astype(str).tolist(), found["id"].astype(int).tolist()))
+                    if len(rut_to_id) < len(rut_files):
+                        existing = fetch_df("SELECT id, rut FROM trabajadores")
+                        if existing is not None and not existing.empty:
+                            for rut, tid in zip(existing["rut"].astype(str).map(clean_rut).tolist(), existing["id"].astype(int).tolist()):
+                                rut_to_id.setdefault(rut, tid)
 
                     imported = skipped = not_found = 0
                     for rut, files in rut_files.items():
@@ -452,17 +527,19 @@ documentos/
                             continue
                         for fname in files:
                             try:
-                                file_bytes = zf.read(fname)
                                 basename = _os.path.basename(fname)
                                 doc_tipo = _os.path.splitext(basename)[0].upper().replace(" ", "_")
-                                # Save to disk
+                                # Save to disk: se descomprime por bloques y se hashea
+                                # mientras se escribe (una pasada, sin el archivo entero en RAM).
                                 save_dir = _os.path.join("uploads", "trabajadores", rut)
                                 _os.makedirs(save_dir, exist_ok=True)
                                 save_path = _os.path.join(save_dir, basename)
-                                with open(save_path, "wb") as fp:
-                                    fp.write(file_bytes)
-                                from hashlib import sha256
-                                sha = sha256(file_bytes).hexdigest()
+                                h = hashlib.sha256()
+                                with zf.open(fname) as src, open(save_path, "wb") as fp:
+                                    for block in iter(lambda: src.read(1 << 20), b""):
+                                        h.update(block)
+                                        fp.write(block)
+                                sha = h.hexdigest()
                                 execute(
                                     "INSERT INTO trabajador_documentos(trabajador_id, doc_tipo, nombre_archivo, file_path, sha256, created_at) VALUES(?,?,?,?,?,?)",
                                     (tid, doc_tipo, basename, save_path, sha,
@@ -477,10 +554,13 @@ documentos/
                     if not_found:
                         missing_ruts = [r for r in rut_files if r not in rut_to_id]
                         st.warning(f"RUTs no encontrados: {', '.join(missing_ruts[:10])}")
-                    st.rerun()
+                    rerun_fragment()
             except Exception as e:
                 st.error(f"Error al procesar ZIP: {e}")
 
+    with tab_mass_docs:
+        _tab_docs_masivo()
+
 
 def page_asignar_trabajadores(
     *,
@@ -488,6 +568,7 @@ def page_asignar_trabajadores(
     conn,
     cursor_execute,
     ASSIGNACION_INSERT_SQL,
+    db_transaction,
     clear_app_caches,
     auto_backup_db,
     build_trabajadores_template_xlsx,
@@ -497,26 +578,24 @@ def page_asignar_trabajadores(
     executemany,
     go,
     trabajador_insert_or_update,
+    trabajadores_bulk_upsert,
     current_tenant_key=None,
 ):
     ui_header("Asignar Trabajadores", "Carga e incorpora trabajadores por faena. Si un trabajador se repite en otra faena, mantiene su documentación ya cargada.")
     _ck = str(current_tenant_key() if callable(current_tenant_key) else (current_tenant_key or "")).strip()
-    faenas = fetch_df('''
-        SELECT f.id, m.nombre AS mandante, f.nombre
-        FROM faenas f JOIN mandantes m ON m.id=f.mandante_id
-        ORDER BY f.id DESC
-    ''')
+    faenas = fetch_faenas_with_mandante(fetch_df)
     if faenas.empty:
         ui_tip("Crea faenas primero.")
         return
 
     col1, col2 = st.columns([2, 1])
     with col1:
+        opts, _idx, faena_labels = faena_select_options(faenas, with_estado=False)
         faena_id = st.selectbox(
             "Faena",
-            faenas["id"].tolist(),
+            opts,
             key="asignar_trabajadores_faena_select",
-            format_func=lambda x: f"{x} - {faenas[faenas['id']==x].iloc[0]['mandante']} / {faenas[faenas['id']==x].iloc[0]['nombre']}",
+            format_func=faena_labels.get,
         )
     with col2:
         st.session_state["selected_faena_id"] = int(faena_id)
@@ -534,18 +613,24 @@ def page_asignar_trabajadores(
 
         asignados = fetch_df("SELECT trabajador_id FROM asignaciones WHERE faena_id=?", (int(faena_id),))
         asignados_ids = set(asignados["trabajador_id"].tolist()) if not asignados.empty else set()
-        disponibles = trab[~trab["id"].isin(asignados_ids)].copy()
+        trab_ids = trab["id"].tolist()
+        # El multiselect solo necesita los ids: sin máscara ni copia del DataFrame.
+        disponibles_ids = [i for i in trab_ids if i not in asignados_ids]
+
+        trab_labels = {
+            i: f"{a} {n} ({r})"
+            for i, a, n, r in zip(trab_ids, trab["apellidos"].tolist(), trab["nombres"].tolist(), trab["rut"].tolist())
+        }
 
         def _fmt_trab(x):
-            r = trab[trab["id"] == x].iloc[0]
-            return f"{r['apellidos']} {r['nombres']} ({r['rut']})"
+            return trab_labels.get(x, str(x))
 
         st.markdown("#### Agregar asignaciones")
-        if disponibles.empty:
+        if not disponibles_ids:
             st.success("Todos los trabajadores ya están asignados.")
         else:
             with st.form("form_asignar_trabajadores_existentes"):
-                seleccion = st.multiselect("Selecciona trabajadores", disponibles["id"].tolist(), format_func=_fmt_trab, key="asignar_trabajadores_existentes_multi")
+                seleccion = st.multiselect("Selecciona trabajadores", disponibles_ids, format_func=_fmt_trab, key="asignar_trabajadores_existentes_multi")
                 fecha_ingreso = st.date_input("Fecha ingreso", value=date.today(), key="asignar_trabajadores_fecha_ingreso")
                 cargo_faena = st.text_input("Cargo en faena (opcional, aplica a todos)", key="asignar_trabajadores_cargo_faena")
                 ok = st.form_submit_button("Asignar seleccionados", type="primary")
@@ -554,24 +639,14 @@ def page_asignar_trabajadores(
                 if len(seleccion) == 0:
                     st.error("Selecciona al menos un trabajador para asignar.")
                     st.stop()
-                inserted_count = 0
-                skipped_count = 0
-                with conn() as c:
-                    for tid in seleccion:
-                        cur = cursor_execute(
-                            c,
-                            ASSIGNACION_INSERT_SQL,
-                            (_ck, int(faena_id), int(tid), cargo_faena.strip(), str(fecha_ingreso), None, "ACTIVA"),
-                        )
-                        try:
-                            rc = int(cur.rowcount or 0)
-                        except Exception:
-                            rc = 0
-                        if rc > 0:
-                            inserted_count += 1
-                        else:
-                            skipped_count += 1
-                    c.commit()
+                fid, cf, fi = int(faena_id), cargo_faena.strip(), str(fecha_ingreso)
+                asg_rows = [(_ck, fid, int(tid), cf, fi, None, "ACTIVA") for tid in seleccion]
+                count_sql = "SELECT COUNT(*) FROM asignaciones WHERE COALESCE(cliente_key,'')=? AND faena_id=?"
+                with db_transaction() as c:
+                    before = int(cursor_execute(c, count_sql, (_ck, fid)).fetchone()[0] or 0)
+                    executemany(ASSIGNACION_INSERT_SQL, asg_rows, c=c)
+                    inserted_count = int(cursor_execute(c, count_sql, (_ck, fid)).fetchone()[0] or 0) - before
+                skipped_count = len(asg_rows) - inserted_count
                 clear_app_caches()
                 st.session_state["docs_scoped_toggle"] = True
                 st.session_state.pop("docs_trabajador_pick", None)
@@ -598,12 +673,7 @@ def page_asignar_trabajadores(
         up = st.file_uploader("Sube Excel (.xlsx)", type=["xlsx"], key="up_excel_trab_por_faena")
         if up is not None:
             try:
-                xls = pd.ExcelFile(up)
-                sheet = st.selectbox("Hoja", xls.sheet_names, index=0, key="sheet_trab_por_faena")
-                raw = pd.read_excel(xls, sheet_name=sheet)
-
-                colmap = {c: norm_col(str(c)) for c in raw.columns}
-                df = raw.rename(columns=colmap).copy()
+                df = _import_upload_sheet(up, norm_col, state_key="_import_xls_trab_por_faena", sheet_key="sheet_trab_por_faena")
 
                 st.caption("Vista previa (primeras 10 filas)")
                 st.dataframe(df.head(10), use_container_width=True)
@@ -616,94 +686,32 @@ def page_asignar_trabajadores(
                     cargo_faena_all = st.text_input("Cargo en faena (opcional, aplica a todos)", key="cargo_faena_all")
 
                     if st.button("Importar y asignar a esta faena", type="primary", key="btn_importar_asignar_faena"):
-                        existing = fetch_df("SELECT rut, id FROM trabajadores")
-                        rut_to_id = {str(r["rut"]): int(r["id"]) for _, r in existing.iterrows()} if not existing.empty else {}
-
-                        rows = inserted = updated = skipped = assigned = 0
-
-                        has_cargo = "cargo" in df.columns
-                        has_cc = "centro_costo" in df.columns
-                        has_email = "email" in df.columns
-                        fc_col = "fecha_de_contrato" if "fecha_de_contrato" in df.columns else ("fecha_contrato" if "fecha_contrato" in df.columns else None)
-                        has_ve = "vigencia_examen" in df.columns
-
-                        def _to_text_date_import_faena(v):
-                            if v is None or pd.isna(v):
-                                return None
-                            if isinstance(v, datetime):
-                                return str(v.date())
-                            if isinstance(v, date):
-                                return str(v)
-                            return str(v)
-
-                        with conn() as c:
-                            for _, r in df.iterrows():
-                                rows += 1
-                                rut = clean_rut(str(r.get("rut", "") or ""))
-                                nombre = str(r.get("nombre", "") or "").strip()
-
-                                if not rut or rut.lower() in ("nan", "none"):
-                                    skipped += 1
-                                    continue
-                                if not nombre or nombre.lower() in ("nan", "none"):
-                                    skipped += 1
-                                    continue
-
-                                nombres, apellidos = split_nombre_completo(nombre)
-                                cargo = str(r.get("cargo", "") or "").strip() if has_cargo else ""
-                                centro_costo = str(r.get("centro_costo", "") or "").strip() if has_cc else ""
-                                email = str(r.get("email", "") or "").strip() if has_email else ""
-                                fecha_contrato = _to_text_date_import_faena(r.get(fc_col)) if fc_col else None
-                                vigencia_examen = _to_text_date_import_faena(r.get("vigencia_examen")) if has_ve else None
-
-                                action, tid_saved = trabajador_insert_or_update(
-                                    c,
-                                    rut=rut,
-                                    nombres=nombres,
-                                    apellidos=apellidos,
-                                    cargo=cargo,
-                                    centro_costo=centro_costo,
-                                    email=email,
-                                    fecha_contrato=fecha_contrato,
-                                    vigencia_examen=vigencia_examen,
-                                    overwrite=overwrite,
-                                    existing_id=rut_to_id.get(rut),
-                                )
-                                if action == "inserted":
-                                    inserted += 1
-                                elif action == "updated":
-                                    updated += 1
-                                else:
-                                    skipped += 1
-                                    continue
-
-                                # obtener id del trabajador
-                                if rut not in rut_to_id:
-                                    if tid_saved:
-                                        rut_to_id[rut] = int(tid_saved)
-                                    else:
-                                        rid = cursor_execute(c, "SELECT id FROM trabajadores WHERE rut=?", (rut,)).fetchone()
-                                        if rid:
-                                            rut_to_id[rut] = int(rid[0])
-
-                                tid = rut_to_id.get(rut)
-                                if tid:
-                                    cur_asg = cursor_execute(
-                                        c,
-                                        ASSIGNACION_INSERT_SQL,
-                                        (_ck, int(faena_id), int(tid), cargo_faena_all.strip(), str(fecha_ingreso), None, "ACTIVA"),
-                                    )
-                                    try:
-                                        assigned += int(cur_asg.rowcount or 0)
-                                    except Exception:
-                                        pass
-
-                            c.commit()
+                        # Normalización por columnas (sin iterrows ni clean_rut/split por
+                        # fila); upserts y asignaciones van en lote con executemany.
+                        rows = len(df)
+                        rows_ins, skipped = _normalize_trabajadores_import(df, clean_rut)
+                        rows_ins, dupes = _dedupe_import_rows(rows_ins, keep_last=overwrite)
+
+                        # Una sola transacción (BEGIN IMMEDIATE ... COMMIT) para upserts y asignaciones.
+                        with db_transaction() as c:
+                            res = trabajadores_bulk_upsert(rows_ins, overwrite=overwrite, c=c)
+                            inserted, updated = res["inserted"], res["updated"]
+                            skipped += res["skipped"]
+                            asg_rows = [
+                                (_ck, int(faena_id), int(tid), cargo_faena_all.strip(), str(fecha_ingreso), None, "ACTIVA")
+                                for tid in res["ids"].values()
+                            ]
+                            # rowcount de executemany no es fiable entre drivers: las
+                            # asignaciones nuevas salen del conteo antes/después.
+                            count_sql = "SELECT COUNT(*) FROM asignaciones WHERE COALESCE(cliente_key,'')=? AND faena_id=?"
+                            before = int(cursor_execute(c, count_sql, (_ck, int(faena_id))).fetchone()[0] or 0)
+                            executemany(ASSIGNACION_INSERT_SQL, asg_rows, c=c)
+                            assigned = int(cursor_execute(c, count_sql, (_ck, int(faena_id))).fetchone()[0] or 0) - before
 
                         clear_app_caches()
                         st.session_state["docs_scoped_toggle"] = True
                         st.session_state.pop("docs_trabajador_pick", None)
-                        st.success(f"Listo. Filas: {rows} | Insertados: {inserted} | Actualizados: {updated} | Omitidos: {skipped} | Asignados: {assigned}")
+                        st.success(f"Listo. Filas: {rows} | Insertados: {inserted} | Actualizados: {updated} | Omitidos: {skipped} | RUT repetidos: {dupes} | Asignados: {assigned}")
                         auto_backup_db("import_asignar_faena")
                         # llevar a docs con la faena seleccionada
                         st.session_state["selected_faena_id"] = int(faena_id)
@@ -742,9 +750,13 @@ def page_asignar_trabajadores(
             st.markdown("#### 🗑️ Quitar trabajadores de esta faena")
             st.caption("Esto **solo elimina la asignación** (no elimina al trabajador ni sus documentos).")
 
+            asg_labels = {
+                i: f"{t} ({r})"
+                for i, t, r in zip(docs_asg["trabajador_id"].tolist(), docs_asg["trabajador"].tolist(), docs_asg["rut"].tolist())
+            }
+
             def _fmt_asg(tid):
-                r = docs_asg[docs_asg["trabajador_id"] == tid].iloc[0]
-                return f"{r['trabajador']} ({r['rut']})"
+                return asg_labels.get(tid, str(tid))
 
             to_remove = st.multiselect(
                 "Selecciona trabajadores a quitar",
@@ -817,30 +829,16 @@ def page_documentos_trabajador(
     if _scope_restricted and not _allowed_mands:
         st.info("Tu usuario lector no tiene mandantes asignados. No hay faenas ni trabajadores disponibles para Documentos Trabajador.")
         return
-    if _scope_restricted:
-        _ph = ','.join(['?'] * len(_allowed_mands))
-        faenas = fetch_df(
-            f'''
-            SELECT f.id, m.nombre AS mandante, f.nombre, f.estado
-            FROM faenas f JOIN mandantes m ON m.id=f.mandante_id
-            WHERE f.mandante_id IN ({_ph})
-            ORDER BY f.id DESC
-            ''',
-            tuple(_allowed_mands),
-        )
-    else:
-        faenas = fetch_df(
-            '''
-            SELECT f.id, m.nombre AS mandante, f.nombre, f.estado
-            FROM faenas f JOIN mandantes m ON m.id=f.mandante_id
-            ORDER BY f.id DESC
-            '''
-        )
+    faenas = fetch_faenas_with_mandante(fetch_df, _allowed_mands if _scope_restricted else None)
 
     # Selector de faena dentro del apartado (no genera cajas vacías)
     current = st.session_state.get("selected_faena_id")
     ids = [None] + (faenas["id"].tolist() if not faenas.empty else [])
     default_index = ids.index(current) if (current in ids) else 0
+    faena_pick_labels = {} if faenas.empty else {
+        i: f"{int(i)} - {m} / {n} ({e})"
+        for i, m, n, e in zip(faenas["id"].tolist(), faenas["mandante"].tolist(), faenas["nombre"].tolist(), faenas["estado"].tolist())
+    }
 
     c1, c2 = st.columns([3, 1])
     with c1:
@@ -848,9 +846,7 @@ def page_documentos_trabajador(
             "Faena (opcional)",
             ids,
             index=default_index,
-            format_func=lambda x: "(sin faena)" if x is None else (
-                f"{int(x)} - {faenas[faenas['id']==x].iloc[0]['mandante']} / {faenas[faenas['id']==x].iloc[0]['nombre']} ({faenas[faenas['id']==x].iloc[0]['estado']})"
-            ),
+            format_func=lambda x: "(sin faena)" if x is None else faena_pick_labels.get(x, str(x)),
             key="docs_faena_pick",
         )
         st.session_state["selected_faena_id"] = None if faena_pick is None else int(faena_pick)
@@ -917,11 +913,12 @@ def page_documentos_trabajador(
             return
 
     # Selector de trabajador (solo asignados si scoped)
-    def _fmt_trab_docs(x):
-        r = trab[trab["id"] == x].iloc[0]
-        return f"{r['apellidos']} {r['nombres']} ({r['rut']})"
+    trab_labels = {
+        i: f"{a} {n} ({r})"
+        for i, a, n, r in zip(trab["id"].tolist(), trab["apellidos"].tolist(), trab["nombres"].tolist(), trab["rut"].tolist())
+    }
 
-    tid = st.selectbox("Trabajador", trab["id"].tolist(), format_func=_fmt_trab_docs, key="docs_trabajador_pick")
+    tid = st.selectbox("Trabajador", trab["id"].tolist(), format_func=lambda x: trab_labels.get(x, str(x)), key="docs_trabajador_pick")
 
     # Estado documental del trabajador (global: se reutiliza entre faenas)
     docs = fetch_df(
@@ -930,12 +927,12 @@ def page_documentos_trabajador(
     )
     trabajador_row = trab[trab["id"] == tid].iloc[0]
     req_docs = worker_required_docs_for_record(trabajador_row)
-    tipos_presentes = set(docs["doc_tipo"].astype(str).tolist()) if not docs.empty else set()
+    tipos_presentes = set(map(str, docs["doc_tipo"].unique())) if not docs.empty else set()
     faltan = [d for d in req_docs if d not in tipos_presentes]
 
     col1, col2, col3 = st.columns([1, 1, 2])
     col1.metric("Obligatorios", len(req_docs))
-    col2.metric("Cargados", len([d for d in req_docs if d in tipos_presentes]))
+    col2.metric("Cargados", len(req_docs) - len(faltan))
     col3.metric("Faltan", len(faltan))
 
     cargo_label = canonical_cargo_label(trabajador_row.get("cargo"))
@@ -975,52 +972,53 @@ def page_documentos_trabajador(
             doc_tipo = tipo if tipo != "OTRO" else (tipo_otro.strip() or "OTRO")
             payload = prepare_upload_payload(up.name, up.getvalue(), getattr(up, 'type', None) or 'application/octet-stream')
             folder = ["trabajadores", tid, safe_name(doc_tipo)]
-            file_path, bucket, object_path = save_file_online(folder, payload["file_name"], payload["file_bytes"], content_type=payload["content_type"])
-            sha = sha256_bytes(payload["file_bytes"])
-            if payload["compressed"] and payload.get("compression_note"):
-                st.info(payload["compression_note"])
 
-            try:
+            def _record_doc(file_path, bucket, object_path, sha):
+                try:
 
-                execute(
+                    execute(
 
-                    "INSERT INTO trabajador_documentos(trabajador_id, doc_tipo, nombre_archivo, file_path, bucket, object_path, sha256, created_at) VALUES(?,?,?,?,?,?,?,?)",
+                        "INSERT INTO trabajador_documentos(trabajador_id, doc_tipo, nombre_archivo, file_path, bucket, object_path, sha256, created_at) VALUES(?,?,?,?,?,?,?,?)",
 
-                    (int(tid), doc_tipo, payload["file_name"], file_path, bucket, object_path, sha, datetime.utcnow().isoformat(timespec="seconds")),
+                        (int(tid), doc_tipo, payload["file_name"], file_path, bucket, object_path, sha, datetime.utcnow().isoformat(timespec="seconds")),
 
-                )
+                    )
 
-            except Exception:
+                except Exception:
 
-                # Manejo de duplicados (UniqueViolation): actualiza el registro existente sin romper la app
+                    # Manejo de duplicados (UniqueViolation): actualiza el registro existente sin romper la app
 
-                if DB_BACKEND == "postgres":
+                    if DB_BACKEND == "postgres":
 
-                    rc = execute_rowcount(
+                        rc = execute_rowcount(
 
-                        "UPDATE trabajador_documentos SET file_path=?, bucket=?, object_path=?, sha256=?, created_at=? "
+                            "UPDATE trabajador_documentos SET file_path=?, bucket=?, object_path=?, sha256=?, created_at=? "
 
-                        "WHERE trabajador_id=? AND doc_tipo=? AND nombre_archivo=?",
+                            "WHERE trabajador_id=? AND doc_tipo=? AND nombre_archivo=?",
 
-                        (file_path, bucket, object_path, sha, datetime.utcnow().isoformat(timespec="seconds"), int(tid), doc_tipo, payload["file_name"]),
+                            (file_path, bucket, object_path, sha, datetime.utcnow().isoformat(timespec="seconds"), int(tid), doc_tipo, payload["file_name"]),
 
-                    )
+                        )
 
-                    if rc == 0:
+                        if rc == 0:
 
-                        execute_rowcount(
+                            execute_rowcount(
 
-                            "UPDATE trabajador_documentos SET nombre_archivo=?, file_path=?, bucket=?, object_path=?, sha256=?, created_at=? "
+                                "UPDATE trabajador_documentos SET nombre_archivo=?, file_path=?, bucket=?, object_path=?, sha256=?, created_at=? "
 
-                            "WHERE trabajador_id=? AND doc_tipo=?",
+                                "WHERE trabajador_id=? AND doc_tipo=?",
 
-                            (payload["file_name"], file_path, bucket, object_path, sha, datetime.utcnow().isoformat(timespec="seconds"), int(tid), doc_tipo),
+                                (payload["file_name"], file_path, bucket, object_path, sha, datetime.utcnow().isoformat(timespec="seconds"), int(tid), doc_tipo),
 
-                        )
+                            )
 
-                else:
+                    else:
+
+                        raise
 
-                    raise
+            save_file_online(folder, payload["file_name"], payload["file_bytes"], content_type=payload["content_type"], dedupe=True, record=_record_doc)
+            if payload["compressed"] and payload.get("compression_note"):
+                st.info(payload["compression_note"])
             st.success("Documento guardado.")
             auto_backup_db("doc_trabajador")
             st.rerun()
@@ -1041,12 +1039,13 @@ def page_documentos_trabajador(
             if cur not in ids:
                 st.session_state["trab_pick_doc"] = ids[0]
 
+            doc_labels = {
+                i: f"{t} — {n}"
+                for i, t, n in zip(ids, docs["doc_tipo"].tolist(), docs["nombre_archivo"].tolist())
+            }
+
             def _fmt_doc(x):
-                try:
-                    r = docs.loc[docs["id"] == x].iloc[0]
-                    return f"{r.get('doc_tipo','DOC')} — {r.get('nombre_archivo','archivo')}"
-                except Exception:
-                    return f"ID {x}"
+                return doc_labels.get(x, f"ID {x}")
 
             pick_id = st.selectbox(
                 "Documento",
@@ -10,6 +10,25 @@ from segav_core.kpi_ui import kpi_card
 from segav_core.personal_utils import rut_input
 
 
+def _nombre_by_id(df) -> dict:
+    """id → nombre para los format_func (evita filtrar el DataFrame por cada opción)."""
+    if df is None or df.empty:
+        return {}
+    return dict(zip(df["id"].tolist(), df["nombre"].astype(str).tolist()))
+
+
+def _trab_labels(df, *, with_nombres: bool = True) -> dict:
+    """id → "rut · apellidos[, nombres]" para los selectores de trabajador."""
+    if df is None or df.empty:
+        return {}
+    if with_nombres:
+        return {
+            i: f"{r} · {a}, {n}"
+            for i, r, a, n in zip(df["id"].tolist(), df["rut"].tolist(), df["apellidos"].tolist(), df["nombres"].tolist())
+        }
+    return {i: f"{r} · {a}" for i, r, a in zip(df["id"].tolist(), df["rut"].tolist(), df["apellidos"].tolist())}
+
+
 def page_sgsst(
     *,
     fetch_df,
@@ -422,7 +441,9 @@ def page_sgsst(
                 st.caption("Sin filas para actualizar.")
             else:
                 matriz_ids = df_matriz["id"].tolist()
-                mid = st.selectbox("Fila", matriz_ids, format_func=lambda x: f"#{int(x)} · {df_matriz[df_matriz['id']==x].iloc[0]['norma']} / {df_matriz[df_matriz['id']==x].iloc[0]['tema']}", key=K("sgsst_edit_matriz_id"))
+                matriz_temas = dict(zip(matriz_ids, df_matriz["tema"].tolist()))
+                matriz_labels = {i: f"#{int(i)} · {n} / {t}" for i, n, t in zip(matriz_ids, df_matriz["norma"].tolist(), df_matriz["tema"].tolist())}
+                mid = st.selectbox("Fila", matriz_ids, format_func=lambda x: matriz_labels.get(x, str(x)), key=K("sgsst_edit_matriz_id"))
                 row = df_matriz[df_matriz["id"] == mid].iloc[0]
                 estado_actual = str(row["estado"]) if str(row["estado"]) in SGSST_ESTADOS else SGSST_ESTADOS[0]
                 u_estado = st.selectbox("Nuevo estado", SGSST_ESTADOS, index=SGSST_ESTADOS.index(estado_actual), key=K("sgsst_edit_matriz_estado"))
@@ -442,7 +463,7 @@ def page_sgsst(
                     st.rerun()
                 st.divider()
                 st.markdown("#### 🗑️ Eliminar requisito")
-                _del_mid = st.selectbox("Requisito a eliminar", matriz_ids, format_func=lambda x: f"#{int(x)} · {df_matriz[df_matriz['id']==x].iloc[0]['tema']}", key=K("sgsst_del_matriz_id"))
+                _del_mid = st.selectbox("Requisito a eliminar", matriz_ids, format_func=lambda x: f"#{int(x)} · {matriz_temas.get(x, '')}", key=K("sgsst_del_matriz_id"))
                 st.warning("Esta acción es irreversible.")
                 if st.button("Eliminar requisito", key=K("sgsst_del_matriz")):
                     execute("DELETE FROM sgsst_matriz_legal WHERE id=?", (int(_del_mid),))
@@ -465,6 +486,7 @@ def page_sgsst(
         )
         st.dataframe(df_prog, use_container_width=True, hide_index=True)
         faenas_df = fetch_df("SELECT id, nombre FROM faenas ORDER BY nombre")
+        faena_names = _nombre_by_id(faenas_df)
         faena_opts = [None] + faenas_df["id"].tolist() if not faenas_df.empty else [None]
         p1, p2 = st.columns(2)
         with p1:
@@ -473,7 +495,7 @@ def page_sgsst(
             responsable = st.text_input("Responsable", key=K("sgsst_prog_resp"))
             fecha_comp = st.date_input("Fecha compromiso", value=date.today(), key=K("sgsst_prog_fecha"))
         with p2:
-            faena_id = st.selectbox("Faena vinculada", faena_opts, key=K("sgsst_prog_faena"), format_func=lambda x: "(Empresa)" if x is None else str(faenas_df[faenas_df['id']==x].iloc[0]['nombre']))
+            faena_id = st.selectbox("Faena vinculada", faena_opts, key=K("sgsst_prog_faena"), format_func=lambda x: "(Empresa)" if x is None else faena_names.get(x, str(x)))
             estado = st.selectbox("Estado", SGSST_ESTADOS, key=K("sgsst_prog_estado"))
             avance = st.slider("Avance %", min_value=0, max_value=100, value=0, step=5, key=K("sgsst_prog_avance"))
             evidencia = st.text_input("Evidencia / entregable", key=K("sgsst_prog_evidencia"))
@@ -493,8 +515,9 @@ def page_sgsst(
     with tabs[6]:
         st.markdown("### MIPER por faena, proceso y cargo")
         faenas_df = fetch_df("SELECT id, nombre FROM faenas ORDER BY nombre")
+        faena_names = _nombre_by_id(faenas_df)
         faena_opts = [None] + faenas_df["id"].tolist() if not faenas_df.empty else [None]
-        faena_filter = st.selectbox("Filtrar por faena", faena_opts, key=K("sgsst_miper_filter"), format_func=lambda x: "(Todas)" if x is None else str(faenas_df[faenas_df['id']==x].iloc[0]['nombre']))
+        faena_filter = st.selectbox("Filtrar por faena", faena_opts, key=K("sgsst_miper_filter"), format_func=lambda x: "(Todas)" if x is None else faena_names.get(x, str(x)))
         q = """
             SELECT m.id, COALESCE(f.nombre,'(Empresa)') AS faena, m.proceso, m.tarea, m.cargo, m.peligro, m.riesgo, m.consecuencia,
                    m.probabilidad, m.severidad, m.nivel_riesgo, m.responsable, m.plazo, m.estado
@@ -510,7 +533,7 @@ def page_sgsst(
         st.dataframe(df_miper, use_container_width=True, hide_index=True)
         m1, m2, m3 = st.columns(3)
         with m1:
-            m_faena = st.selectbox("Faena", faena_opts, key=K("sgsst_miper_faena"), format_func=lambda x: "(Empresa)" if x is None else str(faenas_df[faenas_df['id']==x].iloc[0]['nombre']))
+            m_faena = st.selectbox("Faena", faena_opts, key=K("sgsst_miper_faena"), format_func=lambda x: "(Empresa)" if x is None else faena_names.get(x, str(x)))
             proceso = st.text_input("Proceso", key=K("sgsst_miper_proceso"))
             tarea = st.text_input("Tarea", key=K("sgsst_miper_tarea"))
             cargo = st.selectbox("Cargo", segav_cargo_labels(active_only=True), key=K("sgsst_miper_cargo"))
@@ -547,8 +570,9 @@ def page_sgsst(
         if df_miper is not None and not df_miper.empty:
             with st.expander("✏️ Editar / 🗑️ Eliminar riesgo"):
                 _miper_ids = df_miper["id"].tolist()
-                _sel_mid = st.selectbox("Riesgo", _miper_ids, format_func=lambda x: f"#{int(x)} · {str(df_miper[df_miper['id']==x].iloc[0].get('peligro',''))[:50]}", key=K("miper_edit_id"))
-                _curr_est = str(df_miper[df_miper['id'] == _sel_mid].iloc[0].get('estado', 'PENDIENTE'))
+                _miper_rows = dict(zip(_miper_ids, df_miper.to_dict("records")))
+                _sel_mid = st.selectbox("Riesgo", _miper_ids, format_func=lambda x: f"#{int(x)} · {str(_miper_rows[x].get('peligro',''))[:50]}", key=K("miper_edit_id"))
+                _curr_est = str(_miper_rows[_sel_mid].get('estado', 'PENDIENTE'))
                 _new_est = st.selectbox("Nuevo estado", SGSST_ESTADOS, index=SGSST_ESTADOS.index(_curr_est) if _curr_est in SGSST_ESTADOS else 0, key=K("miper_edit_est"))
                 _me1, _me2 = st.columns(2)
                 with _me1:
@@ -567,6 +591,7 @@ def page_sgsst(
     with tabs[7]:
         st.markdown("### Inspecciones DS 594")
         faenas_df = fetch_df("SELECT id, nombre FROM faenas ORDER BY nombre")
+        faena_names = _nombre_by_id(faenas_df)
         faena_opts = [None] + faenas_df["id"].tolist() if not faenas_df.empty else [None]
         ins_q = """
             SELECT i.id, COALESCE(f.nombre,'(Planta)') AS faena, i.tipo, i.area, i.item, i.resultado, i.responsable, i.plazo, i.observacion, i.accion_correctiva
@@ -577,7 +602,7 @@ def page_sgsst(
         st.dataframe(fetch_df(ins_q), use_container_width=True, hide_index=True)
         i1, i2 = st.columns(2)
         with i1:
-            ins_faena = st.selectbox("Faena / planta", faena_opts, key=K("sgsst_ins_faena"), format_func=lambda x: "PLANTA" if x is None else str(faenas_df[faenas_df['id']==x].iloc[0]['nombre']))
+            ins_faena = st.selectbox("Faena / planta", faena_opts, key=K("sgsst_ins_faena"), format_func=lambda x: "PLANTA" if x is None else faena_names.get(x, str(x)))
             ins_tipo = st.selectbox("Tipo inspección", ["DS 594", "Orden y aseo", "Extintores", "Campamento", "Otro"], key=K("sgsst_ins_tipo"))
             ins_area = st.text_input("Área", key=K("sgsst_ins_area"))
             ins_item = st.text_input("Ítem", key=K("sgsst_ins_item"))
@@ -606,12 +631,13 @@ def page_sgsst(
         st.caption("Checklist estandarizado para verificar cumplimiento de condiciones sanitarias y ambientales según DS 594.")
         _checklist_items = DS594_CHECKLIST_ITEMS or {}
         faenas_df = fetch_df("SELECT id, nombre FROM faenas ORDER BY nombre")
+        faena_names = _nombre_by_id(faenas_df)
         faena_opts_ck = faenas_df["id"].tolist() if not faenas_df.empty else []
         if not faena_opts_ck:
             st.info("Crea una faena primero para realizar inspecciones.")
         else:
             ck_faena = st.selectbox("Faena a inspeccionar", faena_opts_ck, key=K("ck594_faena"),
-                format_func=lambda x: str(faenas_df[faenas_df['id']==x].iloc[0]['nombre']))
+                format_func=lambda x: faena_names.get(x, str(x)))
             ck_inspector = st.text_input("Inspector", key=K("ck594_inspector"), placeholder="Nombre del inspector")
             ck_fecha = st.date_input("Fecha inspección", value=date.today(), key=K("ck594_fecha"))
 
@@ -691,7 +717,9 @@ def page_sgsst(
     with tabs[9]:
         st.markdown("### Accidentes e incidentes")
         trab_df = fetch_df("SELECT id, rut, apellidos, nombres FROM trabajadores ORDER BY apellidos, nombres")
+        trab_labels = _trab_labels(trab_df)
         faenas_df = fetch_df("SELECT id, nombre FROM faenas ORDER BY nombre")
+        faena_names = _nombre_by_id(faenas_df)
         trab_opts = [None] + trab_df["id"].tolist() if not trab_df.empty else [None]
         faena_opts = [None] + faenas_df["id"].tolist() if not faenas_df.empty else [None]
         df_inc = fetch_df(
@@ -711,8 +739,8 @@ def page_sgsst(
             inc_fecha = st.date_input("Fecha", value=date.today(), key=K("sgsst_inc_fecha"))
             inc_tipo = st.selectbox("Tipo", SGSST_TIPOS_EVENTO, key=K("sgsst_inc_tipo"))
             inc_grav = st.selectbox("Gravedad", SGSST_GRAVEDADES, key=K("sgsst_inc_grav"))
-            inc_trab = st.selectbox("Trabajador", trab_opts, key=K("sgsst_inc_trab"), format_func=lambda x: "(Sin trabajador)" if x is None else f"{trab_df[trab_df['id']==x].iloc[0]['rut']} · {trab_df[trab_df['id']==x].iloc[0]['apellidos']}, {trab_df[trab_df['id']==x].iloc[0]['nombres']}")
-            inc_faena = st.selectbox("Faena", faena_opts, key=K("sgsst_inc_faena"), format_func=lambda x: "(Sin faena)" if x is None else str(faenas_df[faenas_df['id']==x].iloc[0]['nombre']))
+            inc_trab = st.selectbox("Trabajador", trab_opts, key=K("sgsst_inc_trab"), format_func=lambda x: "(Sin trabajador)" if x is None else trab_labels.get(x, str(x)))
+            inc_faena = st.selectbox("Faena", faena_opts, key=K("sgsst_inc_faena"), format_func=lambda x: "(Sin faena)" if x is None else faena_names.get(x, str(x)))
         with x2:
             inc_desc = st.text_area("Descripción", key=K("sgsst_inc_desc"), height=110)
             inc_oa = st.text_input("Organismo administrador", value=str(company.get("organismo_admin") or ""), key=K("sgsst_inc_oa"))
@@ -736,8 +764,9 @@ def page_sgsst(
         if df_inc is not None and not df_inc.empty:
             with st.expander("✏️ Editar / 🗑️ Eliminar incidente"):
                 _inc_ids = df_inc["id"].tolist()
-                _sel_iid = st.selectbox("Incidente", _inc_ids, format_func=lambda x: f"#{int(x)} · {df_inc[df_inc['id']==x].iloc[0].get('tipo','')} - {df_inc[df_inc['id']==x].iloc[0].get('fecha','')}", key=K("inc_edit_id"))
-                _curr_iest = str(df_inc[df_inc['id'] == _sel_iid].iloc[0].get('estado', 'PENDIENTE'))
+                _inc_rows = dict(zip(_inc_ids, df_inc.to_dict("records")))
+                _sel_iid = st.selectbox("Incidente", _inc_ids, format_func=lambda x: f"#{int(x)} · {_inc_rows[x].get('tipo','')} - {_inc_rows[x].get('fecha','')}", key=K("inc_edit_id"))
+                _curr_iest = str(_inc_rows[_sel_iid].get('estado', 'PENDIENTE'))
                 _new_iest = st.selectbox("Nuevo estado", SGSST_ESTADOS, index=SGSST_ESTADOS.index(_curr_iest) if _curr_iest in SGSST_ESTADOS else 0, key=K("inc_edit_est"))
                 _ie1, _ie2 = st.columns(2)
                 with _ie1:
@@ -756,7 +785,9 @@ def page_sgsst(
     with tabs[10]:
         st.markdown("### Capacitaciones y ODI")
         trab_df = fetch_df("SELECT id, rut, apellidos, nombres FROM trabajadores ORDER BY apellidos, nombres")
+        trab_labels = _trab_labels(trab_df)
         faenas_df = fetch_df("SELECT id, nombre FROM faenas ORDER BY nombre")
+        faena_names = _nombre_by_id(faenas_df)
         trab_opts = [None] + trab_df["id"].tolist() if not trab_df.empty else [None]
         faena_opts = [None] + faenas_df["id"].tolist() if not faenas_df.empty else [None]
         df_cap = fetch_df(
@@ -780,8 +811,8 @@ def page_sgsst(
             cap_horas = st.number_input("Horas", min_value=0.0, value=1.0, step=0.5, key=K("sgsst_cap_horas"))
         with c2:
             cap_relator = st.text_input("Relator / organismo", key=K("sgsst_cap_relator"))
-            cap_trab = st.selectbox("Trabajador", trab_opts, key=K("sgsst_cap_trab"), format_func=lambda x: "(General)" if x is None else f"{trab_df[trab_df['id']==x].iloc[0]['rut']} · {trab_df[trab_df['id']==x].iloc[0]['apellidos']}, {trab_df[trab_df['id']==x].iloc[0]['nombres']}")
-            cap_faena = st.selectbox("Faena", faena_opts, key=K("sgsst_cap_faena"), format_func=lambda x: "(General)" if x is None else str(faenas_df[faenas_df['id']==x].iloc[0]['nombre']))
+            cap_trab = st.selectbox("Trabajador", trab_opts, key=K("sgsst_cap_trab"), format_func=lambda x: "(General)" if x is None else trab_labels.get(x, str(x)))
+            cap_faena = st.selectbox("Faena", faena_opts, key=K("sgsst_cap_faena"), format_func=lambda x: "(General)" if x is None else faena_names.get(x, str(x)))
             cap_estado = st.selectbox("Estado", ["VIGENTE", "POR VENCER", "VENCIDA"], key=K("sgsst_cap_estado"))
             cap_evid = st.text_input("Evidencia", key=K("sgsst_cap_evid"))
         if st.button("Registrar capacitación / ODI", key=K("sgsst_add_cap")):
@@ -804,7 +835,9 @@ def page_sgsst(
 
         _epp_tipos = EPP_TIPOS or ["Casco","Guantes","Lentes","Calzado","Otro"]
         trab_df = fetch_df("SELECT id, rut, apellidos, nombres, cargo FROM trabajadores ORDER BY apellidos, nombres")
+        trab_labels = _trab_labels(trab_df)
         faenas_df = fetch_df("SELECT id, nombre FROM faenas ORDER BY nombre")
+        faena_names = _nombre_by_id(faenas_df)
 
         if trab_df is None or trab_df.empty:
             st.info("No hay trabajadores registrados.")
@@ -840,14 +873,14 @@ def page_sgsst(
             e1, e2 = st.columns(2)
             with e1:
                 epp_trab = st.selectbox("Trabajador", trab_df["id"].tolist(), key=K("epp_trab"),
-                    format_func=lambda x: f"{trab_df[trab_df['id']==x].iloc[0]['rut']} · {trab_df[trab_df['id']==x].iloc[0]['apellidos']}, {trab_df[trab_df['id']==x].iloc[0]['nombres']}")
+                    format_func=lambda x: trab_labels.get(x, str(x)))
                 epp_tipo = st.selectbox("Tipo de EPP", _epp_tipos, key=K("epp_tipo"))
                 epp_fecha = st.date_input("Fecha entrega", value=date.today(), key=K("epp_fecha"))
                 epp_venc = st.date_input("Fecha vencimiento (opcional)", value=None, key=K("epp_venc"))
             with e2:
                 faena_opts_epp = [None] + (faenas_df["id"].tolist() if not faenas_df.empty else [])
                 epp_faena = st.selectbox("Faena", faena_opts_epp, key=K("epp_faena"),
-                    format_func=lambda x: "PLANTA" if x is None else str(faenas_df[faenas_df['id']==x].iloc[0]['nombre']))
+                    format_func=lambda x: "PLANTA" if x is None else faena_names.get(x, str(x)))
                 epp_cant = st.number_input("Cantidad", min_value=1, value=1, key=K("epp_cant"))
                 epp_talla = st.text_input("Talla", key=K("epp_talla"))
                 epp_marca = st.text_input("Marca", key=K("epp_marca"))
@@ -961,14 +994,16 @@ def page_sgsst(
         st.divider()
         st.markdown("#### ➕ Registrar DIAT / DIEP")
         trab_df = fetch_df("SELECT id, rut, apellidos, nombres FROM trabajadores ORDER BY apellidos")
+        trab_labels = _trab_labels(trab_df, with_nombres=False)
         faenas_df = fetch_df("SELECT id, nombre FROM faenas ORDER BY nombre")
+        faena_names = _nombre_by_id(faenas_df)
         d1, d2 = st.columns(2)
         with d1:
             di_tipo = st.selectbox("Tipo de denuncia", ["DIAT", "DIEP"], key=K("diat_tipo"))
             di_trab = st.selectbox("Trabajador", [None] + (trab_df["id"].tolist() if trab_df is not None and not trab_df.empty else []), key=K("diat_trab"),
-                format_func=lambda x: "(Sin asignar)" if x is None else f"{trab_df[trab_df['id']==x].iloc[0]['rut']} · {trab_df[trab_df['id']==x].iloc[0]['apellidos']}")
+                format_func=lambda x: "(Sin asignar)" if x is None else trab_labels.get(x, str(x)))
             di_faena = st.selectbox("Faena", [None] + (faenas_df["id"].tolist() if faenas_df is not None and not faenas_df.empty else []), key=K("diat_faena"),
-                format_func=lambda x: "PLANTA" if x is None else str(faenas_df[faenas_df['id']==x].iloc[0]['nombre']))
+                format_func=lambda x: "PLANTA" if x is None else faena_names.get(x, str(x)))
             di_fecha_acc = st.date_input("Fecha del accidente", value=date.today(), key=K("diat_fecha_acc"))
             di_hora = st.text_input("Hora del accidente", key=K("diat_hora"), placeholder="HH:MM")
             di_fecha_den = st.date_input("Fecha de denuncia", value=date.today(), key=K("diat_fecha_den"))
@@ -1023,14 +1058,16 @@ def page_sgsst(
         st.divider()
         with st.expander("➕ Registrar evaluación de vigilancia"):
             trab_df = fetch_df("SELECT id, rut, apellidos, nombres FROM trabajadores ORDER BY apellidos")
+            trab_labels = _trab_labels(trab_df, with_nombres=False)
             faenas_df = fetch_df("SELECT id, nombre FROM faenas ORDER BY nombre")
+            faena_names = _nombre_by_id(faenas_df)
             v1, v2 = st.columns(2)
             with v1:
                 vi_prot = st.selectbox("Protocolo", PROTOCOLOS, key=K("vig_prot"))
                 vi_trab = st.selectbox("Trabajador", [None] + (trab_df["id"].tolist() if trab_df is not None and not trab_df.empty else []), key=K("vig_trab"),
-                    format_func=lambda x: "(General)" if x is None else f"{trab_df[trab_df['id']==x].iloc[0]['rut']} · {trab_df[trab_df['id']==x].iloc[0]['apellidos']}")
+                    format_func=lambda x: "(General)" if x is None else trab_labels.get(x, str(x)))
                 vi_faena = st.selectbox("Faena", [None] + (faenas_df["id"].tolist() if faenas_df is not None and not faenas_df.empty else []), key=K("vig_faena"),
-                    format_func=lambda x: "PLANTA" if x is None else str(faenas_df[faenas_df['id']==x].iloc[0]['nombre']))
+                    format_func=lambda x: "PLANTA" if x is None else faena_names.get(x, str(x)))
                 vi_agente = st.text_input("Agente de riesgo", key=K("vig_agente"), placeholder="Ruido, sílice, etc.")
             with v2:
                 vi_nivel = st.selectbox("Nivel de exposición", ["BAJO", "MEDIO", "ALTO", "CRÍTICO"], key=K("vig_nivel"))
@@ -1077,15 +1114,17 @@ def page_sgsst(
         st.divider()
         with st.expander("➕ Registrar subcontratista"):
             mand_df = fetch_df("SELECT id, nombre FROM mandantes ORDER BY nombre")
+            mand_names = _nombre_by_id(mand_df)
             faenas_df = fetch_df("SELECT id, nombre FROM faenas ORDER BY nombre")
+            faena_names = _nombre_by_id(faenas_df)
             s1, s2 = st.columns(2)
             with s1:
                 su_rut = rut_input("RUT empresa subcontratista", key=K("sub_rut"))
                 su_razon = st.text_input("Razón social", key=K("sub_razon"))
                 su_mand = st.selectbox("Mandante", [None] + (mand_df["id"].tolist() if mand_df is not None and not mand_df.empty else []), key=K("sub_mand"),
-                    format_func=lambda x: "(Sin mandante)" if x is None else str(mand_df[mand_df['id']==x].iloc[0]['nombre']))
+                    format_func=lambda x: "(Sin mandante)" if x is None else mand_names.get(x, str(x)))
                 su_faena = st.selectbox("Faena", [None] + (faenas_df["id"].tolist() if faenas_df is not None and not faenas_df.empty else []), key=K("sub_faena"),
-                    format_func=lambda x: "(Sin faena)" if x is None else str(faenas_df[faenas_df['id']==x].iloc[0]['nombre']))
+                    format_func=lambda x: "(Sin faena)" if x is None else faena_names.get(x, str(x)))
             with s2:
                 su_contacto = st.text_input("Contacto", key=K("sub_contacto"))
                 su_email = st.text_input("Email", key=K("sub_email"))
@@ -38,6 +38,8 @@ def page_superadmin_empresas(*, st, ui_header, fetch_df, fetch_value, execute, c
 
     cli_df = segav_clientes_df()
     cli_df = cli_df.copy() if cli_df is not None else pd.DataFrame()
+    # cliente_key → nombre para los format_func (sin filtrar cli_df por opción).
+    cli_names = dict(zip(cli_df["cliente_key"].astype(str).tolist(), cli_df["cliente_nombre"].astype(str).tolist())) if not cli_df.empty else {}
     users_df = fetch_df("SELECT id, username, role, is_active FROM users ORDER BY is_active DESC, username")
     access_df = fetch_df(
         """
@@ -203,7 +205,7 @@ def page_superadmin_empresas(*, st, ui_header, fetch_df, fetch_value, execute, c
                 "Empresa a modificar",
                 cli_keys,
                 key="sa_edit_empresa",
-                format_func=lambda x: str(cli_df[cli_df['cliente_key'].astype(str)==str(x)].iloc[0]['cliente_nombre']),
+                format_func=lambda x: cli_names.get(str(x), str(x)),
                 on_change=_load_selected_company_for_edit,
             )
             row = cli_df[cli_df["cliente_key"].astype(str) == str(edit_key)].iloc[0].to_dict()
@@ -293,7 +295,7 @@ def page_superadmin_empresas(*, st, ui_header, fetch_df, fetch_value, execute, c
             st.info("No hay usuarios creados todavía. Usa Admin Usuarios para crearlos.")
         else:
             cli_keys = cli_df["cliente_key"].astype(str).tolist()
-            admin_cli_key = st.selectbox("Empresa", cli_keys, key="sa_admin_empresa", format_func=lambda x: str(cli_df[cli_df['cliente_key'].astype(str)==str(x)].iloc[0]['cliente_nombre']))
+            admin_cli_key = st.selectbox("Empresa", cli_keys, key="sa_admin_empresa", format_func=lambda x: cli_names.get(str(x), str(x)))
             company_access = access_df[access_df["cliente_key"].astype(str) == str(admin_cli_key)].copy() if access_df is not None and not access_df.empty else pd.DataFrame(columns=["user_id","cliente_key","is_company_admin","username","role","is_active"])
             st.markdown("#### Asignaciones actuales")
             if company_access is not None and not company_access.empty:
@@ -304,8 +306,10 @@ def page_superadmin_empresas(*, st, ui_header, fetch_df, fetch_value, execute, c
             else:
                 st.info("Esta empresa aún no tiene usuarios vinculados.")
 
-            active_users = users_df[users_df["is_active"].fillna(1).astype(int) == 1].copy()
+            active_users = users_df[users_df["is_active"].fillna(1).astype(int) == 1]
             user_opts = active_users["id"].astype(int).tolist()
+            user_names = dict(zip(user_opts, active_users["username"].tolist()))
+            user_labels = {uid: f"{u} · {r}" for uid, u, r in zip(user_opts, active_users["username"].tolist(), active_users["role"].tolist())}
             assigned_ids = company_access["user_id"].astype(int).tolist() if company_access is not None and not company_access.empty else []
             admin_ids_now = company_access[company_access["is_company_admin"].fillna(0).astype(int) == 1]["user_id"].astype(int).tolist() if company_access is not None and not company_access.empty else []
             selected_users = st.multiselect(
@@ -313,7 +317,7 @@ def page_superadmin_empresas(*, st, ui_header, fetch_df, fetch_value, execute, c
                 user_opts,
                 default=assigned_ids,
                 key="sa_company_users",
-                format_func=lambda uid: f"{active_users[active_users['id'].astype(int)==int(uid)].iloc[0]['username']} · {active_users[active_users['id'].astype(int)==int(uid)].iloc[0]['role']}",
+                format_func=lambda uid: user_labels.get(int(uid), str(uid)),
             )
             admin_candidates = selected_users or []
             selected_admins = st.multiselect(
@@ -321,7 +325,7 @@ def page_superadmin_empresas(*, st, ui_header, fetch_df, fetch_value, execute, c
                 admin_candidates,
                 default=[uid for uid in admin_ids_now if uid in admin_candidates],
                 key="sa_company_admins",
-                format_func=lambda uid: f"{active_users[active_users['id'].astype(int)==int(uid)].iloc[0]['username']} · {active_users[active_users['id'].astype(int)==int(uid)].iloc[0]['role']}",
+                format_func=lambda uid: user_labels.get(int(uid), str(uid)),
             )
 
             # ── Roles por empresa ─────────────────────────────────────────
@@ -330,7 +334,7 @@ def page_superadmin_empresas(*, st, ui_header, fetch_df, fetch_value, execute, c
             ROLES_EMP = ["ADMIN", "OPERADOR", "LECTOR", "SUPERVISOR"]
             user_roles = {}
             for uid in selected_users:
-                uname = active_users[active_users['id'].astype(int)==int(uid)].iloc[0]['username']
+                uname = user_names[int(uid)]
                 # Get current role_empresa if exists
                 current_role = "OPERADOR"
                 if access_df is not None and not access_df.empty:
@@ -346,7 +350,7 @@ def page_superadmin_empresas(*, st, ui_header, fetch_df, fetch_value, execute, c
             st.markdown("##### Mandantes permitidos para lectores")
             st.caption("Solo aplica a usuarios con rol empresa LECTOR. Dejar vacío = sin restricción específica dentro de la empresa.")
             mandantes_df = fetch_df("SELECT id, nombre FROM mandantes WHERE COALESCE(cliente_key,'')=? ORDER BY nombre", (admin_cli_key,))
-            mand_map = {int(r['id']): str(r['nombre']) for _, r in mandantes_df.iterrows()} if mandantes_df is not None and not mandantes_df.empty else {}
+            mand_map = dict(zip(mandantes_df['id'].astype(int).tolist(), mandantes_df['nombre'].astype(str).tolist())) if mandantes_df is not None and not mandantes_df.empty else {}
             user_mandantes = {}
             if mand_map:
                 for uid in selected_users:
@@ -361,7 +365,7 @@ def page_superadmin_empresas(*, st, ui_header, fetch_df, fetch_value, execute, c
                                 except Exception:
                                     current_allowed = []
                         user_mandantes[uid] = st.multiselect(
-                            f"Mandantes autorizados · {active_users[active_users['id'].astype(int)==int(uid)].iloc[0]['username']}",
+                            f"Mandantes autorizados · {user_names[int(uid)]}",
                             list(mand_map.keys()),
                             default=[mid for mid in current_allowed if mid in mand_map],
                             format_func=lambda mid: mand_map.get(int(mid), str(mid)),
@@ -415,7 +419,7 @@ def page_superadmin_empresas(*, st, ui_header, fetch_df, fetch_value, execute, c
                 "Empresa a configurar",
                 cli_keys_lim,
                 key="sa_limits_empresa",
-                format_func=lambda x: str(cli_df[cli_df['cliente_key'].astype(str)==str(x)].iloc[0]['cliente_nombre']),
+                format_func=lambda x: cli_names.get(str(x), str(x)),
             )
             lim_df = fetch_df(
                 "SELECT max_total_users, max_admin_users, max_operador_users, max_lector_users FROM empresa_session_limits WHERE cliente_key=?",
@@ -16,6 +16,11 @@ from __future__ import annotations
 import re
 from typing import Callable
 
+import pandas as pd
+
+# Shorter queries match almost every row: callers skip filtering below this.
+MIN_QUERY_LEN = 2
+
 
 def _like_pattern(term: str) -> str:
     """Escape and wrap a search term for SQL LIKE."""
@@ -23,6 +28,17 @@ def _like_pattern(term: str) -> str:
     return f"%{safe}%"
 
 
+def text_search_mask(df: pd.DataFrame, query: str, cols) -> pd.Series:
+    """Boolean mask of rows where ``query`` is a substring of any of ``cols``.
+
+    Case-insensitive and literal (no regex). Each row's fields are joined and
+    lowercased once, instead of one ``.str.lower().str.contains`` per column.
+    """
+    qq = (query or "").strip().lower()
+    hay = df[list(cols)].fillna("").astype(str).to_numpy().tolist()
+    return pd.Series([qq in "\t".join(row).lower() for row in hay], index=df.index, dtype=bool)
+
+
 def global_search(
     fetch_df: Callable,
     tenant_key: str,
@@ -176,7 +192,7 @@ def render_search_sidebar(st_module, fetch_df_fn: Callable, tenant_key: str, all
     st = st_module
     with st.expander("🔍 Búsqueda global", expanded=False):
         q = st.text_input("Buscar trabajador, faena, mandante…", key="global_search_input", placeholder="RUT, nombre, faena…")
-        if q and len(q.strip()) >= 2:
+        if q and len(q.strip()) >= MIN_QUERY_LEN:
             results = global_search(fetch_df_fn, tenant_key, q, allowed_mandante_ids=allowed_mandante_ids)
             if not results:
                 st.caption("Sin resultados")
@@ -451,9 +451,12 @@ def load_file_anywhere(file_path: str | None, bucket: str | None, object_path: s
             except Exception as exc:
                 last_error = exc
                 continue
-    if file_path and os.path.exists(str(file_path)):
-        with open(str(file_path), "rb") as fp:
-            return fp.read()
+    if file_path:
+        try:
+            with open(str(file_path), "rb") as fp:
+                return fp.read()
+        except FileNotFoundError:
+            pass
     if last_error is not None:
         raise FileNotFoundError(f"Archivo no disponible (Storage/disco). Último intento: {last_error}")
     raise FileNotFoundError("Archivo no disponible (ni Storage ni disco local).")
@@ -482,10 +485,11 @@ def _local_delete_file(file_path: str | None):
     path = str(file_path or "").strip()
     if not path:
         return False
-    if os.path.exists(path):
+    try:
         os.remove(path)
-        return True
-    return False
+    except FileNotFoundError:
+        return False
+    return True
 
 
 def _count_file_references(file_path: str | None, bucket: str | None, object_path: str | None, *, exclude_table: str | None = None, exclude_id: int | None = None) -> int:
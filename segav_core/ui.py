@@ -1,4 +1,8 @@
+import inspect
+import threading
+
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 
 
 def inject_css():
@@ -105,3 +109,127 @@ def ui_header(title: str, desc: str = ""):
 
 def ui_tip(text: str):
     st.info(text, icon="ℹ️")
+
+
+def _download_accepts_callable() -> bool:
+    try:
+        from streamlit.elements.widgets import button as _st_button
+    except Exception:
+        return False
+    return "Callable" in str(getattr(_st_button, "DownloadButtonDataType", ""))
+
+
+# Streamlit >= 1.4x acepta un callable en ``download_button(data=...)`` y solo
+# lo ejecuta al hacer clic; en versiones anteriores hay que pasar los bytes.
+DOWNLOAD_ACCEPTS_CALLABLE = _download_accepts_callable()
+
+
+def bind_script_ctx(fn):
+    """Envuelve ``fn`` para que corra con el ScriptRunContext de la sesión actual.
+
+    Así un hilo de pool sigue resolviendo current_tenant_key()/session_state
+    de la empresa que pidió el trabajo.
+    """
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+        ctx = get_script_run_ctx()
+    except Exception:
+        add_script_run_ctx, ctx = None, None
+    if ctx is None:
+        return fn
+
+    def _run(*args, **kwargs):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+
+    return _run
+
+
+def deferred_download_data(loader):
+    """Contenido para ``st.download_button`` que se lee recién al descargar.
+
+    Streamlit ejecuta el callable en otro hilo, por eso se le enlaza el
+    contexto de la sesión (tenant activo). Si la versión de Streamlit no
+    soporta datos diferidos, ejecuta ``loader`` de inmediato.
+    """
+    return bind_script_ctx(loader) if DOWNLOAD_ACCEPTS_CALLABLE else loader()
+
+
+_FRAGMENT = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+
+def fragment(fn):
+    """``st.fragment`` si la versión de Streamlit lo trae (1.33+).
+
+    Un widget dentro del fragmento re-ejecuta solo esa función y no la página
+    completa; ``st.rerun()`` tras una escritura sigue refrescando todo (ver
+    ``rerun_fragment``). En versiones sin fragmentos devuelve ``fn`` tal cual.
+    """
+    return _FRAGMENT(fn) if _FRAGMENT is not None else fn
+
+
+def _rerun_accepts_scope() -> bool:
+    try:
+        return "scope" in inspect.signature(st.rerun).parameters
+    except Exception:
+        return False
+
+
+# ``st.rerun(scope="fragment")`` existe desde Streamlit 1.37.
+RERUN_ACCEPTS_SCOPE = _FRAGMENT is not None and _rerun_accepts_scope()
+
+
+def rerun_fragment():
+    """Re-ejecuta solo el fragmento actual tras una escritura local a él.
+
+    Para escrituras cuyo resultado se muestra únicamente dentro del mismo
+    fragmento (p. ej. la lista de anexos bajo el formulario de carga): evita
+    repetir todos los SELECT del resto de la página. Fuera de un fragmento, o
+    sin soporte de ``scope``, cae a ``st.rerun()`` completo.
+    """
+    if RERUN_ACCEPTS_SCOPE:
+        try:
+            st.rerun(scope="fragment")
+        except StreamlitAPIException:
+            pass
+    st.rerun()
+
+
+def faena_select_options(faenas, default_id=None, *, with_estado: bool = True):
+    """Opciones, índice inicial y etiquetas para un selectbox de faenas.
+
+    Recorre el DataFrame una sola vez: ``format_func`` queda como un lookup
+    en dict y el índice sale de un mapa id -> posición en vez de ``list.index``.
+    """
+    ids = faenas["id"].tolist()
+    mandantes = faenas["mandante"].tolist()
+    nombres = faenas["nombre"].tolist()
+    if with_estado:
+        estados = faenas["estado"].tolist()
+        labels = {fid: f"{fid} - {m} / {n} ({e})" for fid, m, n, e in zip(ids, mandantes, nombres, estados)}
+    else:
+        labels = {fid: f"{fid} - {m} / {n}" for fid, m, n in zip(ids, mandantes, nombres)}
+    pos = {fid: i for i, fid in enumerate(ids)}
+    return ids, pos.get(default_id, 0), labels
+
+
+_FAENAS_MANDANTE_SQL = """
+    SELECT f.id, f.mandante_id, m.nombre AS mandante, f.nombre, f.estado, f.fecha_inicio
+    FROM faenas f JOIN mandantes m ON m.id=f.mandante_id
+    {where}
+    ORDER BY f.id DESC
+"""
+
+
+def fetch_faenas_with_mandante(fetch_df, allowed_mands=None):
+    """Faenas con su mandante para los selectores de las páginas.
+
+    Todas las páginas piden exactamente el mismo SQL, así el cache de
+    ``fetch_df`` (invalidado por época de escrituras) se comparte entre
+    Asignar, Documentos y Exportar en vez de guardar una variante por página.
+    Con ``allowed_mands`` filtra por los mandantes permitidos.
+    """
+    if allowed_mands:
+        ph = ",".join(["?"] * len(allowed_mands))
+        return fetch_df(_FAENAS_MANDANTE_SQL.format(where=f"WHERE f.mandante_id IN ({ph})"), tuple(allowed_mands))
+    return fetch_df(_FAENAS_MANDANTE_SQL.format(where=""))
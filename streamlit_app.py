@@ -18,7 +18,11 @@ except Exception:
     ConnectionPool = None
 
 import shutil
-from datetime import date, datetime, timedelta
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager, nullcontext
+from functools import lru_cache
+from datetime import date, datetime, timedelta, timezone
 
 import pandas as pd
 import streamlit as st
@@ -30,19 +34,22 @@ import secrets
 import unicodedata
 import uuid
 
-from segav_core.compliance_logic import pendientes_empresa_faena_logic, pendientes_obligatorios_logic
+from segav_core.backup_restore import restore_sqlite_from_file, restore_sqlite_from_zip
+from segav_core.compliance_logic import faltantes_por_faena_logic, pendientes_empresa_faena_logic, pendientes_obligatorios_detalle_logic
 from segav_core.error_handling import get_soft_errors as _get_soft_errors, record_soft_error as _record_soft_error
-from segav_core.export_utils import build_zip_from_entries
+from segav_core.export_utils import ZIP_COMPRESSLEVEL, build_zip_from_entries, deflate_worthwhile, write_hashed, zip_compress_type
+from segav_core.formatters import norm_col, to_text_date
 from segav_core.rut_utils import clean_rut as clean_rut_core, format_rut_chileno as format_rut_chileno_core, rut_parts as rut_parts_core, validate_rut_dv as validate_rut_dv_core
 from segav_core.tenant_scope import inject_tenant_condition_sql as inject_tenant_condition_sql_core, scope_sql_to_tenant as scope_sql_to_tenant_core, tenant_scope_target_table as tenant_scope_target_table_core
 from segav_core.ui_tenant import allowed_client_keys_for_user as allowed_client_keys_for_user_core, filter_visible_clientes_df as filter_visible_clientes_df_core, resolve_active_client_key as resolve_active_client_key_core, client_key_is_visible as client_key_is_visible_core, active_company_admin_flag as active_company_admin_flag_core, company_role_for_user as company_role_for_user_core, company_caps_for_user as company_caps_for_user_core, tenant_object_path_allowed as tenant_object_path_allowed_core
 from segav_core.module_perms import ensure_user_client_module_perms_table, effective_company_perms
 from segav_core.db_migrations import apply_runtime_migrations
+from segav_core.ui import bind_script_ctx, deferred_download_data
 from segav_core.kpi_ui import kpi_card, kpi_grid, tone_for_percentage
 from segav_core.notifications import install_action_feedback, render_action_feedback, queue_action_feedback_from_tag
 from segav_core.logger import get_logger, log_action, log_security, log_error
 from segav_core.app_context import AppContext
-from segav_core.search import render_search_sidebar
+from segav_core.search import render_search_sidebar, text_search_mask
 from segav_core.notifications_persistent import (
     ensure_notifications_table, send_notification, get_unread_count,
     render_notification_badge, render_notification_panel, mark_all_read,
@@ -343,7 +350,19 @@ def _cacheable_params(params):
     return str(params)
 
 
+@st.cache_resource(show_spinner=False)
+def _db_write_state() -> dict:
+    # Vive en cache_resource porque las globals del script se reinician en cada rerun.
+    return {"epoch": 0}
+
+
+def db_write_epoch() -> int:
+    """Contador de escrituras del proceso; las caches caras lo usan como clave."""
+    return int(_db_write_state()["epoch"])
+
+
 def clear_app_caches():
+    _db_write_state()["epoch"] += 1
     try:
         _cached_fetch_df.clear()
     except Exception as exc:
@@ -415,8 +434,29 @@ def _safe_numeric_int(value, default: int = 0) -> int:
             return int(default)
 
 
+def _sqlite_db_signature(db_path: str = None):
+    """Firma (mtime, tamaño) de la base SQLite y su WAL.
+
+    Se incluye en la llave del cache de lecturas para que una escritura hecha
+    por otro proceso (API REST, scripts, restore) invalide los SELECT cacheados.
+    """
+    path = db_path or DB_PATH
+    sig = []
+    for candidate in (path, f"{path}-wal"):
+        try:
+            info = os.stat(candidate)
+            sig.append((info.st_mtime_ns, info.st_size))
+        except OSError:
+            sig.append(None)
+    return tuple(sig)
+
+
 @st.cache_data(ttl=120, show_spinner=False)
-def _cached_fetch_df(db_backend: str, dsn_fingerprint: str, q: str, params_cache):
+def _cached_fetch_df(db_backend: str, dsn_fingerprint: str, q: str, params_cache, db_sig=None, epoch: int = 0):
+    # ``epoch`` (db_write_epoch) versiona la llave: una lectura que estaba en
+    # curso mientras otra sesión escribía queda guardada bajo la época vieja y
+    # no puede "revivir" datos obsoletos después del clear() (clave en Postgres,
+    # donde no hay firma de archivo).
     params = tuple(params_cache) if isinstance(params_cache, tuple) else params_cache
     if db_backend == "postgres":
         q2 = _qmark_to_pct(q).replace("datetime('now')", "now()")
@@ -425,7 +465,10 @@ def _cached_fetch_df(db_backend: str, dsn_fingerprint: str, q: str, params_cache
     with conn() as c:
         return pd.read_sql_query(q, c, params=params)
 
+@lru_cache(maxsize=1024)
 def _is_select_query(q: str) -> bool:
+    # Las consultas son literales que se repiten en cada rerun: se memoiza para
+    # no pasar las dos regex de comentarios en cada fetch_df.
     txt = re.sub(r"/\*.*?\*/", " ", q or "", flags=re.S)
     txt = re.sub(r"--.*?$", " ", txt, flags=re.M).strip().lower()
     return txt.startswith("select") or txt.startswith("with")
@@ -859,8 +902,12 @@ def prepare_upload_payload(file_name: str, file_bytes: bytes, content_type: str
     if raw_size <= int(size_limit):
         return payload
 
-    zip_name, zip_bytes = _zip_single_file_bytes(raw_name, raw_bytes)
-    zip_size = len(zip_bytes)
+    if deflate_worthwhile(raw_name, raw_bytes):
+        zip_name, zip_bytes = _zip_single_file_bytes(raw_name, raw_bytes)
+        zip_size = len(zip_bytes)
+    else:
+        # Formato ya comprimido que no se reduce: se evita el deflate nivel 9 completo.
+        zip_name, zip_bytes, zip_size = None, None, raw_size
     if zip_size <= int(size_limit):
         payload.update({
             "file_name": zip_name,
@@ -883,19 +930,55 @@ def prepare_upload_payload(file_name: str, file_bytes: bytes, content_type: str
     st.stop()
 
 
-def save_file_online(folder_parts, file_name: str, file_bytes: bytes, content_type: str = "application/octet-stream"):
+def save_file_online(folder_parts, file_name: str, file_bytes: bytes, content_type: str = "application/octet-stream", *, dedupe: bool = False, record=None):
     # Guarda local (compatibilidad) + intenta subir a Storage (online).
+    # Devuelve (file_path, bucket, object_path, sha256); el sha256 se calcula
+    # al escribir en disco.
+    # Con dedupe la ruta sale del contenido (docs/<sha[:2]>/<sha>/<archivo>, dentro
+    # del tenant): si el mismo archivo ya se subió no se vuelve a escribir ni a
+    # subir a Storage. La ruta nunca se sobrescribe con otro contenido.
+    # ``record(file_path, bucket, object_path, sha)`` inserta la fila que
+    # referencia el archivo. La escritura local y la subida a Storage van fuera
+    # del lock; con dedupe solo la revisión de referencias y el INSERT corren
+    # bajo el lock de escritura de SQLite, y si un cleanup_deleted_file_refs
+    # borró el archivo compartido entretanto se vuelve a dejar antes de
+    # insertar. En Postgres ese lock no existe (cada operación usa su propia
+    # conexión): ahí la revisión y el INSERT no quedan serializados con el
+    # cleanup.
+    local_path, bucket, object_path, sha = _save_file_online_unlocked(folder_parts, file_name, file_bytes, content_type, dedupe=dedupe)
+    if not dedupe:
+        if record is not None:
+            record(local_path, bucket, object_path, sha)
+        return local_path, bucket, object_path, sha
+    with _db_write_guard():
+        if _count_file_refs(local_path, bucket, object_path) == 0 and not os.path.isfile(local_path):
+            local_path, bucket, object_path, sha = _save_file_online_unlocked(folder_parts, file_name, file_bytes, content_type, dedupe=dedupe)
+        if record is not None:
+            record(local_path, bucket, object_path, sha)
+    return local_path, bucket, object_path, sha
+
+
+def _save_file_online_unlocked(folder_parts, file_name: str, file_bytes: bytes, content_type: str, *, dedupe: bool):
     tenant_key = current_tenant_key()
     if not tenant_key:
         raise PermissionError('No hay empresa activa para almacenar archivos.')
+    if dedupe:
+        sha = sha256_bytes(file_bytes)
+        folder_parts = ["docs", sha[:2], sha]
     scoped_folder_parts = tenantize_folder_parts(folder_parts)
-    local_path = save_file(scoped_folder_parts, file_name, file_bytes)
+    if dedupe:
+        local_path = _local_upload_path(scoped_folder_parts, file_name)
+        if not os.path.isfile(local_path):
+            local_path = save_file(scoped_folder_parts, file_name, file_bytes)
+    else:
+        local_path, sha = save_file(scoped_folder_parts, file_name, file_bytes, with_sha256=True)
     object_path = _storage_object_path(scoped_folder_parts, file_name)
 
     bucket = STORAGE_BUCKET if storage_admin_enabled() else None
     if storage_admin_enabled():
         try:
-            storage_upload(object_path, file_bytes, content_type=content_type, upsert=True)
+            if not (dedupe and _count_file_refs(None, bucket, object_path) > 0):
+                storage_upload(object_path, file_bytes, content_type=content_type, upsert=True)
         except Exception:
             # No romper el flujo: deja el archivo local, pero informa.
             bucket = None
@@ -927,7 +1010,7 @@ def save_file_online(folder_parts, file_name: str, file_bytes: bytes, content_ty
             except Exception as _exc:
                 _record_soft_error("storage", _exc)
 
-    return local_path, bucket, object_path
+    return local_path, bucket, object_path, sha
 
 def _storage_path_is_tenant_safe(object_path: str | None, *, allow_legacy: bool = True) -> bool:
     op = str(object_path or '').strip().lstrip('/')
@@ -992,14 +1075,59 @@ def load_file_anywhere(file_path: str | None, bucket: str | None, object_path: s
                 last_error = exc
                 # Intenta ruta tenant nueva, ruta legacy y luego disco local.
                 continue
-    if file_path and os.path.exists(str(file_path)):
-        with open(str(file_path), "rb") as fp:
-            return fp.read()
+    if file_path:
+        try:
+            with open(str(file_path), "rb") as fp:
+                return fp.read()
+        except FileNotFoundError:
+            pass
     if last_error is not None:
         raise FileNotFoundError(f"Archivo no disponible (Storage/disco). Último intento: {last_error}")
     raise FileNotFoundError("Archivo no disponible (ni Storage ni disco local).")
 
 
+@st.cache_data(ttl=600, max_entries=32, show_spinner=False)
+def _load_file_cached(_backend: str, _dsn: str, tenant_key: str, file_path, bucket, object_path, epoch: int = 0) -> bytes | None:
+    data = load_file_anywhere(file_path, bucket, object_path)
+    # Sobre el límite se cachea solo None: el llamador lo relee sin cache.
+    return data if len(data) <= MAX_UPLOAD_FILE_BYTES else None
+
+
+def load_file_cached(file_path: str | None, bucket: str | None, object_path: str | None) -> bytes:
+    """``load_file_anywhere`` con cache hasta la próxima escritura.
+
+    Para los botones "Descargar documento": cada rerun de la página volvía a
+    leer el archivo del disco o a bajarlo de Storage aunque no cambiara. Solo
+    se cachean archivos de hasta MAX_UPLOAD_FILE_BYTES (1,5 MB); los mayores
+    (p.ej. los de la importación masiva por ZIP, que no pasan por ese límite)
+    se leen sin cache. Los errores no se cachean.
+    """
+    try:
+        too_big = bool(file_path) and os.path.getsize(str(file_path)) > MAX_UPLOAD_FILE_BYTES
+    except OSError:
+        too_big = False
+    if not too_big:
+        data = _load_file_cached(DB_BACKEND, PG_DSN_FINGERPRINT, current_tenant_key(), file_path, bucket, object_path, db_write_epoch())
+        if data is not None:
+            return data
+    return load_file_anywhere(file_path, bucket, object_path)
+
+
+def local_stream_path(file_path: str | None, bucket: str | None = None, object_path: str | None = None) -> str | None:
+    """Ruta en disco que se puede copiar por streaming, o None si debe pasar por load_file_anywhere.
+
+    Solo aplica sin Storage configurado: ahí load_file_anywhere lee exactamente
+    este archivo local, así que escribirlo con ``ZipFile.write`` es equivalente
+    y evita cargarlo completo en memoria.
+
+    No hace ``stat``: ``ZipFile.write`` ya lo hace al abrir el archivo, y si no
+    existe falla igual que lo haría ``load_file_anywhere`` sin Storage.
+    """
+    if not file_path or storage_enabled():
+        return None
+    return str(file_path)
+
+
 
 ESTADOS_FAENA = ["ACTIVA", "TERMINADA"]
 DOC_TIPO_LABELS = {
@@ -1611,18 +1739,26 @@ def ui_confirm_delete(label: str, key: str) -> bool:
     )
 
 
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
+@lru_cache(maxsize=1024)
 def safe_name(s: str) -> str:
-    s = (s or "").strip().lower()
-    s = re.sub(r"[^a-z0-9]+", "_", s)
-    return s.strip("_") or "item"
+    return _NON_ALNUM_RE.sub("_", (s or "").strip().lower()).strip("_") or "item"
 
 
 
 def fetch_df(q: str, params=()):
-    """SELECT con cache de corta duración (20 s). Usar para lecturas frecuentes."""
+    """SELECT con cache de corta duración. Usar para lecturas frecuentes.
+
+    La llave incluye la época de escrituras del proceso y, en SQLite, la firma
+    del archivo de base: el cache se invalida en cuanto hay una escritura desde
+    la app o la base cambia en disco.
+    """
     params_cache = _cacheable_params(params)
     if _is_select_query(q):
-        return _cached_fetch_df(DB_BACKEND, PG_DSN_FINGERPRINT, q, params_cache)
+        db_sig = _sqlite_db_signature() if DB_BACKEND == "sqlite" else None
+        return _cached_fetch_df(DB_BACKEND, PG_DSN_FINGERPRINT, q, params_cache, db_sig, db_write_epoch())
     if DB_BACKEND == "postgres":
         q2 = _qmark_to_pct(q).replace("datetime('now')", "now()")
         with conn() as c:
@@ -1641,6 +1777,35 @@ def fetch_df_uncached(q: str, params=()):
         return pd.read_sql_query(q, c, params=params)
 
 
+def fetch_first_row(q: str, params=()) -> dict | None:
+    """Primera fila como dict leyendo el cursor directo, sin construir un DataFrame.
+
+    Para agregados de una fila (conteos, KPIs) donde ``read_sql_query`` es puro
+    overhead. No pasa por el cache de ``fetch_df``.
+    """
+    with conn() as c:
+        cur = cursor_execute(c, q, params)
+        row = cur.fetchone()
+        if row is None:
+            return None
+        cols = [d[0] for d in (cur.description or [])]
+        return dict(zip(cols, row))
+
+
+def fetch_scalar(q: str, params=(), default=None):
+    """Primera columna de la primera fila, leída del cursor (sin DataFrame)."""
+    with conn() as c:
+        row = cursor_execute(c, q, params).fetchone()
+    return default if row is None else row[0]
+
+
+def fetch_col(q: str, params=()) -> list:
+    """Primera columna de todas las filas, leída del cursor (sin DataFrame)."""
+    with conn() as c:
+        cur = cursor_execute(c, q, params)
+        return [row[0] for row in cur.fetchall()]
+
+
 def fetch_row(q: str, params=(), fresh: bool = False):
     df = fetch_df_uncached(q, params) if fresh else fetch_df(q, params)
     if df is None or df.empty:
@@ -1649,6 +1814,9 @@ def fetch_row(q: str, params=(), fresh: bool = False):
 
 
 def fetch_value(q: str, params=(), default=None, fresh: bool = False):
+    if fresh:
+        # Sin cache no hay nada que reutilizar: evita armar un DataFrame de 1x1.
+        return fetch_scalar(q, params, default=default)
     row = fetch_row(q, params=params, fresh=fresh)
     if row is None:
         return default
@@ -1690,11 +1858,10 @@ def fetch_assigned_workers(faena_id: int, fresh: bool = True):
     return reader(q, tuple(params))
 
 
-def get_global_counts():
-    """Devuelve conteos básicos filtrados por empresa activa."""
-    tenant_key = current_tenant_key()
+@st.cache_data(ttl=120, max_entries=64, show_spinner=False)
+def _global_counts_cached(_backend: str, _dsn: str, tenant_key: str, epoch: int = 0, db_sig=None) -> dict:
     try:
-        row = fetch_df(
+        row = fetch_first_row(
             """
             SELECT
                 (SELECT COUNT(*) FROM mandantes WHERE COALESCE(cliente_key,'')=?) AS mandantes,
@@ -1711,9 +1878,9 @@ def get_global_counts():
             """,
             (tenant_key, tenant_key, tenant_key, tenant_key, tenant_key, tenant_key, tenant_key, tenant_key, tenant_key, tenant_key, tenant_key),
         )
-        if row.empty:
+        if not row:
             return {}
-        return {k: int(row.iloc[0].get(k, 0) or 0) for k in row.columns}
+        return {k: int(v or 0) for k, v in row.items()}
     except Exception:
         out = {}
         pairs = [
@@ -1731,17 +1898,17 @@ def get_global_counts():
         ]
         for key, sql in pairs:
             try:
-                out[key] = int(fetch_df(sql, (tenant_key,))["n"].iloc[0])
+                out[key] = int((fetch_first_row(sql, (tenant_key,)) or {}).get("n") or 0)
             except Exception:
                 out[key] = 0
         return out
 
 
-def norm_col(s: str) -> str:
-    s = (s or "").strip().lower()
-    s = s.replace("á","a").replace("é","e").replace("í","i").replace("ó","o").replace("ú","u").replace("ñ","n")
-    s = re.sub(r"[^a-z0-9]+", "_", s)
-    return s.strip("_")
+def get_global_counts():
+    """Devuelve conteos básicos filtrados por empresa activa."""
+    db_sig = _sqlite_db_signature() if DB_BACKEND == "sqlite" else None
+    return dict(_global_counts_cached(DB_BACKEND, PG_DSN_FINGERPRINT, current_tenant_key(), db_write_epoch(), db_sig))
+
 
 def _rut_parts(rut: str):
     return rut_parts_core(rut)
@@ -2031,12 +2198,27 @@ def sha256_bytes(data: bytes) -> str:
     h.update(data)
     return h.hexdigest()
 
+
+def read_file_bytes(path: str) -> bytes:
+    with open(path, "rb") as fp:
+        return fp.read()
+
+
+def sha256_file(path: str) -> str:
+    """SHA-256 de un archivo en disco por bloques (hashlib.file_digest), sin cargarlo en memoria."""
+    with open(path, "rb") as fp:
+        return hashlib.file_digest(fp, "sha256").hexdigest()
+
+def ensure_dir(path: str) -> str:
+    """Crea ``path`` si falta y lo devuelve (un solo stat si ya existe)."""
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
 def ensure_dirs():
-    os.makedirs(UPLOAD_ROOT, exist_ok=True)
-    os.makedirs(os.path.join(UPLOAD_ROOT, "exports"), exist_ok=True)
-    os.makedirs(os.path.join(UPLOAD_ROOT, "auto_backups"), exist_ok=True)
-    os.makedirs(os.path.join(UPLOAD_ROOT, "_backups"), exist_ok=True)
-    os.makedirs(os.path.join(UPLOAD_ROOT, "_exports_mes"), exist_ok=True)
+    ensure_dir(UPLOAD_ROOT)
+    for sub in ("exports", "auto_backups", "_backups", "_exports_mes"):
+        ensure_dir(os.path.join(UPLOAD_ROOT, sub))
 
 
 # ---------------------------------------------------------------
@@ -2066,12 +2248,22 @@ def _safe_path_parts(parts):
             result.append(safe)
     return result or ["misc"]
 
-def save_file(folder_parts, file_name: str, file_bytes: bytes) -> str:
-    """Guarda un archivo en disco local y devuelve la ruta."""
-    folder = os.path.join(UPLOAD_ROOT, *_safe_path_parts(folder_parts))
-    os.makedirs(folder, exist_ok=True)
-    path = os.path.join(folder, _storage_safe_segment(file_name))
+def _local_upload_path(folder_parts, file_name: str) -> str:
+    return os.path.join(UPLOAD_ROOT, *_safe_path_parts(folder_parts), _storage_safe_segment(file_name))
+
+
+def save_file(folder_parts, file_name: str, file_bytes: bytes, *, with_sha256: bool = False):
+    """Guarda un archivo en disco local y devuelve la ruta.
+
+    Con ``with_sha256`` escribe por bloques calculando el sha256 en la misma
+    pasada y devuelve ``(ruta, sha256)``.
+    """
+    ensure_dir(os.path.join(UPLOAD_ROOT, *_safe_path_parts(folder_parts)))
+    path = _local_upload_path(folder_parts, file_name)
     with open(path, "wb") as f:
+        if with_sha256:
+            sha, _size = write_hashed(file_bytes, f)
+            return path, sha
         f.write(file_bytes)
     return path
 
@@ -2090,7 +2282,7 @@ def fetch_file_refs(table_name: str, where_sql: str = "", params=()):
     df = fetch_df(q, params)
     if df is None or df.empty:
         return []
-    return [row.to_dict() for _, row in df.iterrows()]
+    return df.to_dict("records")
 
 def _count_file_refs(file_path, bucket, object_path, *, exclude_table=None, exclude_id=None):
     total = 0
@@ -2124,7 +2316,11 @@ def cleanup_deleted_file_refs(file_refs):
         if key in seen:
             continue
         seen.add(key)
-        if _count_file_refs(fp, bkt, op) == 0:
+        # Conteo y borrado bajo el mismo lock que save_file_online(dedupe=True)
+        # usa para revisar e insertar referencias a un archivo compartido.
+        with _db_write_guard():
+            if _count_file_refs(fp, bkt, op) != 0:
+                continue
             if op and storage_admin_enabled():
                 try:
                     storage_delete(str(op))
@@ -2132,8 +2328,9 @@ def cleanup_deleted_file_refs(file_refs):
                     issues.append(f"Storage: {e}")
             if fp:
                 try:
-                    if os.path.exists(str(fp)):
-                        os.remove(str(fp))
+                    os.remove(str(fp))
+                except FileNotFoundError:
+                    pass
                 except Exception as e:
                     issues.append(f"Local: {e}")
     return issues
@@ -2181,19 +2378,86 @@ def get_pg_pool(dsn: str):
 
 @st.cache_resource(show_spinner=False)
 def get_sqlite_connection(db_path: str):
-    c = sqlite3.connect(db_path, check_same_thread=False)
+    # La conexión es compartida y persistente, así que su cache de sentencias
+    # preparadas sirve entre reruns; el default (128) se queda corto para la app.
+    c = sqlite3.connect(db_path, check_same_thread=False, cached_statements=512)
     try:
         c.execute("PRAGMA foreign_keys = ON;")
         c.execute("PRAGMA journal_mode = WAL;")
         c.execute("PRAGMA synchronous = NORMAL;")
         c.execute("PRAGMA temp_store = MEMORY;")
         c.execute("PRAGMA cache_size = -64000;")
+        # Lecturas vía mmap (256 MB): evita copiar páginas al cache de SQLite.
+        c.execute("PRAGMA mmap_size = 268435456;")
         c.execute("PRAGMA busy_timeout = 5000;")
     except Exception as _exc:
         _record_soft_error("sqlite.pragmas", _exc)
     return c
 
 
+@st.cache_resource(show_spinner=False)
+def _sqlite_lock():
+    # Todas las sesiones comparten la misma conexión SQLite: sin este lock, el
+    # commit de una sesión (incluido el commit implícito al cerrar un
+    # ``with conn()`` de lectura) podría confirmar sentencias a medias de otra.
+    return threading.RLock()
+
+
+def _db_write_guard():
+    """Lock de escritura para SQLite; en Postgres cada operación usa su propia conexión del pool."""
+    if DB_BACKEND == "postgres":
+        return nullcontext()
+    return _sqlite_lock()
+
+
+class _SqliteConnectionScope:
+    """``with conn() as c`` sobre la conexión SQLite compartida, con el lock tomado.
+
+    ``sqlite3.Connection.__exit__`` confirma todo lo pendiente en la conexión,
+    así que también las lecturas deben serializarse con ``db_transaction``. La
+    conexión se resuelve ya dentro del lock: tras un restore se reabre sola.
+    """
+
+    def __init__(self):
+        self._lock = _sqlite_lock()
+        self._conn = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._conn = get_sqlite_connection(DB_PATH)
+            return self._conn.__enter__()
+        except BaseException:
+            self._lock.release()
+            raise
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            return self._conn.__exit__(exc_type, exc, tb)
+        finally:
+            self._lock.release()
+
+
+@st.cache_resource(show_spinner=False)
+def _sqlite_version_monitor(db_path: str):
+    # Su PRAGMA data_version cambia cada vez que otra conexión hace commit
+    # sobre el archivo, nunca con los suyos: solo escribe auto_backup_historial.
+    return sqlite3.connect(db_path, check_same_thread=False)
+
+
+def sqlite_data_version() -> int | None:
+    """Contador barato de cambios confirmados en app.db (None si no aplica)."""
+    if DB_BACKEND != "sqlite":
+        return None
+    try:
+        # Bajo el lock: un restore cierra y reemplaza esta conexión.
+        with _sqlite_lock():
+            return int(_sqlite_version_monitor(DB_PATH).execute("PRAGMA data_version").fetchone()[0])
+    except Exception as _exc:
+        _record_soft_error("sqlite.data_version", _exc)
+        return None
+
+
 def conn():
     # Postgres (Supabase) if configured; otherwise SQLite local.
     if DB_BACKEND == "postgres":
@@ -2213,7 +2477,7 @@ def conn():
                 f"Detalle: {msg}. "
                 "Revisa SUPABASE_DB_URL o usa secretos separados SUPABASE_DB_HOST, SUPABASE_DB_PORT, SUPABASE_DB_NAME, SUPABASE_DB_USER y SUPABASE_DB_PASSWORD."
             ) from e
-    return get_sqlite_connection(DB_PATH)
+    return _SqliteConnectionScope()
 
 def migrate_add_columns_if_missing(c, table: str, cols_sql: dict):
     if DB_BACKEND == "postgres":
@@ -2351,7 +2615,7 @@ def execute(q: str, params=()):
             c.execute(q2, params)
             c.commit()
             return
-    with conn() as c:
+    with _db_write_guard(), conn() as c:
         c.execute(q, params)
         c.commit()
 
@@ -2370,7 +2634,7 @@ def execute_rowcount(q: str, params=()):
                 return int(cur.rowcount or 0)
             except Exception:
                 return 0
-    with conn() as c:
+    with _db_write_guard(), conn() as c:
         cur = c.execute(q, params)
         c.commit()
         try:
@@ -2379,21 +2643,77 @@ def execute_rowcount(q: str, params=()):
             return 0
 
 
-def executemany(q: str, seq_params):
-    """Ejecuta DML en lote."""
+@contextmanager
+def db_transaction():
+    """Agrupa varias sentencias en una sola transacción (un único commit/fsync).
+
+    Uso: ``with db_transaction() as c: executemany(q, filas, c=c)``. Si algo
+    falla dentro del bloque se hace rollback y no queda nada a medias: en
+    SQLite ``conn()`` toma el mismo lock, así que ninguna otra sesión puede
+    hacer commit sobre la conexión compartida mientras el bloque está abierto.
+    """
+    with _db_write_guard(), conn() as c:
+        try:
+            # BEGIN explícito en SQLite: toma el lock de escritura al inicio y
+            # deja todo el bloque en una transacción (un fsync), sin depender
+            # del BEGIN implícito de sqlite3 antes del primer DML.
+            if DB_BACKEND != "postgres" and not c.in_transaction:
+                c.execute("BEGIN IMMEDIATE")
+            yield c
+            c.commit()
+        except Exception:
+            c.rollback()
+            raise
+
+
+def executemany(q: str, seq_params, c=None):
+    """Ejecuta DML en lote.
+
+    Con ``c`` (conexión de ``db_transaction``) no hace commit: queda dentro de
+    la transacción del llamador.
+    """
     if _is_dml_query(q):
         clear_app_caches()
     seq_params = [_normalize_rut_params_for_sql(q, p) for p in (seq_params or [])]
-    if DB_BACKEND == "postgres":
-        q2 = _qmark_to_pct(q).replace("datetime('now')", "now()")
-        with conn() as c:
+    if not seq_params:
+        return
+    if c is not None:
+        if DB_BACKEND == "postgres":
             with c.cursor() as cur:
-                cur.executemany(q2, seq_params)
-            c.commit()
-            return
-    with conn() as c:
-        c.executemany(q, seq_params)
-        c.commit()
+                cur.executemany(_qmark_to_pct(q).replace("datetime('now')", "now()"), seq_params)
+        else:
+            c.executemany(q, seq_params)
+        return
+    with db_transaction() as c:
+        executemany(q, seq_params, c=c)
+
+
+# Límite de parámetros por sentencia en SQLite (999 antes de 3.32).
+_SQLITE_MAX_VARS = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+_MULTI_INSERT_MAX_ROWS = 500
+
+
+def executemany_insert_multi(q: str, seq_params, c):
+    """INSERT ... VALUES(...) en lote con VALUES de varias filas por sentencia.
+
+    En SQLite un ``INSERT ... VALUES (...), (...), ...`` se prepara y ejecuta
+    una vez por bloque en vez de una vez por fila. Los bloques completos
+    repiten el mismo SQL y salen del cache de sentencias. ``c`` es la conexión de
+    ``db_transaction``; en Postgres delega en ``executemany``.
+    """
+    if DB_BACKEND == "postgres":
+        executemany(q, seq_params, c=c)
+        return
+    rows = [tuple(_normalize_rut_params_for_sql(q, p)) for p in (seq_params or [])]
+    if not rows:
+        return
+    clear_app_caches()
+    head, _sep, values = q.rpartition("VALUES")
+    values = values.strip()
+    per_stmt = max(1, min(_MULTI_INSERT_MAX_ROWS, _SQLITE_MAX_VARS // len(rows[0])))
+    for start in range(0, len(rows), per_stmt):
+        chunk = rows[start:start + per_stmt]
+        c.execute(f"{head}VALUES {','.join([values] * len(chunk))}", [v for row in chunk for v in row])
 
 
 def ensure_core_tables_postgres():
@@ -2541,7 +2861,8 @@ def ensure_core_tables_postgres():
             file_path TEXT NOT NULL,
             sha256 TEXT NOT NULL,
             size_bytes BIGINT NOT NULL,
-            created_at TEXT NOT NULL
+            created_at TEXT NOT NULL,
+            hash_algo TEXT -- algoritmo del digest en sha256 (NULL en filas antiguas: sha256)
         );
         """,
         """
@@ -2575,6 +2896,9 @@ def ensure_core_tables_postgres():
         "CREATE INDEX IF NOT EXISTS idx_empresa_documentos_doc_tipo ON empresa_documentos(doc_tipo);",
         "CREATE INDEX IF NOT EXISTS idx_faenas_estado ON faenas(estado);",
         "CREATE INDEX IF NOT EXISTS idx_asignaciones_estado ON asignaciones(estado);",
+        "CREATE INDEX IF NOT EXISTS idx_trabajador_documentos_trab_tipo ON trabajador_documentos(trabajador_id, doc_tipo);",
+        "CREATE INDEX IF NOT EXISTS idx_faena_empresa_documentos_faena_tipo ON faena_empresa_documentos(faena_id, doc_tipo);",
+        "CREATE INDEX IF NOT EXISTS idx_faena_empresa_documentos_periodo ON faena_empresa_documentos(periodo_anio, periodo_mes);",
     ]
     with conn() as c:
         for s in stmts + indexes:
@@ -2756,17 +3080,45 @@ def init_db():
             file_path TEXT NOT NULL,
             sha256 TEXT NOT NULL,
             size_bytes INTEGER NOT NULL,
-            created_at TEXT NOT NULL
+            created_at TEXT NOT NULL,
+            hash_algo TEXT -- algoritmo del digest en sha256 (NULL en filas antiguas: sha256)
         );
         ''')
+        migrate_add_columns_if_missing(c, "auto_backup_historial", {"hash_algo": "TEXT"})
 
         ensure_storage_columns_sqlite(c)
         ensure_sgsst_tables_sqlite(c)
         ensure_multiempresa_columns_sqlite(c)
+        ensure_core_indexes_sqlite(c)
         c.commit()
     ensure_sgsst_seed_data()
 
 
+def ensure_core_indexes_sqlite(c):
+    """Índices sobre las FK usadas por exportaciones, pendientes y progreso de faenas."""
+    for stmt in [
+        "CREATE INDEX IF NOT EXISTS idx_asignaciones_faena_id ON asignaciones(faena_id);",
+        "CREATE INDEX IF NOT EXISTS idx_asignaciones_trabajador_id ON asignaciones(trabajador_id);",
+        "CREATE INDEX IF NOT EXISTS idx_trabajador_documentos_trab_tipo ON trabajador_documentos(trabajador_id, doc_tipo);",
+        "CREATE INDEX IF NOT EXISTS idx_faena_empresa_documentos_faena_tipo ON faena_empresa_documentos(faena_id, doc_tipo);",
+        "CREATE INDEX IF NOT EXISTS idx_faena_anexos_faena_id ON faena_anexos(faena_id);",
+        "CREATE INDEX IF NOT EXISTS idx_faena_empresa_documentos_periodo ON faena_empresa_documentos(periodo_anio, periodo_mes);",
+        "CREATE INDEX IF NOT EXISTS idx_contratos_faena_mandante_id ON contratos_faena(mandante_id);",
+        "CREATE INDEX IF NOT EXISTS idx_faenas_mandante_estado ON faenas(mandante_id, estado);",
+    ]:
+        try:
+            c.execute(stmt)
+        except Exception as _exc:
+            _record_soft_error("init_db.core_indexes", _exc)
+    # Sin estadísticas el planner puede ignorar los índices; ANALYZE solo la
+    # primera vez y luego PRAGMA optimize (barato, re-analiza lo necesario).
+    try:
+        has_stats = c.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_stat1'").fetchone()
+        c.execute("PRAGMA optimize;" if has_stats else "ANALYZE;")
+    except Exception as _exc:
+        _record_soft_error("init_db.analyze", _exc)
+
+
 def ensure_sgsst_tables_postgres():
     if DB_BACKEND != "postgres":
         return
@@ -3131,23 +3483,37 @@ def ensure_sgsst_seed_data():
 # FUNCIONES UTILITARIAS RECONSTRUIDAS
 # ============================================================
 
+_ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+@lru_cache(maxsize=4096)
+def _parse_date_str(s: str):
+    # Camino rápido para ISO (lo que guarda la base); el resto prueba formatos.
+    if _ISO_DATE_RE.fullmatch(s):
+        try:
+            return date(int(s[0:4]), int(s[5:7]), int(s[8:10]))
+        except ValueError:
+            return None
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
 def parse_date_maybe(value):
     """Convierte un valor de fecha (str, date, datetime o None) a date o None."""
     if value is None:
         return None
-    if isinstance(value, date):
-        return value
     if isinstance(value, datetime):
         return value.date()
+    if isinstance(value, date):
+        return value
     s = str(value).strip()
     if not s or s in ("None", "nan", "NaT", ""):
         return None
-    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d"):
-        try:
-            return datetime.strptime(s, fmt).date()
-        except ValueError:
-            continue
-    return None
+    return _parse_date_str(s)
 
 
 def go(page_name: str, faena_id: int | None = None):
@@ -3158,8 +3524,70 @@ def go(page_name: str, faena_id: int | None = None):
     st.rerun()
 
 
+_COPY_BUFSIZE = 1 << 20
+
+
+def snapshot_sqlite_db(dst_path: str) -> None:
+    """Copia consistente de app.db con la API de backup de SQLite.
+
+    A diferencia de copiar el archivo, incluye lo que sigue en el WAL sin
+    checkpoint y no queda a medio escribir si otra sesión guarda en paralelo.
+    """
+    with closing(sqlite3.connect(DB_PATH)) as src, closing(sqlite3.connect(dst_path)) as dst:
+        # La copia se rehace entera si algo falla: sin journal ni sync por
+        # página, y un solo fsync del archivo terminado.
+        dst.execute("PRAGMA journal_mode = OFF;")
+        dst.execute("PRAGMA synchronous = OFF;")
+        src.backup(dst)
+    # "r+b": en Windows os.fsync (_commit) falla con un descriptor de solo lectura.
+    with open(dst_path, "r+b") as fp:
+        os.fsync(fp.fileno())
+
+
+def hash_backup_file(path: str) -> tuple:
+    """Devuelve (hash_algo, digest, size_bytes) de ``path`` leyendo por bloques.
+
+    El digest se guarda en auto_backup_historial.sha256, así que es siempre
+    SHA-256; ``hash_algo`` indica con qué algoritmo leer esa columna.
+    """
+    hash_algo, hasher = "sha256", hashlib.sha256()
+    size = 0
+    buf = bytearray(_COPY_BUFSIZE)
+    view = memoryview(buf)
+    with open(path, "rb") as src:
+        while True:
+            n = src.readinto(buf)
+            if not n:
+                break
+            hasher.update(view[:n])
+            size += n
+    return hash_algo, hasher.hexdigest(), size
+
+
+@st.cache_resource(show_spinner=False)
+def _auto_backup_state() -> dict:
+    return {"data_version": None}
+
+
+@contextmanager
+def _backup_history_conn():
+    """Conexión para escribir auto_backup_historial: la monitor, bajo el lock.
+
+    Registrar o podar backups desde aquí no mueve el data_version que usa
+    ``auto_backup_db``, así que no cuenta como un cambio pendiente de respaldar.
+    """
+    with _sqlite_lock():
+        mon = _sqlite_version_monitor(DB_PATH)
+        with mon:
+            yield mon
+    clear_app_caches()
+
+
 def auto_backup_db(tag: str = "auto"):
-    """Genera un backup automático y deja confirmación visual de acciones CRUD."""
+    """Genera un backup automático y deja confirmación visual de acciones CRUD.
+
+    Si app.db no cambió desde el último backup (PRAGMA data_version), no copia nada.
+    """
     try:
         queue_action_feedback_from_tag(tag)
     except Exception as _exc:
@@ -3170,69 +3598,153 @@ def auto_backup_db(tag: str = "auto"):
         db_path = DB_PATH
         if not os.path.exists(db_path):
             return
-        with open(db_path, "rb") as f:
-            raw = f.read()
-        sha = hashlib.sha256(raw).hexdigest()
-        size = len(raw)
+        state = _auto_backup_state()
+        version = sqlite_data_version()
+        if version is not None and version == state["data_version"]:
+            return
         now = datetime.now().isoformat(timespec="seconds")
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_dir = os.path.join(UPLOAD_ROOT, "_backups")
-        os.makedirs(backup_dir, exist_ok=True)
+        backup_dir = ensure_dir(os.path.join(UPLOAD_ROOT, "_backups"))
         safe_tag = re.sub(r"[^a-zA-Z0-9_-]", "_", (tag or "auto"))[:40]
         fname = f"backup_{ts}_{safe_tag}.db"
         fpath = os.path.join(backup_dir, fname)
-        with open(fpath, "wb") as f:
-            f.write(raw)
-        execute(
-            "INSERT INTO auto_backup_historial(tag, file_path, sha256, size_bytes, created_at) VALUES(?,?,?,?,?)",
-            (tag, fpath, sha, size, now),
-        )
-        # Mantiene solo los últimos 20 backups en historial
+        snapshot_sqlite_db(fpath)
+        hash_algo, sha, size = hash_backup_file(fpath)
+        with _backup_history_conn() as c:
+            c.execute(
+                "INSERT INTO auto_backup_historial(tag, file_path, sha256, size_bytes, created_at, hash_algo) VALUES(?,?,?,?,?,?)",
+                (tag, fpath, sha, size, now, hash_algo),
+            )
+        # La versión leída antes del snapshot: un commit de otra sesión durante
+        # la copia deja la marca atrás y dispara el siguiente backup.
+        state["data_version"] = version
+        # Mantiene solo los últimos 20 backups en historial. Es best-effort: si
+        # falla, el backup recién registrado se conserva igual.
         try:
-            old = fetch_df("SELECT id, file_path FROM auto_backup_historial ORDER BY id DESC LIMIT -1 OFFSET 20")
-            if old is not None and not old.empty:
-                for _, row in old.iterrows():
-                    try:
-                        if row.get("file_path") and os.path.exists(str(row["file_path"])):
-                            os.remove(str(row["file_path"]))
-                    except Exception as _exc:
-                        _record_soft_error("line_2382", _exc)
-                    execute("DELETE FROM auto_backup_historial WHERE id=?", (int(row["id"]),))
+            with _backup_history_conn() as c:
+                old = c.execute("SELECT id, file_path FROM auto_backup_historial ORDER BY id DESC LIMIT -1 OFFSET 20").fetchall()
+                c.executemany("DELETE FROM auto_backup_historial WHERE id=?", [(int(i),) for i, _ in old])
+            for _, old_path in old:
+                if not old_path:
+                    continue
+                try:
+                    os.remove(str(old_path))
+                except FileNotFoundError:
+                    pass
+                except Exception as _exc:
+                    _record_soft_error("auto_backup.cleanup_file", _exc)
         except Exception as _exc:
-            _record_soft_error("delete", _exc)
+            _record_soft_error("auto_backup.prune", _exc)
     except Exception as _exc:
         _record_soft_error("delete", _exc)
 
 
-def restore_from_backup_zip(zip_bytes: bytes):
-    """Restaura la base de datos SQLite desde un ZIP de backup."""
-    if DB_BACKEND != "sqlite":
-        raise RuntimeError("La restauración manual solo está disponible con SQLite.")
-    mem = io.BytesIO(zip_bytes)
-    with zipfile.ZipFile(mem, "r") as zf:
-        db_files = [n for n in zf.namelist() if n.endswith(".db")]
-        if not db_files:
-            raise ValueError("El ZIP no contiene ningún archivo .db")
-        db_file = db_files[0]
-        db_bytes = zf.read(db_file)
-    backup_path = DB_PATH + ".pre_restore_backup"
+# Flags de sesión que evitan repetir CREATE TABLE/ALTER en cada rerun. Tras
+# restaurar una base (posiblemente con un esquema más antiguo) hay que soltarlos.
+_SCHEMA_SESSION_GUARDS = (
+    "_ensure_users_table_ok",
+    "_ensure_user_sessions_ok",
+    "_ensure_access_governance_ok",
+    "_ensure_superadmin_ok",
+)
+
+
+def _reset_schema_session_guards() -> None:
+    for _key in _SCHEMA_SESSION_GUARDS:
+        st.session_state.pop(_key, None)
+
+
+def _release_sqlite_connections() -> None:
+    """Cierra y olvida las conexiones SQLite cacheadas (antes de reemplazar app.db)."""
+    for _factory in (get_sqlite_connection, _sqlite_version_monitor):
+        try:
+            _factory(DB_PATH).close()
+        except Exception as _exc:
+            _record_soft_error("restore.close_connection", _exc)
+        try:
+            _factory.clear()
+        except Exception as _exc:
+            _record_soft_error("restore.clear_connection", _exc)
+
+
+def _before_sqlite_swap() -> None:
     if os.path.exists(DB_PATH):
-        with open(DB_PATH, "rb") as f:
-            with open(backup_path, "wb") as bf:
-                bf.write(f.read())
-    with open(DB_PATH, "wb") as f:
-        f.write(db_bytes)
+        # Vuelca el WAL a app.db para que el respaldo previo quede completo.
+        get_sqlite_connection(DB_PATH).execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    _release_sqlite_connections()
+
+
+def _after_sqlite_restore() -> None:
     clear_app_caches()
+    # El bootstrap ya corrió para este proceso; la base restaurada puede venir
+    # de una versión anterior, así que el esquema se revisa aquí explícitamente.
+    _reset_schema_session_guards()
+    init_db()
+
+
+def restore_from_backup_zip(zip_source):
+    """Restaura la base de datos SQLite desde un ZIP de backup.
+
+    Acepta bytes o un archivo abierto (p.ej. el UploadedFile de Streamlit). El
+    .db se escribe una sola vez, por bloques, junto a DB_PATH y luego se
+    intercambia por renombre: la base anterior queda como ``.pre_restore_backup``
+    sin copiarla.
+    """
+    if DB_BACKEND != "sqlite":
+        raise RuntimeError("La restauración manual solo está disponible con SQLite.")
+    src = io.BytesIO(zip_source) if isinstance(zip_source, (bytes, bytearray)) else zip_source
+    with zipfile.ZipFile(src, "r") as zf:
+        # Con el lock tomado ninguna sesión lee ni escribe durante el cambio;
+        # las conexiones se reabren solas en el siguiente conn().
+        restore_sqlite_from_zip(zf, DB_PATH, lock=_db_write_guard(), before_swap=_before_sqlite_swap)
+    _after_sqlite_restore()
+
+
+def restore_from_db_file(db_source):
+    """Restaura app.db desde un archivo .db subido, con el mismo intercambio que el ZIP."""
+    if DB_BACKEND != "sqlite":
+        raise RuntimeError("La restauración manual solo está disponible con SQLite.")
+    src = io.BytesIO(db_source) if isinstance(db_source, (bytes, bytearray)) else db_source
+    try:
+        src.seek(0)
+    except Exception:
+        pass
+    restore_sqlite_from_file(src, DB_PATH, lock=_db_write_guard(), before_swap=_before_sqlite_swap, label=str(getattr(src, "name", "") or "El archivo"))
+    _after_sqlite_restore()
+
+
+@st.cache_data(ttl=600, max_entries=256, show_spinner=False)
+def _pendientes_obligatorios_detalle_cached(_backend: str, _dsn: str, tenant_key: str, faena_id: int, epoch: int = 0, db_sig=None) -> list:
+    return pendientes_obligatorios_detalle_logic(fetch_df, worker_required_docs, faena_id)
+
+
+def pendientes_obligatorios_detalle(faena_id: int) -> list:
+    """Filas rut/nombre/cargo/faltantes por trabajador asignado (cacheado hasta la próxima escritura)."""
+    db_sig = _sqlite_db_signature() if DB_BACKEND == "sqlite" else None
+    return _pendientes_obligatorios_detalle_cached(DB_BACKEND, PG_DSN_FINGERPRINT, current_tenant_key(), int(faena_id), db_write_epoch(), db_sig)
 
 
 def pendientes_obligatorios(faena_id: int) -> dict:
-    """Retorna documentos faltantes por trabajador asignado a la faena."""
-    return pendientes_obligatorios_logic(fetch_df, worker_required_docs, faena_id)
+    """Retorna documentos faltantes por trabajador asignado a la faena (cacheado hasta la próxima escritura)."""
+    return {r["nombre"]: r["faltantes"] for r in pendientes_obligatorios_detalle(faena_id)}
+
+
+@st.cache_data(ttl=600, max_entries=256, show_spinner=False)
+def _faena_empresa_doc_tipos_cached(_backend: str, _dsn: str, faena_id: int, epoch: int = 0, db_sig=None) -> frozenset:
+    return frozenset(
+        str(v) for v in fetch_col("SELECT DISTINCT doc_tipo FROM faena_empresa_documentos WHERE faena_id=?", (int(faena_id),))
+    )
+
+
+def faena_empresa_doc_tipos(faena_id: int) -> frozenset:
+    """Set de doc_tipo empresa/faena cargados para la faena (cacheado hasta la próxima escritura)."""
+    db_sig = _sqlite_db_signature() if DB_BACKEND == "sqlite" else None
+    return _faena_empresa_doc_tipos_cached(DB_BACKEND, PG_DSN_FINGERPRINT, int(faena_id), db_write_epoch(), db_sig)
 
 
 def pendientes_empresa_faena(faena_id: int) -> list:
     """Retorna documentos empresa/faena faltantes para una faena."""
-    return pendientes_empresa_faena_logic(fetch_df, get_empresa_monthly_doc_types, faena_id)
+    return pendientes_empresa_faena_logic(fetch_df, get_empresa_monthly_doc_types, faena_id, present_doc_types=faena_empresa_doc_tipos)
 
 
 def validate_faena_dates(fi, ft, estado: str) -> list:
@@ -3252,49 +3764,50 @@ def validate_faena_dates(fi, ft, estado: str) -> list:
     return errors
 
 
-@st.cache_data(ttl=60, show_spinner=False)
-def _faena_progress_cached(_backend: str, _dsn: str, _tenant: str):
-    """Query cacheada para faena_progress_table."""
+_FAENA_PROGRESS_SQL = """
+SELECT
+    f.id AS faena_id,
+    m.nombre AS mandante,
+    f.nombre AS faena,
+    f.estado,
+    f.fecha_inicio,
+    f.fecha_termino,
+    COALESCE(w.trabajadores, 0) AS trabajadores,
+    COALESCE(w.trab_ok, 0) AS trab_ok
+FROM faenas f
+JOIN mandantes m ON m.id=f.mandante_id
+LEFT JOIN (
+    SELECT a.faena_id,
+           COUNT(*) AS trabajadores,
+           COUNT(DISTINCT td.trabajador_id) AS trab_ok
+      FROM asignaciones a
+      LEFT JOIN (SELECT DISTINCT trabajador_id FROM trabajador_documentos) td
+             ON td.trabajador_id=a.trabajador_id
+     GROUP BY a.faena_id
+) w ON w.faena_id=f.id
+ORDER BY f.id DESC
+"""
+
+
+@st.cache_data(ttl=600, max_entries=64, show_spinner=False)
+def _faena_progress_cached(_backend: str, _dsn: str, tenant: str, epoch: int = 0, db_sig=None):
+    """Query cacheada para faena_progress_table.
+
+    ``tenant``, ``epoch`` y ``db_sig`` van sin guion bajo a propósito: Streamlit
+    excluye de la llave del cache los argumentos que empiezan con ``_``.
+    """
     try:
-        df = fetch_df("""
-            SELECT
-                f.id AS faena_id,
-                m.nombre AS mandante,
-                f.nombre AS faena,
-                f.estado,
-                f.fecha_inicio,
-                f.fecha_termino,
-                (SELECT COUNT(*) FROM asignaciones a WHERE a.faena_id=f.id) AS trabajadores,
-                (SELECT COUNT(DISTINCT a2.trabajador_id)
-                   FROM asignaciones a2
-                   JOIN trabajador_documentos td ON td.trabajador_id=a2.trabajador_id
-                  WHERE a2.faena_id=f.id) AS trab_ok
-            FROM faenas f
-            JOIN mandantes m ON m.id=f.mandante_id
-            ORDER BY f.id DESC
-        """)
+        # Conteos agregados en SQL con GROUP BY (sin subconsultas correlacionadas
+        # por faena) y faltantes de todas las faenas en una sola pasada.
+        df = fetch_df(_FAENA_PROGRESS_SQL)
         if df is None or df.empty:
             return pd.DataFrame()
-        # Calculate coverage and missing
-        rows = []
-        for _, r in df.iterrows():
-            fid = int(r["faena_id"])
-            tr = int(r["trabajadores"] or 0)
-            trok = int(r["trab_ok"] or 0)
-            try:
-                pend = pendientes_obligatorios(fid)
-                falt = sum(len(v) for v in pend.values()) if pend else 0
-            except Exception:
-                falt = 0
-            pct = 0.0
-            if tr > 0:
-                pct = round((trok / tr) * 100.0, 1)
-            rows.append({
-                **r.to_dict(),
-                "cobertura_docs_pct": pct,
-                "faltantes_total": falt,
-            })
-        return pd.DataFrame(rows)
+        tr = pd.to_numeric(df["trabajadores"], errors="coerce").fillna(0)
+        trok = pd.to_numeric(df["trab_ok"], errors="coerce").fillna(0)
+        df["cobertura_docs_pct"] = (trok / tr.where(tr > 0) * 100.0).round(1).fillna(0.0)
+        faltantes = faltantes_por_faena_logic(fetch_df, worker_required_docs)
+        df["faltantes_total"] = df["faena_id"].astype(int).map(faltantes).fillna(0).astype(int)
+        return df
     except Exception:
         return pd.DataFrame()
 
@@ -3303,11 +3816,61 @@ def faena_progress_table():
     """Tabla de progreso de faenas con semáforo de cobertura documental."""
     try:
         tenant = current_segav_client_key() or ""
-        return _faena_progress_cached(DB_BACKEND, PG_DSN_FINGERPRINT, tenant)
+        db_sig = _sqlite_db_signature() if DB_BACKEND == "sqlite" else None
+        return _faena_progress_cached(DB_BACKEND, PG_DSN_FINGERPRINT, tenant, db_write_epoch(), db_sig)
     except Exception:
         return pd.DataFrame()
 
 
+_TRABAJADORES_LISTING_SQL = """
+SELECT
+    t.id,
+    t.rut,
+    t.apellidos,
+    t.nombres,
+    t.cargo,
+    COALESCE(
+        (
+            SELECT f.nombre
+            FROM asignaciones a
+            JOIN faenas f ON f.id = a.faena_id
+            WHERE a.trabajador_id = t.id
+              AND COALESCE(NULLIF(TRIM(UPPER(a.estado)), ''), 'ACTIVA') <> 'CERRADA'
+            ORDER BY a.id DESC
+            LIMIT 1
+        ),
+        'PLANTA'
+    ) AS faena_actual,
+    t.email,
+    t.fecha_contrato,
+    t.vigencia_examen
+FROM trabajadores t
+ORDER BY t.id DESC
+"""
+_TRABAJADORES_SEARCH_COLS = ("rut", "apellidos", "nombres", "cargo", "faena_actual")
+
+
+@st.cache_data(ttl=600, max_entries=64, show_spinner=False)
+def _trabajadores_listing_cached(_backend: str, _dsn: str, tenant: str, query: str = "", epoch: int = 0, db_sig=None):
+    """Listado de trabajadores del tenant, filtrado por ``query`` si viene.
+
+    Una entrada por texto de búsqueda; ``epoch``/``db_sig`` la invalidan con
+    cualquier escritura, igual que ``fetch_df``.
+    """
+    df = tenant_fetch_df(_TRABAJADORES_LISTING_SQL)
+    if query and df is not None and not df.empty:
+        df = df[text_search_mask(df, query, _TRABAJADORES_SEARCH_COLS)]
+    return df
+
+
+def trabajadores_listing(query: str = ""):
+    """Listado de la pestaña Trabajadores; ``query`` filtra por RUT, nombre, cargo o faena."""
+    db_sig = _sqlite_db_signature() if DB_BACKEND == "sqlite" else None
+    return _trabajadores_listing_cached(
+        DB_BACKEND, PG_DSN_FINGERPRINT, current_tenant_key(), (query or "").strip().lower(), db_write_epoch(), db_sig
+    )
+
+
 def _export_collect_files(faena_id: int,
                           include_global_empresa_docs: bool = True,
                           include_contrato: bool = True,
@@ -3348,7 +3911,7 @@ def _export_collect_files(faena_id: int,
     if include_anexos:
         anexos = tenant_fetch_df("SELECT id, nombre, file_path, bucket, object_path FROM faena_anexos WHERE faena_id=? ORDER BY id", (int(faena_id),))
         if anexos is not None and not anexos.empty:
-            for _, r in anexos.iterrows():
+            for r in anexos.to_dict("records"):
                 if selected_anexo_ids is not None and int(r.get("id", 0)) not in selected_anexo_ids:
                     continue
                 if r.get("file_path") or r.get("object_path"):
@@ -3365,7 +3928,7 @@ def _export_collect_files(faena_id: int,
             emp_docs = tenant_fetch_df(q_emp)
         if emp_docs is not None and not emp_docs.empty:
             _use_type_filter_eg = selected_empresa_global_doc_ids is None
-            for _, r in emp_docs.iterrows():
+            for r in emp_docs.to_dict("records"):
                 if selected_empresa_global_doc_ids is not None and int(r["id"]) not in selected_empresa_global_doc_ids:
                     continue
                 if _use_type_filter_eg and doc_types_empresa_global and r.get("doc_tipo") not in doc_types_empresa_global:
@@ -3380,7 +3943,7 @@ def _export_collect_files(faena_id: int,
         if ef_docs is not None and not ef_docs.empty:
             # Si hay selección específica de IDs, NO aplicar filtro por tipo
             _use_type_filter_ef = selected_empresa_faena_doc_ids is None
-            for _, r in ef_docs.iterrows():
+            for r in ef_docs.to_dict("records"):
                 if selected_empresa_faena_doc_ids is not None and int(r["id"]) not in selected_empresa_faena_doc_ids:
                     continue
                 if _use_type_filter_ef and doc_types_empresa_faena and r.get("doc_tipo") not in doc_types_empresa_faena:
@@ -3390,25 +3953,28 @@ def _export_collect_files(faena_id: int,
 
     # Documentos trabajadores
     if include_trabajadores:
-        trab = tenant_fetch_df("""
-            SELECT t.id, t.rut, t.apellidos || ' ' || t.nombres AS nombre
-            FROM asignaciones a JOIN trabajadores t ON t.id=a.trabajador_id
-            WHERE a.faena_id=? AND COALESCE(NULLIF(TRIM(a.estado),''),'ACTIVA')='ACTIVA'
-            ORDER BY t.apellidos, t.nombres
-        """, (int(faena_id),))
-        if trab is not None and not trab.empty:
-            for _, tr in trab.iterrows():
-                tid = int(tr["id"])
+        # Una sola consulta trabajadores+documentos en vez de una por trabajador.
+        tenant_key = str(current_tenant_key() or '').strip()
+        trab_docs = fetch_df("""
+            SELECT t.id AS trabajador_id, t.apellidos || ' ' || t.nombres AS nombre,
+                   d.id, d.doc_tipo, d.nombre_archivo, d.file_path, d.bucket, d.object_path
+            FROM asignaciones a
+            JOIN trabajadores t ON t.id=a.trabajador_id
+            JOIN trabajador_documentos d ON d.trabajador_id=t.id AND COALESCE(d.cliente_key,'')=?
+            WHERE a.faena_id=? AND COALESCE(a.cliente_key,'')=?
+              AND COALESCE(NULLIF(TRIM(a.estado),''),'ACTIVA')='ACTIVA'
+            ORDER BY t.apellidos, t.nombres, t.id, d.doc_tipo, d.id
+        """, (tenant_key, int(faena_id), tenant_key))
+        if trab_docs is not None and not trab_docs.empty:
+            for (tid, nombre), t_docs in trab_docs.groupby(["trabajador_id", "nombre"], sort=False):
+                tid = int(tid)
                 if selected_trabajador_ids is not None and tid not in selected_trabajador_ids:
                     continue
-                t_docs = tenant_fetch_df("SELECT id, doc_tipo, nombre_archivo, file_path, bucket, object_path FROM trabajador_documentos WHERE trabajador_id=? ORDER BY doc_tipo, id", (tid,))
-                if t_docs is None or t_docs.empty:
-                    continue
-                folder_name = re.sub(r"[^a-zA-Z0-9 _.-]", "_", str(tr["nombre"]))[:40]
+                folder_name = re.sub(r"[^a-zA-Z0-9 _.-]", "_", str(nombre))[:40]
                 # Si hay selección específica de IDs para este trabajador, NO aplicar filtro por tipo
                 _sel_ids_for_worker = (selected_trabajador_doc_ids or {}).get(tid)
                 _use_type_filter_trab = _sel_ids_for_worker is None
-                for _, dr in t_docs.iterrows():
+                for dr in t_docs.to_dict("records"):
                     did = int(dr["id"])
                     if _sel_ids_for_worker is not None and did not in _sel_ids_for_worker:
                         continue
@@ -3435,21 +4001,49 @@ def export_zip_for_faena(faena_id: int, **kwargs) -> tuple:
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     zip_name = f"export_{faena_nombre}_{ts}.zip"
     entries = _export_collect_files(faena_id, **kwargs)
-    result = build_zip_from_entries(entries, load_file_anywhere)
+    result = build_zip_from_entries(
+        entries,
+        bind_script_ctx(load_file_anywhere),
+        resolve_local_path=local_stream_path,
+        load_workers=EXPORT_LOAD_WORKERS if storage_enabled() else 1,
+    )
     zip_bytes, included, skipped, skipped_names = result
     return zip_bytes, zip_name, included, skipped, skipped_names
 
 
-def persist_export(faena_id: int, zip_bytes: bytes, zip_name: str) -> str:
-    """Guarda un ZIP de export en disco + Supabase Storage y registra en export_historial."""
+def _store_export_zip(zip_source, fpath: str) -> tuple:
+    """Deja el ZIP en ``fpath`` y devuelve (sha256, size_bytes).
+
+    ``zip_source`` puede ser bytes en memoria o la ruta de un ZIP ya escrito en
+    disco; en ese caso se mueve sin copiarlo a RAM y se hashea por bloques.
+    Los bytes se hashean mientras se escriben (una sola pasada por el buffer).
+    """
+    if isinstance(zip_source, (bytes, bytearray, memoryview)):
+        with open(fpath, "wb") as f:
+            return write_hashed(zip_source, f)
+    src = os.fspath(zip_source)
+    if os.path.abspath(src) != os.path.abspath(fpath):
+        shutil.move(src, fpath)
+    return sha256_file(fpath), os.path.getsize(fpath)
+
+
+def _export_zip_payload(zip_source, fpath: str) -> bytes:
+    if isinstance(zip_source, (bytes, bytearray, memoryview)):
+        return bytes(zip_source)
+    with open(fpath, "rb") as f:
+        return f.read()
+
+
+def persist_export(faena_id: int, zip_bytes, zip_name: str) -> str:
+    """Guarda un ZIP de export en disco + Supabase Storage y registra en export_historial.
+
+    ``zip_bytes`` acepta los bytes del ZIP o la ruta de un ZIP ya generado en disco.
+    """
     tenant_key = str(current_tenant_key() or '').strip()
     tenant_slug = storage_safe_segment(tenant_key or 'tenant')
-    export_dir = os.path.join(UPLOAD_ROOT, "_exports", tenant_slug, str(faena_id))
-    os.makedirs(export_dir, exist_ok=True)
+    export_dir = ensure_dir(os.path.join(UPLOAD_ROOT, "_exports", tenant_slug, str(faena_id)))
     fpath = os.path.join(export_dir, zip_name)
-    with open(fpath, "wb") as f:
-        f.write(zip_bytes)
-    sha = hashlib.sha256(zip_bytes).hexdigest()
+    sha, size = _store_export_zip(zip_bytes, fpath)
     now = datetime.now().isoformat(timespec="seconds")
 
     # Upload to Supabase Storage if available
@@ -3458,7 +4052,7 @@ def persist_export(faena_id: int, zip_bytes: bytes, zip_name: str) -> str:
     if storage_admin_enabled():
         try:
             obj_path = f"clientes/{tenant_slug}/_exports/{faena_id}/{zip_name}"
-            storage_upload(obj_path, zip_bytes, content_type="application/zip", upsert=True)
+            storage_upload(obj_path, _export_zip_payload(zip_bytes, fpath), content_type="application/zip", upsert=True)
             bucket = STORAGE_BUCKET
         except Exception as _exc:
             _record_soft_error("persist_export.storage_upload", _exc)
@@ -3467,11 +4061,35 @@ def persist_export(faena_id: int, zip_bytes: bytes, zip_name: str) -> str:
 
     tenant_execute(
         "INSERT INTO export_historial(faena_id, file_path, sha256, size_bytes, created_at, bucket, object_path) VALUES(?,?,?,?,?,?,?)",
-        (int(faena_id), fpath, sha, len(zip_bytes), now, bucket, obj_path),
+        (int(faena_id), fpath, sha, size, now, bucket, obj_path),
     )
     return fpath
 
 
+def _max_parallel_exports() -> int:
+    try:
+        return max(1, int(str(_get_cfg("MAX_PARALLEL_EXPORTS", "1") or "1").strip()))
+    except ValueError:
+        return 1
+
+
+@st.cache_resource(show_spinner=False)
+def _export_executor() -> ThreadPoolExecutor:
+    # Pool compartido por el proceso. Cada build retiene el ZIP completo en RAM,
+    # así que por defecto se arma uno a la vez entre todas las sesiones
+    # (MAX_PARALLEL_EXPORTS) y el resto espera en la cola del pool.
+    return ThreadPoolExecutor(max_workers=_max_parallel_exports(), thread_name_prefix="segav-export")
+
+
+# Descargas concurrentes desde Storage al armar un ZIP de faena.
+EXPORT_LOAD_WORKERS = 4
+
+
+def submit_export_job(fn, *args, **kwargs):
+    """Lanza un build de ZIP en el pool de exports y devuelve el Future."""
+    return _export_executor().submit(bind_script_ctx(fn), *args, **kwargs)
+
+
 def export_zip_for_mes(year: int, month: int, include_global_empresa_docs: bool = True) -> tuple:
     """Genera un ZIP mensual acotado a la empresa activa."""
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -3480,32 +4098,51 @@ def export_zip_for_mes(year: int, month: int, include_global_empresa_docs: bool
     tenant_slug = storage_safe_segment(tenant_key or 'tenant')
 
     mem = io.BytesIO()
-    with zipfile.ZipFile(mem, "w", zipfile.ZIP_DEFLATED) as zf:
+    with zipfile.ZipFile(mem, "w", zipfile.ZIP_DEFLATED, compresslevel=ZIP_COMPRESSLEVEL, strict_timestamps=False) as zf:
+        # Un mismo archivo (mismo sha256) subido a varias faenas se escribe una
+        # sola vez; las demás rutas llevan un .txt que apunta a la primera copia.
+        written_sha: dict[str, str] = {}
+
+        def _write_doc(arc: str, r) -> None:
+            sha = str(r.get("sha256") or "").strip()
+            if sha and sha in written_sha:
+                zf.writestr(f"{arc}.txt", f"Archivo idéntico incluido en: {written_sha[sha]}\n")
+                return
+            src = local_stream_path(r.get("file_path"))
+            ctype = zip_compress_type(arc)
+            if src:
+                zf.write(src, arc, compress_type=ctype)
+            else:
+                zf.writestr(arc, load_file_anywhere(r.get("file_path"), r.get("bucket"), r.get("object_path")), compress_type=ctype)
+            if sha:
+                written_sha[sha] = arc
+
+        # year/month nunca son 0 aquí, así que se compara la columna directa (sin
+        # COALESCE) para que idx_faena_empresa_documentos_periodo sea utilizable.
         allowed_mands = current_user_mandante_scope_ids() if 'current_user_mandante_scope_ids' in globals() else None
         if allowed_mands is not None:
             if allowed_mands:
                 ph = ','.join(['?'] * len(allowed_mands))
                 ef_docs = tenant_fetch_df(
-                    f"SELECT id, faena_id, doc_tipo, nombre_archivo, file_path, bucket, object_path FROM faena_empresa_documentos WHERE COALESCE(periodo_anio,0)=? AND COALESCE(periodo_mes,0)=? AND mandante_id IN ({ph}) ORDER BY faena_id, doc_tipo, id",
+                    f"SELECT id, faena_id, doc_tipo, nombre_archivo, file_path, bucket, object_path, sha256 FROM faena_empresa_documentos WHERE periodo_anio=? AND periodo_mes=? AND mandante_id IN ({ph}) ORDER BY faena_id, doc_tipo, id",
                     (int(year), int(month), *allowed_mands),
                 )
             else:
                 ef_docs = tenant_fetch_df(
-                    "SELECT id, faena_id, doc_tipo, nombre_archivo, file_path, bucket, object_path FROM faena_empresa_documentos WHERE 1=0",
+                    "SELECT id, faena_id, doc_tipo, nombre_archivo, file_path, bucket, object_path, sha256 FROM faena_empresa_documentos WHERE 1=0",
                     (),
                 )
         else:
             ef_docs = tenant_fetch_df(
-                "SELECT id, faena_id, doc_tipo, nombre_archivo, file_path, bucket, object_path FROM faena_empresa_documentos WHERE COALESCE(periodo_anio,0)=? AND COALESCE(periodo_mes,0)=? ORDER BY faena_id, doc_tipo, id",
+                "SELECT id, faena_id, doc_tipo, nombre_archivo, file_path, bucket, object_path, sha256 FROM faena_empresa_documentos WHERE periodo_anio=? AND periodo_mes=? ORDER BY faena_id, doc_tipo, id",
                 (int(year), int(month)),
             )
         if ef_docs is not None and not ef_docs.empty:
-            for _, r in ef_docs.iterrows():
+            for r in ef_docs.to_dict("records"):
                 try:
-                    fb = load_file_anywhere(r.get("file_path"), r.get("bucket"), r.get("object_path"))
                     fname = str(r.get("nombre_archivo") or r.get("file_path") or r.get("object_path") or f"doc_{r['id']}")
                     arc = f"{tenant_slug}/Faena_{r['faena_id']}/{os.path.basename(fname)}"
-                    zf.writestr(arc, fb)
+                    _write_doc(arc, r)
                 except Exception:
                     continue
 
@@ -3513,36 +4150,35 @@ def export_zip_for_mes(year: int, month: int, include_global_empresa_docs: bool
             if allowed_mands is not None:
                 if allowed_mands:
                     ph = ','.join(['?'] * len(allowed_mands))
-                    emp_docs = tenant_fetch_df(f"SELECT doc_tipo, nombre_archivo, file_path, bucket, object_path FROM empresa_documentos WHERE COALESCE(mandante_id,0)=0 OR mandante_id IN ({ph}) ORDER BY doc_tipo, id", tuple(allowed_mands))
+                    emp_docs = tenant_fetch_df(f"SELECT doc_tipo, nombre_archivo, file_path, bucket, object_path, sha256 FROM empresa_documentos WHERE COALESCE(mandante_id,0)=0 OR mandante_id IN ({ph}) ORDER BY doc_tipo, id", tuple(allowed_mands))
                 else:
-                    emp_docs = tenant_fetch_df("SELECT doc_tipo, nombre_archivo, file_path, bucket, object_path FROM empresa_documentos WHERE 1=0")
+                    emp_docs = tenant_fetch_df("SELECT doc_tipo, nombre_archivo, file_path, bucket, object_path, sha256 FROM empresa_documentos WHERE 1=0")
             else:
-                emp_docs = tenant_fetch_df("SELECT doc_tipo, nombre_archivo, file_path, bucket, object_path FROM empresa_documentos ORDER BY doc_tipo, id")
+                emp_docs = tenant_fetch_df("SELECT doc_tipo, nombre_archivo, file_path, bucket, object_path, sha256 FROM empresa_documentos ORDER BY doc_tipo, id")
             if emp_docs is not None and not emp_docs.empty:
-                for _, r in emp_docs.iterrows():
+                for r in emp_docs.to_dict("records"):
                     try:
-                        fb = load_file_anywhere(r.get("file_path"), r.get("bucket"), r.get("object_path"))
                         fname = str(r.get("nombre_archivo") or r.get("file_path") or r.get("object_path") or "doc")
                         arc = f"{tenant_slug}/Empresa_Global/{os.path.basename(fname)}"
-                        zf.writestr(arc, fb)
+                        _write_doc(arc, r)
                     except Exception:
                         continue
 
     return mem.getvalue(), ym
 
 
-def persist_export_mes(ym: str, zip_bytes: bytes) -> str:
-    """Guarda un ZIP de export mensual en disco + Supabase Storage y registra en export_historial_mes."""
+def persist_export_mes(ym: str, zip_bytes) -> str:
+    """Guarda un ZIP de export mensual en disco + Supabase Storage y registra en export_historial_mes.
+
+    ``zip_bytes`` acepta los bytes del ZIP o la ruta de un ZIP ya generado en disco.
+    """
     tenant_key = str(current_tenant_key() or '').strip()
     tenant_slug = storage_safe_segment(tenant_key or 'tenant')
-    export_dir = os.path.join(UPLOAD_ROOT, "_exports_mes", tenant_slug)
-    os.makedirs(export_dir, exist_ok=True)
+    export_dir = ensure_dir(os.path.join(UPLOAD_ROOT, "_exports_mes", tenant_slug))
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     fname = f"export_mes_{ym}_{ts}.zip"
     fpath = os.path.join(export_dir, fname)
-    with open(fpath, "wb") as f:
-        f.write(zip_bytes)
-    sha = hashlib.sha256(zip_bytes).hexdigest()
+    sha, size = _store_export_zip(zip_bytes, fpath)
     now = datetime.now().isoformat(timespec="seconds")
 
     # Upload to Supabase Storage if available
@@ -3551,7 +4187,7 @@ def persist_export_mes(ym: str, zip_bytes: bytes) -> str:
     if storage_admin_enabled():
         try:
             obj_path = f"clientes/{tenant_slug}/_exports_mes/{fname}"
-            storage_upload(obj_path, zip_bytes, content_type="application/zip", upsert=True)
+            storage_upload(obj_path, _export_zip_payload(zip_bytes, fpath), content_type="application/zip", upsert=True)
             bucket = STORAGE_BUCKET
         except Exception as _exc:
             _record_soft_error("persist_export_mes.storage_upload", _exc)
@@ -3560,7 +4196,7 @@ def persist_export_mes(ym: str, zip_bytes: bytes) -> str:
 
     tenant_execute(
         "INSERT INTO export_historial_mes(year_month, file_path, sha256, size_bytes, created_at, bucket, object_path) VALUES(?,?,?,?,?,?,?)",
-        (ym, fpath, sha, len(zip_bytes), now, bucket, obj_path),
+        (ym, fpath, sha, size, now, bucket, obj_path),
     )
     return fpath
 
@@ -3732,33 +4368,35 @@ def ensure_segav_erp_seed_data():
         )
 
     if int(fetch_value("SELECT COUNT(*) FROM segav_erp_cargos", default=0) or 0) == 0:
-        for idx, cargo in enumerate(CARGO_DOCS_ORDER, start=1):
-            execute(
-                "INSERT INTO segav_erp_cargos(cargo_key, cargo_label, sort_order, activo, updated_at) VALUES(?,?,?,?,?)",
-                (cargo, cargo, idx, 1, now),
-            )
+        executemany(
+            "INSERT INTO segav_erp_cargos(cargo_key, cargo_label, sort_order, activo, updated_at) VALUES(?,?,?,?,?)",
+            [(cargo, cargo, idx, 1, now) for idx, cargo in enumerate(CARGO_DOCS_ORDER, start=1)],
+        )
 
     if int(fetch_value("SELECT COUNT(*) FROM segav_erp_docs_cargo", default=0) or 0) == 0:
-        for cargo, docs in CARGO_DOCS_RULES.items():
-            for idx, doc_tipo in enumerate(list(dict.fromkeys(docs)), start=1):
-                execute(
-                    "INSERT INTO segav_erp_docs_cargo(cargo_key, doc_tipo, sort_order, updated_at) VALUES(?,?,?,?)",
-                    (cargo, doc_tipo, idx, now),
-                )
+        executemany(
+            "INSERT INTO segav_erp_docs_cargo(cargo_key, doc_tipo, sort_order, updated_at) VALUES(?,?,?,?)",
+            [
+                (cargo, doc_tipo, idx, now)
+                for cargo, docs in CARGO_DOCS_RULES.items()
+                for idx, doc_tipo in enumerate(dict.fromkeys(docs), start=1)
+            ],
+        )
 
     if int(fetch_value("SELECT COUNT(*) FROM segav_erp_docs_empresa", default=0) or 0) == 0:
-        for idx, doc_tipo in enumerate(DOC_EMPRESA_MENSUALES, start=1):
-            execute(
-                "INSERT INTO segav_erp_docs_empresa(doc_tipo, obligatorio, mensual, por_mandante, por_faena, sort_order, updated_at) VALUES(?,?,?,?,?,?,?)",
-                (doc_tipo, 1, 1, 1, 1, idx, now),
-            )
+        executemany(
+            "INSERT INTO segav_erp_docs_empresa(doc_tipo, obligatorio, mensual, por_mandante, por_faena, sort_order, updated_at) VALUES(?,?,?,?,?,?,?)",
+            [(doc_tipo, 1, 1, 1, 1, idx, now) for idx, doc_tipo in enumerate(DOC_EMPRESA_MENSUALES, start=1)],
+        )
 
     if int(fetch_value("SELECT COUNT(*) FROM segav_erp_templates", default=0) or 0) == 0:
-        for idx, (template_key, payload) in enumerate(ERP_TEMPLATE_PRESETS.items(), start=1):
-            execute(
-                "INSERT INTO segav_erp_templates(template_key, template_label, vertical, description, payload_json, sort_order, activo, updated_at) VALUES(?,?,?,?,?,?,?,?)",
-                (template_key, payload.get('label') or template_key, payload.get('vertical') or '', payload.get('description') or '', json.dumps(payload, ensure_ascii=False), idx, 1, now),
-            )
+        executemany(
+            "INSERT INTO segav_erp_templates(template_key, template_label, vertical, description, payload_json, sort_order, activo, updated_at) VALUES(?,?,?,?,?,?,?,?)",
+            [
+                (template_key, payload.get('label') or template_key, payload.get('vertical') or '', payload.get('description') or '', json.dumps(payload, ensure_ascii=False), idx, 1, now)
+                for idx, (template_key, payload) in enumerate(ERP_TEMPLATE_PRESETS.items(), start=1)
+            ],
+        )
 
     if int(fetch_value("SELECT COUNT(*) FROM segav_erp_clientes", default=0) or 0) == 0:
         empresa = fetch_df("SELECT razon_social, rut FROM sgsst_empresa ORDER BY id LIMIT 1")
@@ -4430,7 +5068,7 @@ def tenant_execute_rowcount(q: str, params=()):
     return execute_rowcount(q2, p2)
 
 
-def tenant_executemany(q: str, seq_params):
+def tenant_executemany(q: str, seq_params, c=None):
     scoped = []
     q2 = None
     for params in (seq_params or []):
@@ -4438,7 +5076,19 @@ def tenant_executemany(q: str, seq_params):
         scoped.append(p2)
     if q2 is None:
         q2 = q
-    return executemany(q2, scoped)
+    return executemany(q2, scoped, c=c)
+
+
+def tenant_execute_batch(statements):
+    """Ejecuta varias sentencias (sql, params) acotadas al tenant en una sola transacción.
+
+    Un único commit para todo el lote (p.ej. borrados en cascada); si una
+    sentencia falla no queda nada a medias.
+    """
+    with db_transaction() as c:
+        for q, params in statements:
+            q2, p2 = _scope_sql_to_tenant(q, params)
+            executemany(q2, [p2], c=c)
 
 
 def tenant_fetch_file_refs(table_name: str, where_sql: str = "", params=()):
@@ -4475,17 +5125,22 @@ def apply_segav_template(template_key: str):
     cargo_rules = payload.get('cargo_rules', {}) or {}
     empresa_docs = [str(d).strip() for d in payload.get('empresa_docs', []) if str(d).strip()]
 
-    for idx, cargo in enumerate(cargos, start=1):
-        execute("DELETE FROM segav_erp_cargos WHERE cargo_key=?", (cargo,))
-        execute("INSERT INTO segav_erp_cargos(cargo_key, cargo_label, sort_order, activo, updated_at) VALUES(?,?,?,?,?)", (cargo, cargo, idx, 1, now))
+    # cargo -> sort_order; si un cargo viene repetido gana la última posición
+    cargo_order = {cargo: idx for idx, cargo in enumerate(cargos, start=1)}
+    cargo_keys = [(cargo,) for cargo in cargo_order]
+    doc_rows = []
+    for cargo in cargo_order:
         docs = [str(d).strip() for d in cargo_rules.get(cargo, DOC_OBLIGATORIOS) if str(d).strip()]
-        execute("DELETE FROM segav_erp_docs_cargo WHERE cargo_key=?", (cargo,))
-        for d_idx, doc_tipo in enumerate(list(dict.fromkeys(docs)), start=1):
-            execute("INSERT INTO segav_erp_docs_cargo(cargo_key, doc_tipo, sort_order, updated_at) VALUES(?,?,?,?)", (cargo, doc_tipo, d_idx, now))
+        doc_rows.extend((cargo, doc_tipo, d_idx, now) for d_idx, doc_tipo in enumerate(dict.fromkeys(docs), start=1))
+    empresa_rows = [(doc_tipo, 1, 1, 1, 1, idx, now) for idx, doc_tipo in enumerate(dict.fromkeys(empresa_docs), start=1)]
 
-    for idx, doc_tipo in enumerate(list(dict.fromkeys(empresa_docs)), start=1):
-        execute("DELETE FROM segav_erp_docs_empresa WHERE doc_tipo=?", (doc_tipo,))
-        execute("INSERT INTO segav_erp_docs_empresa(doc_tipo, obligatorio, mensual, por_mandante, por_faena, sort_order, updated_at) VALUES(?,?,?,?,?,?,?)", (doc_tipo, 1, 1, 1, 1, idx, now))
+    with db_transaction() as c:
+        executemany("DELETE FROM segav_erp_cargos WHERE cargo_key=?", cargo_keys, c=c)
+        executemany("INSERT INTO segav_erp_cargos(cargo_key, cargo_label, sort_order, activo, updated_at) VALUES(?,?,?,?,?)", [(cargo, cargo, idx, 1, now) for cargo, idx in cargo_order.items()], c=c)
+        executemany("DELETE FROM segav_erp_docs_cargo WHERE cargo_key=?", cargo_keys, c=c)
+        executemany("INSERT INTO segav_erp_docs_cargo(cargo_key, doc_tipo, sort_order, updated_at) VALUES(?,?,?,?)", doc_rows, c=c)
+        executemany("DELETE FROM segav_erp_docs_empresa WHERE doc_tipo=?", [(r[0],) for r in empresa_rows], c=c)
+        executemany("INSERT INTO segav_erp_docs_empresa(doc_tipo, obligatorio, mensual, por_mandante, por_faena, sort_order, updated_at) VALUES(?,?,?,?,?,?,?)", empresa_rows, c=c)
 
     set_segav_erp_config_value('template_actual', template_key)
     if payload.get('vertical'):
@@ -4892,6 +5547,96 @@ def _trabajador_insert_or_update(cur_or_conn, *, rut: str, nombres: str, apellid
     return 'inserted', int(new_id) if new_id is not None else None
 
 
+_TRABAJADOR_UPDATE_SQL = "UPDATE trabajadores SET nombres=?, apellidos=?, cargo=?, centro_costo=?, email=?, fecha_contrato=?, vigencia_examen=? WHERE id=? AND COALESCE(cliente_key,'')=?"
+
+
+_RUT_LOOKUP_CHUNK = 500
+
+
+def _trabajador_ids_by_rut(c, tenant_key: str, ruts) -> dict:
+    """``{rut: id}`` (el id más bajo por RUT) solo para ``ruts``, en bloques de IN.
+
+    El costo sigue al tamaño de la carga y no al de la tabla; los bloques
+    quedan bajo el límite de variables de SQLite.
+    """
+    ids: dict[str, int] = {}
+    ruts = list(ruts)
+    for start in range(0, len(ruts), _RUT_LOOKUP_CHUNK):
+        chunk = ruts[start:start + _RUT_LOOKUP_CHUNK]
+        ph = ",".join("?" * len(chunk))
+        for rut_db, tid in cursor_execute(
+            c,
+            f"SELECT rut, id FROM trabajadores WHERE COALESCE(cliente_key,'')=? AND rut IN ({ph}) ORDER BY id",
+            (tenant_key, *chunk),
+        ).fetchall():
+            ids.setdefault(str(rut_db), int(tid))
+    return ids
+
+
+def _trabajadores_bulk_upsert(rows, *, overwrite: bool = True, c=None) -> dict:
+    """Inserta/actualiza trabajadores en lote, en una sola transacción.
+
+    ``rows`` son tuplas ``(rut, nombres, apellidos, cargo, centro_costo, email,
+    fecha_contrato, vigencia_examen)``. Equivale a llamar
+    ``_trabajador_insert_or_update`` fila a fila (un RUT repetido en la carga
+    inserta la primera vez y luego actualiza u omite), pero con un
+    ``executemany`` para los UPDATE y otro para los INSERT.
+    Con ``c`` (conexión de ``db_transaction``) corre dentro de la transacción
+    del llamador. Devuelve ``{"inserted": n, "updated": n, "skipped": n,
+    "ids": {rut: id}}``, donde ``ids`` son los trabajadores insertados o
+    actualizados (no los omitidos).
+    """
+    if c is None:
+        with db_transaction() as c:
+            return _trabajadores_bulk_upsert(rows, overwrite=overwrite, c=c)
+    tenant_key = current_tenant_key()
+    latest: dict[str, tuple] = {}
+    seen: dict[str, int] = {}
+    for row in rows:
+        rut = clean_rut(row[0])
+        seen[rut] = seen.get(rut, 0) + 1
+        if overwrite or rut not in latest:
+            latest[rut] = row[1:]
+    counts = {"inserted": 0, "updated": 0, "skipped": 0, "ids": {}}
+    if not latest:
+        return counts
+    if DB_BACKEND == "postgres":
+        cursor_execute(c, "SELECT pg_advisory_xact_lock(hashtext('trabajadores_manual_id_insert'));")
+    existing = _trabajador_ids_by_rut(c, tenant_key, latest)
+    updates, inserts = [], []
+    for rut, payload in latest.items():
+        repeats = seen[rut] - 1
+        if rut in existing:
+            if overwrite:
+                updates.append((*payload, existing[rut], tenant_key))
+                counts["updated"] += seen[rut]
+                counts["ids"][rut] = existing[rut]
+            else:
+                counts["skipped"] += seen[rut]
+            continue
+        inserts.append((tenant_key, rut, *payload))
+        counts["inserted"] += 1
+        counts["updated" if overwrite else "skipped"] += repeats
+    executemany(_TRABAJADOR_UPDATE_SQL, updates, c=c)
+    if DB_BACKEND == "postgres" and inserts:
+        row = cursor_execute(c, "SELECT COALESCE(MAX(id), 0) + 1 FROM trabajadores").fetchone()
+        next_id = int(row[0]) if row and row[0] is not None else 1
+        executemany(
+            "INSERT INTO trabajadores(id, cliente_key, rut, nombres, apellidos, cargo, centro_costo, email, fecha_contrato, vigencia_examen) VALUES(?,?,?,?,?,?,?,?,?,?)",
+            [(next_id + i, *ins) for i, ins in enumerate(inserts)],
+            c=c,
+        )
+    else:
+        executemany_insert_multi(
+            "INSERT INTO trabajadores(cliente_key, rut, nombres, apellidos, cargo, centro_costo, email, fecha_contrato, vigencia_examen) VALUES(?,?,?,?,?,?,?,?,?)",
+            inserts,
+            c=c,
+        )
+    if inserts:
+        counts["ids"].update(_trabajador_ids_by_rut(c, tenant_key, [ins[1] for ins in inserts]))
+    return counts
+
+
 def ensure_storage_columns_sqlite(c):
     if DB_BACKEND == "postgres":
         return
@@ -4939,9 +5684,13 @@ def superadmins_count(active_only: bool = True) -> int:
         return 0
 
 def ensure_superadmin_exists():
+    _guard_key = "_ensure_superadmin_ok"
+    if st.session_state.get(_guard_key):
+        return
     try:
         ensure_users_table()
         if superadmins_count(active_only=False) > 0:
+            st.session_state[_guard_key] = True
             return
         src = fetch_df("SELECT id FROM users WHERE role='ADMIN' ORDER BY is_active DESC, id ASC LIMIT 1")
         if src.empty:
@@ -4951,6 +5700,7 @@ def ensure_superadmin_exists():
             "UPDATE users SET role=?, perms_json=?, updated_at=datetime('now') WHERE id=?",
             ("SUPERADMIN", json.dumps(SUPERADMIN_PERMS), uid),
         )
+        st.session_state[_guard_key] = True
     except Exception as _exc:
         _record_soft_error("execute.update", _exc)
 
@@ -5997,10 +6747,10 @@ def ensure_active_tenant_scaffold_once(_db_backend: str, _dsn_fingerprint: str,
 
 
 @st.cache_data(ttl=120, show_spinner=False)
-def get_sidebar_kpis(_db_backend: str, _dsn_fingerprint: str, tenant_key: str):
+def get_sidebar_kpis(_db_backend: str, _dsn_fingerprint: str, tenant_key: str, epoch: int = 0, db_sig=None):
     tkey = str(tenant_key or '').strip()
     try:
-        faenas_df = get_sidebar_faena_context_df(_db_backend, _dsn_fingerprint, tkey)
+        faenas_df = get_sidebar_faena_context_df(_db_backend, _dsn_fingerprint, tkey, epoch, db_sig)
         faenas_total = int(len(faenas_df.index)) if faenas_df is not None else 0
         faenas_activas = 0
         if faenas_df is not None and not faenas_df.empty and 'estado' in faenas_df.columns:
@@ -6020,30 +6770,32 @@ def get_sidebar_kpis(_db_backend: str, _dsn_fingerprint: str, tenant_key: str):
     except Exception:
         return {'faenas_total': 0, 'faenas_activas': 0, 'trabajadores_total': 0, 'docs_vencidos': 0}
 
+
+# SQL del sidebar como constantes de módulo: el mismo texto en cada rerun
+# reutiliza la sentencia preparada de la conexión compartida.
+_SIDEBAR_FAENAS_SQL = """
+SELECT f.id, m.nombre AS mandante, f.nombre, f.estado
+FROM faenas f JOIN mandantes m ON m.id=f.mandante_id
+ORDER BY f.id DESC
+LIMIT 6
+"""
+_SIDEBAR_FAENAS_TENANT_SQL = """
+SELECT f.id, m.nombre AS mandante, f.nombre, f.estado
+FROM faenas f
+JOIN mandantes m ON m.id=f.mandante_id
+WHERE COALESCE(f.cliente_key,'')=?
+ORDER BY f.id DESC
+LIMIT 6
+"""
+
+
 @st.cache_data(ttl=180, show_spinner=False)
-def get_sidebar_faena_context_df(_db_backend: str, _dsn_fingerprint: str, tenant_key: str):
+def get_sidebar_faena_context_df(_db_backend: str, _dsn_fingerprint: str, tenant_key: str, epoch: int = 0, db_sig=None):
     tkey = str(tenant_key or '').strip()
     try:
         if tkey:
-            return fetch_df(
-                """
-                SELECT f.id, m.nombre AS mandante, f.nombre, f.estado
-                FROM faenas f
-                JOIN mandantes m ON m.id=f.mandante_id
-                WHERE COALESCE(f.cliente_key,'')=?
-                ORDER BY f.id DESC
-                LIMIT 6
-                """,
-                (tkey,),
-            )
-        return fetch_df(
-            """
-            SELECT f.id, m.nombre AS mandante, f.nombre, f.estado
-            FROM faenas f JOIN mandantes m ON m.id=f.mandante_id
-            ORDER BY f.id DESC
-            LIMIT 6
-            """
-        )
+            return fetch_df(_SIDEBAR_FAENAS_TENANT_SQL, (tkey,))
+        return fetch_df(_SIDEBAR_FAENAS_SQL)
     except Exception:
         return pd.DataFrame()
 
@@ -6641,9 +7393,11 @@ with st.sidebar:
                 _vertical = str(_current_row.get("vertical") or segav_erp_value("erp_vertical", "General"))
                 st.markdown(f'<div class="segav-sidecard segav-sidebar-center"><div style="font-weight:700;">🏢 {_current_row["cliente_nombre"]}</div><div class="segav-muted">{_vertical}</div></div>', unsafe_allow_html=True)
                 try:
-                    _side_kpis = get_sidebar_kpis(DB_BACKEND, PG_DSN_FINGERPRINT, str(_cli_selected))
+                    # Llave de versión: cambia con cada escritura (epoch) o con cambios en disco (db_sig).
+                    _side_ver = (db_write_epoch(), _sqlite_db_signature() if DB_BACKEND == "sqlite" else None)
+                    _side_kpis = get_sidebar_kpis(DB_BACKEND, PG_DSN_FINGERPRINT, str(_cli_selected), *_side_ver)
                     st.markdown(f"""<div class="segav-sidecard segav-sidebar-center"><div style="font-weight:700; margin-bottom:0.15rem;">Resumen rápido</div><div class="segav-sidegrid"><div class="segav-sidepill"><strong>{int(_side_kpis.get('faenas_total', 0))}</strong><span>Faenas</span></div><div class="segav-sidepill"><strong>{int(_side_kpis.get('faenas_activas', 0))}</strong><span>Activas</span></div><div class="segav-sidepill"><strong>{int(_side_kpis.get('trabajadores_total', 0))}</strong><span>Trabajadores</span></div><div class="segav-sidepill"><strong>{int(_side_kpis.get('docs_vencidos', 0))}</strong><span>Docs vencidos</span></div></div></div>""", unsafe_allow_html=True)
-                    _faenas_recent = get_sidebar_faena_context_df(DB_BACKEND, PG_DSN_FINGERPRINT, str(_cli_selected))
+                    _faenas_recent = get_sidebar_faena_context_df(DB_BACKEND, PG_DSN_FINGERPRINT, str(_cli_selected), *_side_ver)
                     if _faenas_recent is not None and not _faenas_recent.empty:
                         _faenas_recent = _faenas_recent.head(5).copy()
                         _faenas_recent['Etiqueta'] = _faenas_recent['nombre'].astype(str) + ' · ' + _faenas_recent['estado'].astype(str)
@@ -6784,7 +7538,7 @@ def _page_trabajadores_impl():
                 raw = pd.read_excel(xls, sheet_name=sheet)
 
                 colmap = {c: norm_col(str(c)) for c in raw.columns}
-                df = raw.rename(columns=colmap).copy()
+                df = raw.rename(columns=colmap)
 
                 st.caption("Vista previa (primeras 10 filas)")
                 st.dataframe(df.head(10), use_container_width=True)
@@ -6795,7 +7549,7 @@ def _page_trabajadores_impl():
                     overwrite = st.checkbox("Sobrescribir si el RUT ya existe", value=True, key="ow_excel_trab")
 
                     if st.button("Importar Excel ahora", type="primary", key="btn_import_excel_trab"):
-                        existing_set = set(fetch_df("SELECT rut FROM trabajadores")["rut"].astype(str).tolist())
+                        existing_set = {str(v) for v in fetch_col("SELECT rut FROM trabajadores")}
 
                         rows = inserted = updated = skipped = 0
                         has_cargo = "cargo" in df.columns
@@ -6804,15 +7558,6 @@ def _page_trabajadores_impl():
                         fc_col = "fecha_de_contrato" if "fecha_de_contrato" in df.columns else ("fecha_contrato" if "fecha_contrato" in df.columns else None)
                         has_ve = "vigencia_examen" in df.columns
 
-                        def _to_text_date_import_excel(v):
-                            if v is None or pd.isna(v):
-                                return None
-                            if isinstance(v, datetime):
-                                return str(v.date())
-                            if isinstance(v, date):
-                                return str(v)
-                            return str(v)
-
                         with conn() as c:
                             for _, r in df.iterrows():
                                 rows += 1
@@ -6830,8 +7575,8 @@ def _page_trabajadores_impl():
                                 cargo = str(r.get("cargo", "") or "").strip() if has_cargo else ""
                                 centro_costo = str(r.get("centro_costo", "") or "").strip() if has_cc else ""
                                 email = str(r.get("email", "") or "").strip() if has_email else ""
-                                fecha_contrato = _to_text_date_import_excel(r.get(fc_col)) if fc_col else None
-                                vigencia_examen = _to_text_date_import_excel(r.get("vigencia_examen")) if has_ve else None
+                                fecha_contrato = to_text_date(r.get(fc_col)) if fc_col else None
+                                vigencia_examen = to_text_date(r.get("vigencia_examen")) if has_ve else None
 
                                 action, _tid = _trabajador_insert_or_update(
                                     c,
@@ -7235,7 +7980,7 @@ def _page_asignar_trabajadores_impl():
                 raw = pd.read_excel(xls, sheet_name=sheet)
 
                 colmap = {c: norm_col(str(c)) for c in raw.columns}
-                df = raw.rename(columns=colmap).copy()
+                df = raw.rename(columns=colmap)
 
                 st.caption("Vista previa (primeras 10 filas)")
                 st.dataframe(df.head(10), use_container_width=True)
@@ -7259,15 +8004,6 @@ def _page_asignar_trabajadores_impl():
                         fc_col = "fecha_de_contrato" if "fecha_de_contrato" in df.columns else ("fecha_contrato" if "fecha_contrato" in df.columns else None)
                         has_ve = "vigencia_examen" in df.columns
 
-                        def _to_text_date_import_faena(v):
-                            if v is None or pd.isna(v):
-                                return None
-                            if isinstance(v, datetime):
-                                return str(v.date())
-                            if isinstance(v, date):
-                                return str(v)
-                            return str(v)
-
                         with conn() as c:
                             for _, r in df.iterrows():
                                 rows += 1
@@ -7285,8 +8021,8 @@ def _page_asignar_trabajadores_impl():
                                 cargo = str(r.get("cargo", "") or "").strip() if has_cargo else ""
                                 centro_costo = str(r.get("centro_costo", "") or "").strip() if has_cc else ""
                                 email = str(r.get("email", "") or "").strip() if has_email else ""
-                                fecha_contrato = _to_text_date_import_faena(r.get(fc_col)) if fc_col else None
-                                vigencia_examen = _to_text_date_import_faena(r.get("vigencia_examen")) if has_ve else None
+                                fecha_contrato = to_text_date(r.get(fc_col)) if fc_col else None
+                                vigencia_examen = to_text_date(r.get("vigencia_examen")) if has_ve else None
 
                                 action, tid_saved = _trabajador_insert_or_update(
                                     c,
@@ -7450,8 +8186,7 @@ def _page_documentos_empresa_impl():
             doc_tipo = tipo if tipo != "OTRO" else (tipo_otro.strip() or "OTRO")
             payload = prepare_upload_payload(up.name, up.getvalue(), getattr(up, 'type', None) or 'application/octet-stream')
             folder = ["empresa", safe_name(doc_tipo)]
-            file_path, bucket, object_path = save_file_online(folder, payload["file_name"], payload["file_bytes"], content_type=payload["content_type"])
-            sha = sha256_bytes(payload["file_bytes"])
+            file_path, bucket, object_path, sha = save_file_online(folder, payload["file_name"], payload["file_bytes"], content_type=payload["content_type"])
             execute(
                 "INSERT INTO empresa_documentos(doc_tipo, nombre_archivo, file_path, bucket, object_path, sha256, created_at) VALUES(?,?,?,?,?,?,?)",
                 (doc_tipo, payload["file_name"], file_path, bucket, object_path, sha, datetime.utcnow().isoformat(timespec="seconds")),
@@ -7634,8 +8369,7 @@ def _page_documentos_empresa_faena_impl():
                 "empresa_mensual",
                 safe_name(doc_tipo),
             ]
-            file_path, bucket, object_path = save_file_online(folder, payload["file_name"], payload["file_bytes"], content_type=payload["content_type"])
-            sha = sha256_bytes(payload["file_bytes"])
+            file_path, bucket, object_path, sha = save_file_online(folder, payload["file_name"], payload["file_bytes"], content_type=payload["content_type"])
 
             execute(
                 "INSERT INTO faena_empresa_documentos(faena_id, mandante_id, periodo_anio, periodo_mes, doc_tipo, nombre_archivo, file_path, bucket, object_path, sha256, created_at) VALUES(?,?,?,?,?,?,?,?,?,?,?)",
@@ -7851,8 +8585,7 @@ def _page_documentos_trabajador_impl():
             doc_tipo = tipo if tipo != "OTRO" else (tipo_otro.strip() or "OTRO")
             payload = prepare_upload_payload(up.name, up.getvalue(), getattr(up, 'type', None) or 'application/octet-stream')
             folder = ["trabajadores", tid, safe_name(doc_tipo)]
-            file_path, bucket, object_path = save_file_online(folder, payload["file_name"], payload["file_bytes"], content_type=payload["content_type"])
-            sha = sha256_bytes(payload["file_bytes"])
+            file_path, bucket, object_path, sha = save_file_online(folder, payload["file_name"], payload["file_bytes"], content_type=payload["content_type"])
             if payload["compressed"] and payload.get("compression_note"):
                 st.info(payload["compression_note"])
 
@@ -8499,6 +9232,8 @@ def page_backup_restore():
         )
 
     tab1, tab2, tab3 = st.tabs(["🧪 Diagnóstico backend", "🗄️ Base local heredada (app.db)", "📦 Backup completo (ZIP)"])
+    # Sello UTC para nombres de descarga/diagnóstico, una vez por render.
+    ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
 
     with tab1:
         cdiag1, cdiag2, cdiag3 = st.columns(3)
@@ -8512,27 +9247,28 @@ def page_backup_restore():
         if storage_enabled() and not storage_admin_enabled():
             st.warning("Storage está solo en modo lectura o con key débil. Para subir/eliminar archivos usa una secret/service key real en SUPABASE_SERVICE_ROLE_KEY.")
         st.caption("Auto-backups generados al guardar (solo app.db). Se guardan localmente y conviene descargarlos si sigues usando SQLite local.")
-        hist = fetch_df("SELECT id, tag, file_path, size_bytes, created_at FROM auto_backup_historial ORDER BY id DESC")
+        hist = fetch_df("SELECT id, tag, file_path, size_bytes, ROUND(size_bytes / 1024.0, 1) AS size_kb, created_at FROM auto_backup_historial ORDER BY id DESC")
         if hist.empty:
             st.info("(aún no hay auto-backups)")
         else:
             view = hist.copy()
-            view["archivo"] = view["file_path"].apply(lambda p: os.path.basename(p))
-            view["size_kb"] = (view["size_bytes"] / 1024).round(1)
+            # Nombre de archivo con un reemplazo vectorizado (sin apply por fila);
+            # size_kb ya viene calculado desde la consulta.
+            view["archivo"] = view["file_path"].fillna("").astype(str).str.replace(r"^.*[\\/]", "", regex=True)
             st.dataframe(view[["id", "tag", "archivo", "size_kb", "created_at"]], use_container_width=True, hide_index=True)
 
+            bk_ids = view["id"].tolist()
+            bk_labels = {i: f"{int(i)} - {a} ({t})" for i, a, t in zip(bk_ids, view["archivo"].tolist(), view["tag"].tolist())}
             sel = st.selectbox(
                 "Elegir auto-backup para descargar",
-                view["id"].tolist(),
+                bk_ids,
                 key="backup_restore_autobackup_select",
-                format_func=lambda x: f"{int(x)} - {view[view['id']==x].iloc[0]['archivo']} ({view[view['id']==x].iloc[0]['tag']})",
+                format_func=lambda x: bk_labels.get(x, str(x)),
             )
-            row = view[view["id"] == sel].iloc[0]
+            row = view.iloc[bk_ids.index(sel)]
             p = row["file_path"]
-            if os.path.exists(p):
-                with open(p, "rb") as f:
-                    b = f.read()
-                st.download_button("Descargar auto-backup (app.db)", data=b, file_name=os.path.basename(p), mime="application/octet-stream", use_container_width=True)
+            if os.path.isfile(p):
+                st.download_button("Descargar auto-backup (app.db)", data=deferred_download_data(lambda: read_file_bytes(p)), file_name=os.path.basename(p), mime="application/octet-stream", use_container_width=True)
             else:
                 st.warning("El archivo no está en disco (posible reboot/redeploy).")
 
@@ -8543,11 +9279,8 @@ def page_backup_restore():
 
         with coldb1:
             st.markdown("### Descargar app.db")
-            if os.path.exists(DB_PATH):
-                with open(DB_PATH, "rb") as f:
-                    db_bytes = f.read()
-                ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-                st.download_button("Descargar app.db", data=db_bytes, file_name=f"app_{ts}.db", mime="application/octet-stream", use_container_width=True)
+            if os.path.isfile(DB_PATH):
+                st.download_button("Descargar app.db", data=deferred_download_data(lambda: read_file_bytes(DB_PATH)), file_name=f"app_{ts}.db", mime="application/octet-stream", use_container_width=True)
             else:
                 st.info("Aún no existe app.db (no hay datos o no se ha inicializado).")
 
@@ -8561,9 +9294,7 @@ def page_backup_restore():
 
                     st.stop()
                 try:
-                    with open(DB_PATH, "wb") as f:
-                        f.write(up_db.getvalue())
-                    init_db()
+                    restore_from_db_file(up_db)
                     st.success("Base restaurada. La app se reiniciará.")
                     st.rerun()
                 except Exception as e:
@@ -8584,7 +9315,7 @@ def page_backup_restore():
                     st.write(last)
             if st.button("Probar subida Storage (archivo de prueba)", use_container_width=True):
                 try:
-                    test_path = f"clientes/{storage_safe_segment(current_tenant_key() or 'diagnostico')}/_diagnostico/test_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.txt"
+                    test_path = f"clientes/{storage_safe_segment(current_tenant_key() or 'diagnostico')}/_diagnostico/test_{ts}.txt"
                     storage_upload(test_path, b"ok", content_type="text/plain", upsert=True)
                     st.success(f"Subida OK: {test_path}")
                 except Exception as e:
@@ -8598,7 +9329,7 @@ def page_backup_restore():
 
                 st.stop()
             try:
-                restore_from_backup_zip(up.getvalue())
+                restore_from_backup_zip(up)
                 st.success("Backup restaurado. La app se reiniciará.")
                 st.rerun()
             except Exception as e:
@@ -9284,31 +10015,31 @@ def page_contratos_faena():
 
 
 def page_faenas():
-    return _ops_faenas.page_faenas(fetch_df=tenant_fetch_df, execute=tenant_execute, auto_backup_db=auto_backup_db, render_upload_help=render_upload_help, prepare_upload_payload=prepare_upload_payload, save_file_online=save_file_online, sha256_bytes=sha256_bytes, parse_date_maybe=parse_date_maybe, validate_faena_dates=validate_faena_dates, fetch_file_refs=tenant_fetch_file_refs, cleanup_deleted_file_refs=cleanup_deleted_file_refs, faena_progress_table=faena_progress_table, ESTADOS_FAENA=ESTADOS_FAENA, pendientes_obligatorios=pendientes_obligatorios)
+    return _ops_faenas.page_faenas(fetch_df=tenant_fetch_df, execute=tenant_execute, execute_batch=tenant_execute_batch, auto_backup_db=auto_backup_db, render_upload_help=render_upload_help, prepare_upload_payload=prepare_upload_payload, save_file_online=save_file_online, sha256_bytes=sha256_bytes, parse_date_maybe=parse_date_maybe, validate_faena_dates=validate_faena_dates, fetch_file_refs=tenant_fetch_file_refs, cleanup_deleted_file_refs=cleanup_deleted_file_refs, faena_progress_table=faena_progress_table, ESTADOS_FAENA=ESTADOS_FAENA, pendientes_obligatorios=pendientes_obligatorios)
 
 
 def page_trabajadores():
-    return _ops_personal.page_trabajadores(fetch_df=tenant_fetch_df, conn=conn, execute=tenant_execute, auto_backup_db=auto_backup_db, build_trabajadores_template_xlsx=build_trabajadores_template_xlsx, clean_rut=clean_rut, split_nombre_completo=split_nombre_completo, norm_col=norm_col, rut_input=rut_input, segav_cargo_labels=segav_cargo_labels, parse_date_maybe=parse_date_maybe, fetch_file_refs=tenant_fetch_file_refs, cleanup_deleted_file_refs=cleanup_deleted_file_refs, trabajador_insert_or_update=_trabajador_insert_or_update, apply_pending_trabajador_create_reset=_apply_pending_trabajador_create_reset, show_pending_trabajador_create_flash=_show_pending_trabajador_create_flash)
+    return _ops_personal.page_trabajadores(fetch_df=tenant_fetch_df, conn=conn, execute=tenant_execute, execute_batch=tenant_execute_batch, auto_backup_db=auto_backup_db, trabajadores_bulk_upsert=_trabajadores_bulk_upsert, trabajadores_listing=trabajadores_listing, build_trabajadores_template_xlsx=build_trabajadores_template_xlsx, clean_rut=clean_rut, split_nombre_completo=split_nombre_completo, norm_col=norm_col, rut_input=rut_input, segav_cargo_labels=segav_cargo_labels, parse_date_maybe=parse_date_maybe, fetch_file_refs=tenant_fetch_file_refs, cleanup_deleted_file_refs=cleanup_deleted_file_refs, trabajador_insert_or_update=_trabajador_insert_or_update, apply_pending_trabajador_create_reset=_apply_pending_trabajador_create_reset, show_pending_trabajador_create_flash=_show_pending_trabajador_create_flash)
 
 
 def page_asignar_trabajadores():
-    return _ops_personal.page_asignar_trabajadores(fetch_df=tenant_fetch_df, conn=conn, cursor_execute=cursor_execute, ASSIGNACION_INSERT_SQL=ASSIGNACION_INSERT_SQL, clear_app_caches=clear_app_caches, auto_backup_db=auto_backup_db, build_trabajadores_template_xlsx=build_trabajadores_template_xlsx, clean_rut=clean_rut, split_nombre_completo=split_nombre_completo, norm_col=norm_col, executemany=tenant_executemany, go=go, trabajador_insert_or_update=_trabajador_insert_or_update, current_tenant_key=current_tenant_key)
+    return _ops_personal.page_asignar_trabajadores(fetch_df=tenant_fetch_df, conn=conn, cursor_execute=cursor_execute, ASSIGNACION_INSERT_SQL=ASSIGNACION_INSERT_SQL, db_transaction=db_transaction, trabajadores_bulk_upsert=_trabajadores_bulk_upsert, clear_app_caches=clear_app_caches, auto_backup_db=auto_backup_db, build_trabajadores_template_xlsx=build_trabajadores_template_xlsx, clean_rut=clean_rut, split_nombre_completo=split_nombre_completo, norm_col=norm_col, executemany=tenant_executemany, go=go, trabajador_insert_or_update=_trabajador_insert_or_update, current_tenant_key=current_tenant_key)
 
 
 def page_documentos_empresa():
-    return _ops_docs.page_documentos_empresa(fetch_df=tenant_fetch_df, allowed_mandante_ids=current_user_mandante_scope_ids(), get_empresa_required_doc_types=get_empresa_required_doc_types, doc_tipo_join=doc_tipo_join, doc_tipo_label=doc_tipo_label, render_upload_help=render_upload_help, prepare_upload_payload=prepare_upload_payload, safe_name=safe_name, save_file_online=save_file_online, sha256_bytes=sha256_bytes, execute=tenant_execute, datetime=datetime, auto_backup_db=auto_backup_db, load_file_anywhere=load_file_anywhere, delete_uploaded_document_record=delete_uploaded_document_record, render_legal_doc_inline=render_legal_doc_inline)
+    return _ops_docs.page_documentos_empresa(fetch_df=tenant_fetch_df, allowed_mandante_ids=current_user_mandante_scope_ids(), get_empresa_required_doc_types=get_empresa_required_doc_types, doc_tipo_join=doc_tipo_join, doc_tipo_label=doc_tipo_label, render_upload_help=render_upload_help, prepare_upload_payload=prepare_upload_payload, safe_name=safe_name, save_file_online=save_file_online, sha256_bytes=sha256_bytes, execute=tenant_execute, datetime=datetime, auto_backup_db=auto_backup_db, load_file_anywhere=load_file_cached, delete_uploaded_document_record=delete_uploaded_document_record, render_legal_doc_inline=render_legal_doc_inline)
 
 
 def page_documentos_empresa_faena():
-    return _ops_docs.page_documentos_empresa_faena(fetch_df=tenant_fetch_df, allowed_mandante_ids=current_user_mandante_scope_ids(), ui_tip=ui_tip, periodo_label=periodo_label, periodo_ym=periodo_ym, get_empresa_monthly_doc_types=get_empresa_monthly_doc_types, doc_tipo_join=doc_tipo_join, doc_tipo_label=doc_tipo_label, render_upload_help=render_upload_help, prepare_upload_payload=prepare_upload_payload, safe_name=safe_name, save_file_online=save_file_online, sha256_bytes=sha256_bytes, execute=tenant_execute, datetime=datetime, auto_backup_db=auto_backup_db, load_file_anywhere=load_file_anywhere, delete_uploaded_document_record=delete_uploaded_document_record, MESES_ES=MESES_ES, render_legal_doc_inline=render_legal_doc_inline)
+    return _ops_docs.page_documentos_empresa_faena(fetch_df=tenant_fetch_df, allowed_mandante_ids=current_user_mandante_scope_ids(), ui_tip=ui_tip, periodo_label=periodo_label, periodo_ym=periodo_ym, get_empresa_monthly_doc_types=get_empresa_monthly_doc_types, doc_tipo_join=doc_tipo_join, doc_tipo_label=doc_tipo_label, render_upload_help=render_upload_help, prepare_upload_payload=prepare_upload_payload, safe_name=safe_name, save_file_online=save_file_online, sha256_bytes=sha256_bytes, execute=tenant_execute, datetime=datetime, auto_backup_db=auto_backup_db, load_file_anywhere=load_file_cached, delete_uploaded_document_record=delete_uploaded_document_record, MESES_ES=MESES_ES, render_legal_doc_inline=render_legal_doc_inline)
 
 
 def page_documentos_trabajador():
-    return _ops_personal.page_documentos_trabajador(DB_BACKEND=DB_BACKEND, allowed_mandante_ids=current_user_mandante_scope_ids(), fetch_df=tenant_fetch_df, fetch_df_uncached=tenant_fetch_df_uncached, execute=tenant_execute, execute_rowcount=tenant_execute_rowcount, auto_backup_db=auto_backup_db, fetch_assigned_workers=fetch_assigned_workers, prepare_upload_payload=prepare_upload_payload, render_upload_help=render_upload_help, save_file_online=save_file_online, sha256_bytes=sha256_bytes, load_file_anywhere=load_file_anywhere, worker_required_docs_for_record=worker_required_docs_for_record, doc_tipo_label=doc_tipo_label, doc_tipo_join=doc_tipo_join, safe_name=safe_name, canonical_cargo_label=canonical_cargo_label, cargo_docs_catalog_rows=cargo_docs_catalog_rows, pendientes_obligatorios=pendientes_obligatorios, delete_uploaded_document_record=delete_uploaded_document_record, render_legal_doc_inline=render_legal_doc_inline)
+    return _ops_personal.page_documentos_trabajador(DB_BACKEND=DB_BACKEND, allowed_mandante_ids=current_user_mandante_scope_ids(), fetch_df=tenant_fetch_df, fetch_df_uncached=tenant_fetch_df_uncached, execute=tenant_execute, execute_rowcount=tenant_execute_rowcount, auto_backup_db=auto_backup_db, fetch_assigned_workers=fetch_assigned_workers, prepare_upload_payload=prepare_upload_payload, render_upload_help=render_upload_help, save_file_online=save_file_online, sha256_bytes=sha256_bytes, load_file_anywhere=load_file_cached, worker_required_docs_for_record=worker_required_docs_for_record, doc_tipo_label=doc_tipo_label, doc_tipo_join=doc_tipo_join, safe_name=safe_name, canonical_cargo_label=canonical_cargo_label, cargo_docs_catalog_rows=cargo_docs_catalog_rows, pendientes_obligatorios=pendientes_obligatorios, delete_uploaded_document_record=delete_uploaded_document_record, render_legal_doc_inline=render_legal_doc_inline)
 
 
 def page_export_zip():
-    return _ops_exports.page_export_zip(st=st, allowed_mandante_ids=current_user_mandante_scope_ids(), ui_header=ui_header, ui_tip=ui_tip, fetch_df=tenant_fetch_df, pendientes_obligatorios=pendientes_obligatorios, pendientes_empresa_faena=pendientes_empresa_faena, doc_tipo_join=doc_tipo_join, export_zip_for_faena=export_zip_for_faena, persist_export=persist_export, auto_backup_db=auto_backup_db, load_file_anywhere=load_file_anywhere, human_file_size=human_file_size, export_zip_for_mes=export_zip_for_mes, persist_export_mes=persist_export_mes, os=os, date=date, current_tenant_key=current_tenant_key, current_segav_client_key=current_segav_client_key, visible_clientes_df=visible_clientes_df, execute=tenant_execute, is_superadmin=is_superadmin, audit_log=audit_log)
+    return _ops_exports.page_export_zip(st=st, allowed_mandante_ids=current_user_mandante_scope_ids(), ui_header=ui_header, ui_tip=ui_tip, fetch_df=tenant_fetch_df, pendientes_obligatorios=pendientes_obligatorios, pendientes_obligatorios_detalle=pendientes_obligatorios_detalle, pendientes_empresa_faena=pendientes_empresa_faena, doc_tipo_join=doc_tipo_join, export_zip_for_faena=export_zip_for_faena, persist_export=persist_export, auto_backup_db=auto_backup_db, load_file_anywhere=load_file_anywhere, human_file_size=human_file_size, export_zip_for_mes=export_zip_for_mes, persist_export_mes=persist_export_mes, os=os, date=date, current_tenant_key=current_tenant_key, current_segav_client_key=current_segav_client_key, visible_clientes_df=visible_clientes_df, execute=tenant_execute, is_superadmin=is_superadmin, audit_log=audit_log, submit_export_job=submit_export_job)
 
 
 def page_sgsst():
@@ -21,7 +21,7 @@ def test_pendientes_obligatorios_logic():
                 {"id": 1, "rut": "12.345.678-5", "nombre": "Perez Juan", "cargo": "Chofer"}
             ]),
             "FROM trabajador_documentos": pd.DataFrame([
-                {"doc_tipo": "Contrato"}
+                {"trabajador_id": 1, "doc_tipo": "Contrato"}
             ]),
         }
     )
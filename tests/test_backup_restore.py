@@ -1,6 +1,10 @@
+import io
 import json
+import sqlite3
+import zipfile
 
 import pandas as pd
+import pytest
 
 from segav_core import backup_restore as br
 
@@ -55,3 +59,104 @@ def test_restore_json_backup_runs_inserts(tmp_path, monkeypatch):
     result = br.restore_json_backup(backup)
     assert result["status"] == "restore_completed"
     assert executed and "INSERT INTO segav_erp_clientes" in executed[0][0]
+
+
+def _sqlite_file(path, value):
+    with sqlite3.connect(path) as c:
+        c.execute("CREATE TABLE t (v TEXT)")
+        c.execute("INSERT INTO t VALUES (?)", (value,))
+    c.close()
+    return path
+
+
+def _read_value(path):
+    c = sqlite3.connect(path)
+    try:
+        return c.execute("SELECT v FROM t").fetchone()[0]
+    finally:
+        c.close()
+
+
+def _zip_with(tmp_path, members):
+    out = tmp_path / "backup.zip"
+    with zipfile.ZipFile(out, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return zipfile.ZipFile(out)
+
+
+def test_restore_sqlite_from_zip_swaps_db_and_keeps_previous(tmp_path):
+    db_path = str(_sqlite_file(tmp_path / "app.db", "actual"))
+    nueva = _sqlite_file(tmp_path / "nueva.db", "restaurada").read_bytes()
+    calls = []
+    with _zip_with(tmp_path, {"otro.sqlite": b"x", "backup/app.db": nueva}) as zf:
+        member = br.restore_sqlite_from_zip(zf, db_path, before_swap=lambda: calls.append("swap"))
+
+    assert member == "backup/app.db"
+    assert calls == ["swap"]
+    assert _read_value(db_path) == "restaurada"
+    assert _read_value(db_path + ".pre_restore_backup") == "actual"
+    assert not (tmp_path / "app.db.restore_tmp").exists()
+
+
+def test_restore_sqlite_from_zip_rejects_bad_header(tmp_path):
+    db_path = str(_sqlite_file(tmp_path / "app.db", "actual"))
+    with _zip_with(tmp_path, {"app.db": b"no es sqlite"}) as zf, pytest.raises(ValueError):
+        br.restore_sqlite_from_zip(zf, db_path)
+
+    assert _read_value(db_path) == "actual"
+    assert not (tmp_path / "app.db.pre_restore_backup").exists()
+    assert not (tmp_path / "app.db.restore_tmp").exists()
+
+
+def test_restore_sqlite_from_zip_requires_db_member(tmp_path):
+    db_path = str(_sqlite_file(tmp_path / "app.db", "actual"))
+    with _zip_with(tmp_path, {"backup/uploads/a.pdf": b"%PDF"}) as zf:
+        assert br.pick_sqlite_backup_member(zf) is None
+        with pytest.raises(ValueError):
+            br.restore_sqlite_from_zip(zf, db_path)
+
+    assert _read_value(db_path) == "actual"
+
+
+def test_restore_sqlite_from_zip_rolls_back_when_swap_fails(tmp_path, monkeypatch):
+    db_path = str(_sqlite_file(tmp_path / "app.db", "actual"))
+    nueva = _sqlite_file(tmp_path / "nueva.db", "restaurada").read_bytes()
+    real_replace = br.os.replace
+
+    def failing_replace(src, dst):
+        if str(src).endswith(".restore_tmp"):
+            raise OSError("disco lleno")
+        return real_replace(src, dst)
+
+    monkeypatch.setattr(br.os, "replace", failing_replace)
+    with _zip_with(tmp_path, {"app.db": nueva}) as zf, pytest.raises(OSError):
+        br.restore_sqlite_from_zip(zf, db_path)
+
+    assert _read_value(db_path) == "actual"
+    assert not (tmp_path / "app.db.pre_restore_backup").exists()
+
+
+def test_restore_sqlite_from_file_swaps_db_and_drops_old_wal(tmp_path):
+    db_path = str(_sqlite_file(tmp_path / "app.db", "actual"))
+    (tmp_path / "app.db-wal").write_bytes(b"wal viejo")
+    nueva = _sqlite_file(tmp_path / "nueva.db", "restaurada").read_bytes()
+    calls = []
+    br.restore_sqlite_from_file(io.BytesIO(nueva), db_path, before_swap=lambda: calls.append("swap"))
+
+    assert calls == ["swap"]
+    assert _read_value(db_path) == "restaurada"
+    assert _read_value(db_path + ".pre_restore_backup") == "actual"
+    assert not (tmp_path / "app.db-wal").exists()
+    assert not (tmp_path / "app.db.restore_tmp").exists()
+
+
+def test_restore_sqlite_from_file_rejects_bad_header(tmp_path):
+    db_path = str(_sqlite_file(tmp_path / "app.db", "actual"))
+    calls = []
+    with pytest.raises(ValueError):
+        br.restore_sqlite_from_file(io.BytesIO(b"no es sqlite"), db_path, before_swap=lambda: calls.append("swap"))
+
+    assert calls == []
+    assert _read_value(db_path) == "actual"
+    assert not (tmp_path / "app.db.restore_tmp").exists()
@@ -1,6 +1,6 @@
 import pandas as pd
 
-from segav_core.compliance_logic import pendientes_empresa_faena_logic, pendientes_obligatorios_logic
+from segav_core.compliance_logic import faltantes_por_faena_logic, pendientes_empresa_faena_logic, pendientes_obligatorios_detalle_logic, pendientes_obligatorios_logic
 
 
 class FakeFetch:
@@ -21,7 +21,7 @@ def test_pendientes_obligatorios_logic():
                 {"id": 1, "rut": "12.345.678-5", "nombre": "Perez Juan", "cargo": "Chofer"}
             ]),
             "FROM trabajador_documentos": pd.DataFrame([
-                {"doc_tipo": "Contrato"}
+                {"trabajador_id": 1, "doc_tipo": "Contrato"}
             ]),
         }
     )
@@ -34,6 +34,21 @@ def test_pendientes_obligatorios_logic():
     assert result == {"Perez Juan": ["Licencia"]}
 
 
+
+def test_pendientes_obligatorios_detalle_logic_keeps_rut_and_cargo():
+    fetch = FakeFetch(
+        {
+            "FROM asignaciones": pd.DataFrame([
+                {"id": 1, "rut": "12.345.678-5", "nombre": "Perez Juan", "cargo": "Chofer"}
+            ]),
+            "FROM trabajador_documentos": pd.DataFrame([
+                {"trabajador_id": 1, "doc_tipo": "Contrato"}
+            ]),
+        }
+    )
+    result = pendientes_obligatorios_detalle_logic(fetch, lambda cargo: ["Contrato", "Licencia"], 99)
+    assert result == [{"rut": "12.345.678-5", "nombre": "Perez Juan", "cargo": "Chofer", "faltantes": ["Licencia"]}]
+
 def test_pendientes_empresa_faena_logic():
     fetch = FakeFetch(
         {
@@ -44,3 +59,59 @@ def test_pendientes_empresa_faena_logic():
     )
     result = pendientes_empresa_faena_logic(fetch, lambda: ["F30", "F31"], 10)
     assert result == ["F31"]
+
+
+def test_pendientes_empresa_faena_logic_with_present_doc_types():
+    def no_query(query, params=()):
+        raise AssertionError("no debe consultar si se entrega present_doc_types")
+
+    result = pendientes_empresa_faena_logic(no_query, lambda: ["F30", "F31", "F29"], 10, present_doc_types=lambda fid: frozenset({"F29"}))
+    assert result == ["F30", "F31"]
+
+
+def test_pendientes_obligatorios_logic_multiple_workers_and_cargos():
+    fetch = FakeFetch(
+        {
+            "FROM asignaciones": pd.DataFrame([
+                {"id": 1, "rut": "1-9", "nombre": "Alfa Ana", "cargo": "Chofer"},
+                {"id": 2, "rut": "2-7", "nombre": "Beta Bo", "cargo": "Operador"},
+                {"id": 3, "rut": "3-5", "nombre": "Gama Cy", "cargo": "Chofer"},
+            ]),
+            "FROM trabajador_documentos": pd.DataFrame([
+                {"trabajador_id": 1, "doc_tipo": "Contrato"},
+                {"trabajador_id": 1, "doc_tipo": "Licencia"},
+                {"trabajador_id": 2, "doc_tipo": "IRL"},
+            ]),
+        }
+    )
+    calls = []
+
+    def rules(cargo):
+        calls.append(cargo)
+        return {"Chofer": ["Contrato", "Licencia"], "Operador": ["Contrato", "IRL"]}[cargo]
+
+    result = pendientes_obligatorios_logic(fetch, rules, 7)
+    assert result == {"Alfa Ana": [], "Beta Bo": ["Contrato"], "Gama Cy": ["Contrato", "Licencia"]}
+    assert sorted(calls) == ["Chofer", "Operador"]
+
+
+def test_faltantes_por_faena_logic():
+    fetch = FakeFetch(
+        {
+            "FROM asignaciones": pd.DataFrame([
+                {"faena_id": 10, "trabajador_id": 1, "cargo": "Chofer"},
+                {"faena_id": 10, "trabajador_id": 2, "cargo": "Operador"},
+                {"faena_id": 20, "trabajador_id": 1, "cargo": "Chofer"},
+                {"faena_id": 30, "trabajador_id": 3, "cargo": None},
+            ]),
+            "FROM trabajador_documentos": pd.DataFrame([
+                {"trabajador_id": 1, "doc_tipo": "Contrato"},
+                {"trabajador_id": 1, "doc_tipo": "Licencia"},
+                {"trabajador_id": 2, "doc_tipo": "IRL"},
+            ]),
+        }
+    )
+    rules = {"Chofer": ["Contrato", "Licencia"], "Operador": ["Contrato", "IRL"], "": ["Contrato"]}
+
+    result = faltantes_por_faena_logic(fetch, lambda cargo: rules[cargo])
+    assert result == {10: 1, 30: 1}
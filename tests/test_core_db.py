@@ -0,0 +1,58 @@
+import sqlite3
+
+import core_db
+
+
+def test_sqlite_db_signature_changes_after_write(tmp_path):
+    db = tmp_path / "app.db"
+    with sqlite3.connect(db) as c:
+        c.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+    before = core_db._sqlite_db_signature(str(db))
+    with sqlite3.connect(db) as c:
+        c.execute("INSERT INTO t(v) VALUES ('x')")
+    after = core_db._sqlite_db_signature(str(db))
+    assert before[0] is not None
+    assert before != after
+
+
+def test_sqlite_db_signature_missing_file(tmp_path):
+    assert core_db._sqlite_db_signature(str(tmp_path / "nope.db")) == (None, None)
+
+
+def test_conn_holds_sqlite_lock(tmp_path, monkeypatch):
+    import threading
+
+    monkeypatch.setattr(core_db, "DB_BACKEND", "sqlite")
+    monkeypatch.setattr(core_db, "DB_PATH", str(tmp_path / "app.db"))
+    got = []
+    with core_db.conn() as c:
+        c.execute("SELECT 1").fetchone()
+        t = threading.Thread(target=lambda: got.append(core_db._SQLITE_LOCK.acquire(blocking=False)))
+        t.start()
+        t.join()
+    assert got == [False]
+    assert core_db._SQLITE_LOCK.acquire(blocking=False)
+    core_db._SQLITE_LOCK.release()
+
+
+def test_conn_reopens_after_db_file_swap(tmp_path, monkeypatch):
+    db = tmp_path / "app.db"
+    monkeypatch.setattr(core_db, "DB_BACKEND", "sqlite")
+    monkeypatch.setattr(core_db, "DB_PATH", str(db))
+    core_db.get_sqlite_connection.clear()
+    with core_db.conn() as c:
+        c.execute("CREATE TABLE t (v TEXT)")
+        c.execute("INSERT INTO t VALUES ('old')")
+    new_db = tmp_path / "new.db"
+    with sqlite3.connect(new_db) as c:
+        c.execute("CREATE TABLE t (v TEXT)")
+        c.execute("INSERT INTO t VALUES ('new')")
+    c.close()
+    # Igual que restore_sqlite_from_zip: aparta la base, borra -wal/-shm y renombra.
+    db.rename(tmp_path / "app.db.pre_restore_backup")
+    for suffix in ("-wal", "-shm"):
+        (tmp_path / f"app.db{suffix}").unlink(missing_ok=True)
+    new_db.rename(db)
+    with core_db.conn() as c:
+        assert c.execute("SELECT v FROM t").fetchall() == [("new",)]
+    core_db.get_sqlite_connection.clear()
@@ -1,7 +1,8 @@
+import hashlib
 import io
 import zipfile
 
-from segav_core.export_utils import build_zip_from_entries
+from segav_core.export_utils import build_zip_from_entries, deflate_worthwhile, write_hashed
 
 
 FILES = {
@@ -41,3 +42,62 @@ def test_build_zip_from_entries_counts_skipped():
     assert included == 1
     assert skipped == 1
     assert "missing.pdf" in skipped_names
+
+
+def test_build_zip_from_entries_streams_local_files(tmp_path):
+    local = tmp_path / "c.pdf"
+    local.write_bytes(b"desde disco")
+
+    def never_loader(file_path, bucket, object_path):
+        raise AssertionError("local files must not be loaded into memory")
+
+    entries = [("Docs/c.pdf", str(local), None, None)]
+    payload, included, skipped, _ = build_zip_from_entries(entries, never_loader, resolve_local_path=lambda fp, b, op: fp)
+    assert (included, skipped) == (1, 0)
+    with zipfile.ZipFile(io.BytesIO(payload), "r") as zf:
+        assert zf.read("Docs/c.pdf") == b"desde disco"
+
+
+def test_build_zip_from_entries_stores_precompressed_formats():
+    files = {"a.pdf": b"%PDF" * 100, "n.txt": b"texto " * 100}
+    entries = [
+        ("Docs/a.PDF", "a.pdf", None, None),
+        ("Docs/n.txt", "n.txt", None, None),
+    ]
+    payload, included, _, _ = build_zip_from_entries(entries, lambda fp, b, o: files[fp])
+    assert included == 2
+    with zipfile.ZipFile(io.BytesIO(payload), "r") as zf:
+        assert zf.getinfo("Docs/a.PDF").compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo("Docs/n.txt").compress_type == zipfile.ZIP_DEFLATED
+        assert zf.read("Docs/a.PDF") == files["a.pdf"]
+
+
+def test_build_zip_from_entries_parallel_load_keeps_order():
+    files = {f"f{i}.txt": f"contenido {i}".encode() for i in range(20)}
+    entries = [(f"Docs/{i:02d}.txt", f"f{i}.txt", None, None) for i in range(20)]
+    entries.insert(5, ("Docs/missing.txt", "missing.txt", None, None))
+    payload, included, skipped, skipped_names = build_zip_from_entries(
+        entries, lambda fp, b, o: files[fp], load_workers=4
+    )
+    assert (included, skipped) == (20, 1)
+    assert skipped_names == ["missing.txt"]
+    with zipfile.ZipFile(io.BytesIO(payload), "r") as zf:
+        assert zf.namelist() == [f"Docs/{i:02d}.txt" for i in range(20)]
+        assert zf.read("Docs/07.txt") == b"contenido 7"
+
+
+def test_write_hashed_matches_hashlib():
+    data = bytes(range(256)) * 9000
+    out = io.BytesIO()
+    sha, size = write_hashed(data, out, chunk_size=4096)
+    assert out.getvalue() == data
+    assert size == len(data)
+    assert sha == hashlib.sha256(data).hexdigest()
+
+
+def test_deflate_worthwhile_samples_precompressed_formats():
+    random_like = b"".join(hashlib.sha256(i.to_bytes(4, "big")).digest() for i in range(4000))
+    assert deflate_worthwhile("informe.txt", random_like)
+    assert not deflate_worthwhile("foto.JPG", random_like)
+    assert deflate_worthwhile("escaneo.pdf", b"%PDF-1.4 " + b"0 0 0 RG\n" * 20000)
+    assert not deflate_worthwhile("vacio.pdf", b"")
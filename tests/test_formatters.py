@@ -0,0 +1,28 @@
+from datetime import datetime
+
+import pandas as pd
+
+from segav_core.formatters import norm_col, safe_name, to_text_date
+
+
+def test_safe_name_slugifies_and_defaults():
+    assert safe_name("  Faena Río-Bueno 2026 ") == "faena_r_o_bueno_2026"
+    assert safe_name("") == "item"
+    assert safe_name("***") == "item"
+
+
+def test_norm_col_strips_accents():
+    assert norm_col("Fecha Contratación") == "fecha_contratacion"
+    assert norm_col(" AÑO / Mes ") == "ano_mes"
+    assert norm_col(None) == ""
+
+
+def test_to_text_date_handles_dates_text_and_blanks():
+    assert to_text_date(datetime(2026, 3, 1, 8, 30)) == "2026-03-01"
+    assert to_text_date("01-03-2026") == "01-03-2026"
+    assert to_text_date(1) == "1"
+    assert to_text_date(1.0) == "1.0"
+    assert to_text_date(None) is None
+    assert to_text_date(float("nan")) is None
+    assert to_text_date(pd.NA) is None
+    assert to_text_date(pd.NaT) is None
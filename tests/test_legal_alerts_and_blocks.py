@@ -1,6 +1,6 @@
 import pandas as pd
 
-from segav_core.ops_compliance import legal_docs_status_summary
+from segav_core.ops_compliance import _risk_semaforo, legal_docs_status_summary
 from segav_core.ops_exports import _legal_export_blockers
 
 
@@ -36,3 +36,15 @@ def test_export_blockers_for_expired_critical_docs():
     blockers, warnings = _legal_export_blockers(fake_fetch_df, 55)
     assert len(blockers) == 1
     assert len(warnings) >= 1
+
+
+def test_risk_semaforo_matches_row_rules():
+    df = pd.DataFrame(
+        {
+            "faltantes_empresa_mes": [1, 0, 0, 0, 0, 0, None],
+            "faltantes_trabajador": [0, 3, 0, 1, 0, 0, None],
+            "cobertura_docs_pct": [100.0, 100.0, 50.0, 100.0, 90.0, 100.0, None],
+            "trabajadores_activos": [2, 2, 2, 2, 2, 2, 0],
+        }
+    )
+    assert _risk_semaforo(df).tolist() == ["CRITICO", "CRITICO", "CRITICO", "PENDIENTE", "PENDIENTE", "OK", "OK"]
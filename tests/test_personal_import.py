@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from segav_core.formatters import split_nombre_completo
+from segav_core.rut_utils import clean_rut
+from segav_core.ops_personal import _dedupe_import_rows, _normalize_trabajadores_import
+
+
+def test_normalize_trabajadores_import_matches_row_rules():
+    df = pd.DataFrame(
+        {
+            "rut": ["12345678-5", None, "11.111.111-1", "7-1", "9-K"],
+            "nombre": ["Juan Carlos  Perez Soto", "Sin Rut", "Ana", "Luis Gómez", None],
+            "cargo": ["Operador", np.nan, "  Supervisor ", "", "X"],
+            "fecha_de_contrato": [pd.Timestamp("2026-03-30"), None, "2026-01-01", None, None],
+        }
+    )
+    rows, skipped = _normalize_trabajadores_import(df, clean_rut)
+    assert skipped == 2
+    assert [r[0] for r in rows] == ["12.345.678-5", "11.111.111-1", "7-1"]
+    for r, nombre in zip(rows, ["Juan Carlos  Perez Soto", "Ana", "Luis Gómez"]):
+        assert (r[1], r[2]) == split_nombre_completo(nombre)
+    assert [r[3] for r in rows] == ["Operador", "Supervisor", ""]
+    assert [r[6] for r in rows] == ["2026-03-30", "2026-01-01", None]
+    assert all(r[7] is None for r in rows)
+
+
+def test_dedupe_import_rows_keeps_last_or_first_per_rut():
+    rows = [("1-9", "A"), ("2-7", "B"), ("1-9", "C")]
+    assert _dedupe_import_rows(rows) == ([("1-9", "C"), ("2-7", "B")], 1)
+    assert _dedupe_import_rows(rows, keep_last=False) == ([("1-9", "A"), ("2-7", "B")], 1)
+
+
+def test_normalize_trabajadores_import_uses_injected_clean_rut():
+    df = pd.DataFrame({"rut": ["12345678-k", "012.345.678-5"], "nombre": ["Ana Soto", "Luis Rojas"]})
+    rows, skipped = _normalize_trabajadores_import(df, clean_rut)
+    assert skipped == 0
+    assert [r[0] for r in rows] == [clean_rut("12345678-k"), clean_rut("012.345.678-5")]
+    assert rows[0][0].endswith("-k")
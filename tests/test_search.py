@@ -0,0 +1,11 @@
+import pandas as pd
+
+from segav_core.search import text_search_mask
+
+
+def test_text_search_mask_matches_any_column_literally():
+    df = pd.DataFrame({"rut": ["1-9", "2-7"], "cargo": ["Operador (A)", None]})
+    assert text_search_mask(df, "(a)", ["rut", "cargo"]).tolist() == [True, False]
+    assert text_search_mask(df, " 2-", ["rut", "cargo"]).tolist() == [False, True]
+    empty = df.iloc[:0]
+    assert empty[text_search_mask(empty, "x", ["rut"])].columns.tolist() == ["rut", "cargo"]
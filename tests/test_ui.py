@@ -0,0 +1,17 @@
+import pandas as pd
+
+from segav_core.ui import faena_select_options
+
+
+def test_faena_select_options_labels_and_default_index():
+    faenas = pd.DataFrame(
+        {"id": [7, 3], "mandante": ["Arauco", "CMPC"], "nombre": ["Bellavista", "Las Lomas"], "estado": ["ACTIVA", "TERMINADA"]}
+    )
+    opts, idx, labels = faena_select_options(faenas, 3)
+    assert opts == [7, 3]
+    assert idx == 1
+    assert labels[7] == "7 - Arauco / Bellavista (ACTIVA)"
+
+    _, idx_missing, short = faena_select_options(faenas, 99, with_estado=False)
+    assert idx_missing == 0
+    assert short[3] == "3 - CMPC / Las Lomas"